@@ -0,0 +1,189 @@
+"""
+Account state cache
+
+Keeps the latest account values and portfolio positions pushed by the account
+update subscriptions (reqAccountUpdates / reqAccountSummary), so reads such as
+the available funds are dictionary lookups instead of a new request followed by
+a linear scan of the whole summary.
+
+Values are indexed by (account, tag) and then currency, positions by
+(account, conId) and by account. updatedAt is the local time of the last update
+and age() tells how stale the cache is.
+
+Updates arrive on the API reader thread (IbkrApi) or the event loop
+(IbInsyncApi) and only take a short lock, nothing is printed. Observers get
+immutable snapshots, the changes between two snapshots via diff(), or an
+optional log callback per update.
+"""
+
+from collections import namedtuple
+import threading
+import time as systime
+
+AccountValue = namedtuple("AccountValue", ["account", "tag", "value", "currency", "modelCode"])
+Position = namedtuple("Position", ["account", "conId", "contract", "position", "marketPrice", "marketValue",
+                                   "averageCost", "unrealizedPNL", "realizedPNL"])
+AccountSnapshot = namedtuple("AccountSnapshot", ["values", "positions", "updatedAt"])
+
+# Preferred currency of a tag reported in several currencies
+BASE_CURRENCY = "BASE"
+
+
+class AccountStore:
+    """
+    Args:
+        clock: callable returning the current time in seconds, for updatedAt
+        log:   optional callable(event, payload) called after each update, event is
+               "value", "position", "accountTime" or "downloadEnd"
+    """
+
+    def __init__(self, clock=systime.time, log=None):
+        self.clock = clock
+        self.log = log
+        self.lock = threading.RLock()
+        self.values = {}            # (account, tag) -> {currency: AccountValue}
+        self.positions = {}         # (account, conId) -> Position
+        self.accountPositions = {}  # account -> {conId: Position}
+        self.defaultAccount = None
+        self.updatedAt = None
+        self.accountTime = None     # last updateAccountTime() stamp, "HH:MM"
+        self.downloaded = set()     # accounts whose initial download completed
+
+    def _touch(self, account) -> None:
+        if self.defaultAccount is None and account:
+            self.defaultAccount = account
+        self.updatedAt = self.clock()
+
+    def updateValue(self, account, tag, value, currency="", modelCode="") -> None:
+        """
+        Account value or account summary update.
+        """
+        accountValue = AccountValue(account, tag, value, currency, modelCode)
+        with self.lock:
+            self.values.setdefault((account, tag), {})[currency] = accountValue
+            self._touch(account)
+        if self.log is not None:
+            self.log("value", accountValue)
+
+    def updatePosition(self, account, contract, position, marketPrice, marketValue, averageCost,
+                       unrealizedPNL, realizedPNL) -> None:
+        """
+        Portfolio update, a zero position removes the entry.
+        """
+        item = Position(account, contract.conId, contract, position, marketPrice, marketValue,
+                        averageCost, unrealizedPNL, realizedPNL)
+        with self.lock:
+            key = (account, contract.conId)
+            if position:
+                self.positions[key] = item
+                self.accountPositions.setdefault(account, {})[contract.conId] = item
+            else:
+                self.positions.pop(key, None)
+                self.accountPositions.get(account, {}).pop(contract.conId, None)
+            self._touch(account)
+        if self.log is not None:
+            self.log("position", item)
+
+    def updateAccountTime(self, timeStamp: str) -> None:
+        with self.lock:
+            self.accountTime = timeStamp
+            self.updatedAt = self.clock()
+        if self.log is not None:
+            self.log("accountTime", timeStamp)
+
+    def downloadEnd(self, account) -> None:
+        """
+        Initial account download finished, the cache now holds the full account.
+        """
+        with self.lock:
+            self.downloaded.add(account)
+            self._touch(account)
+        if self.log is not None:
+            self.log("downloadEnd", account)
+
+    def get(self, tag, currency=None, account=None):
+        """
+        Latest AccountValue of tag, or None.
+        Without currency the BASE value is preferred, then the first one reported.
+        """
+        byCurrency = self.values.get((account or self.defaultAccount, tag))
+        if not byCurrency:
+            return None
+        if currency is not None:
+            return byCurrency.get(currency)
+        return byCurrency.get(BASE_CURRENCY) or next(iter(byCurrency.values()))
+
+    def value(self, tag, currency=None, account=None):
+        """
+        Latest value of tag as a float (the raw string if not numeric), or None.
+        """
+        accountValue = self.get(tag, currency, account)
+        if accountValue is None:
+            return None
+        try:
+            return float(accountValue.value)
+        except ValueError:
+            return accountValue.value
+
+    def rows(self) -> list:
+        """
+        All account values as AccountValue tuples.
+        """
+        with self.lock:
+            return [accountValue for byCurrency in self.values.values() for accountValue in byCurrency.values()]
+
+    def accounts(self) -> list:
+        with self.lock:
+            return sorted({account for account, _ in self.values} | set(self.accountPositions))
+
+    def position(self, conId, account=None):
+        """
+        Position of conId in account (default account if omitted), or None.
+        """
+        return self.positions.get((account or self.defaultAccount, conId))
+
+    def positionsOf(self, account=None) -> dict:
+        """
+        {conId: Position} of account (default account if omitted).
+        """
+        with self.lock:
+            return dict(self.accountPositions.get(account or self.defaultAccount, {}))
+
+    def snapshot(self) -> AccountSnapshot:
+        """
+        Consistent copy of the whole cache: values keyed (account, tag, currency),
+        positions keyed (account, conId).
+        """
+        with self.lock:
+            values = {(account, tag, currency): accountValue
+                      for (account, tag), byCurrency in self.values.items()
+                      for currency, accountValue in byCurrency.items()}
+            return AccountSnapshot(values, dict(self.positions), self.updatedAt)
+
+    def diff(self, old: AccountSnapshot, new: AccountSnapshot = None) -> dict:
+        """
+        Changes from snapshot old to new (default the current state):
+        {"values": {key: (before, after)}, "positions": {key: (before, after)}},
+        with None for entries that were added or removed.
+        """
+        new = self.snapshot() if new is None else new
+        return {"values": _diff(old.values, new.values), "positions": _diff(old.positions, new.positions)}
+
+    def age(self):
+        """
+        Seconds since the last update, or None if nothing was received yet.
+        """
+        return None if self.updatedAt is None else self.clock() - self.updatedAt
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def _comparable(item):
+    # Contract objects compare by identity, a position is unchanged if its numbers are
+    return item._replace(contract=None) if isinstance(item, Position) else item
+
+
+def _diff(old: dict, new: dict) -> dict:
+    return {key: (old.get(key), new.get(key))
+            for key in old.keys() | new.keys() if _comparable(old.get(key)) != _comparable(new.get(key))}
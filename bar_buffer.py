@@ -0,0 +1,189 @@
+"""
+Columnar bar buffer
+
+Growable, array-backed OHLCV container filled in place by the historical data
+callbacks. Bar times are int64 seconds of the wall clock the bar was reported
+in (the TWS / exchange time zone for formatDate=1), OHLCV are float64.
+"""
+
+from functools import lru_cache
+import datetime
+
+import numpy as np
+import pandas as pd
+
+BAR_COLUMNS = ("open", "high", "low", "close", "volume")
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_DATE = _EPOCH.date()
+
+
+@lru_cache(maxsize=8192)
+def _daySeconds(yyyymmdd: str) -> int:
+    day = datetime.date(int(yyyymmdd[0:4]), int(yyyymmdd[4:6]), int(yyyymmdd[6:8]))
+    return (day - _EPOCH_DATE).days * 86400
+
+
+def parseBarDate(date) -> int:
+    """
+    Convert a bar date to int64 wall-clock seconds.
+
+    Accepts IB strings "20240102", "20240102 09:30:00", "20240102  09:30:00",
+    "20240102 09:30:00 US/Eastern", epoch strings from formatDate=2, and
+    date / datetime objects as returned by ib_insync (the tz is dropped,
+    keeping the wall clock it was reported in).
+    """
+    if isinstance(date, str):
+        if len(date) == 8:
+            return _daySeconds(date)
+        if date.isdigit():
+            return int(date)
+        clock = date[8:].split()[0]
+        return _daySeconds(date[:8]) + int(clock[0:2]) * 3600 + int(clock[3:5]) * 60 + int(clock[6:8])
+    if isinstance(date, datetime.datetime):
+        return int((date.replace(tzinfo=None) - _EPOCH).total_seconds())
+    if isinstance(date, datetime.date):
+        return (date - _EPOCH_DATE).days * 86400
+    return int(date)
+
+
+def formatBarDate(time: int) -> str:
+    """
+    IB style "%Y%m%d %H:%M:%S" string of int64 wall-clock seconds
+    """
+    return (_EPOCH + datetime.timedelta(seconds=int(time))).strftime("%Y%m%d %H:%M:%S")
+
+
+class BarBuffer:
+    """
+    Growable columnar bar container.
+
+    Appends write into preallocated arrays (amortised O(1), doubling on growth),
+    so no per-bar Python object is kept. Set keepDates to also keep the raw
+    date values for the list-of-dicts output of to_records().
+    """
+
+    def __init__(self, capacity: int = 1024, keepDates: bool = False):
+        capacity = max(1, capacity)
+        self.size = 0
+        self._time = np.empty(capacity, dtype=np.int64)
+        # One row per column so that each column view is contiguous
+        self._values = np.empty((len(BAR_COLUMNS), capacity), dtype=np.float64)
+        self.dates = [] if keepDates else None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __repr__(self) -> str:
+        if not self.size:
+            return "BarBuffer(0 bars)"
+        first, last = self._time[0], self._time[self.size - 1]
+        return f"BarBuffer({self.size} bars, {_EPOCH + datetime.timedelta(seconds=int(first))} .. " \
+               f"{_EPOCH + datetime.timedelta(seconds=int(last))})"
+
+    @property
+    def capacity(self) -> int:
+        return self._time.shape[0]
+
+    def _reserve(self, needed: int) -> None:
+        capacity = self.capacity
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        time = np.empty(capacity, dtype=np.int64)
+        values = np.empty((len(BAR_COLUMNS), capacity), dtype=np.float64)
+        time[:self.size] = self._time[:self.size]
+        values[:, :self.size] = self._values[:, :self.size]
+        self._time, self._values = time, values
+
+    def append(self, time: int, open: float, high: float, low: float, close: float, volume: float,
+               date=None) -> None:
+        """
+        Append one bar, time in int64 seconds.
+        """
+        if self.size == self.capacity:
+            self._reserve(self.size + 1)
+        self._time[self.size] = time
+        self._values[:, self.size] = (open, high, low, close, volume)
+        if self.dates is not None:
+            self.dates.append(date)
+        self.size += 1
+
+    def append_bar(self, bar) -> None:
+        """
+        Append an ibapi BarData / ib_insync BarData like object.
+        """
+        self.append(parseBarDate(bar.date), bar.open, bar.high, bar.low, bar.close, bar.volume, bar.date)
+
+    def extend(self, time, open, high, low, close, volume, dates=None) -> None:
+        """
+        Append many bars at once from array-likes of equal length. With keepDates
+        the raw dates are taken from dates, or formatted from time as in to_records().
+        """
+        time = np.asarray(time, dtype=np.int64)
+        count = time.shape[0]
+        self._reserve(self.size + count)
+        end = self.size + count
+        self._time[self.size:end] = time
+        for row, column in enumerate((open, high, low, close, volume)):
+            self._values[row, self.size:end] = column
+        if self.dates is not None:
+            self.dates.extend(dates if dates is not None else (formatBarDate(t) for t in time.tolist()))
+        self.size = end
+
+    def truncate(self, size: int) -> None:
+        """
+        Drop the bars from index size on, keeping the capacity.
+        """
+        self.size = max(0, min(size, self.size))
+        if self.dates is not None:
+            del self.dates[self.size:]
+
+    @classmethod
+    def from_bars(cls, bars, keepDates: bool = False) -> "BarBuffer":
+        """
+        Build a buffer from an iterable of BarData (e.g. an ib_insync BarDataList).
+        """
+        bars = list(bars)
+        buffer = cls(len(bars), keepDates=keepDates)
+        for bar in bars:
+            buffer.append_bar(bar)
+        return buffer
+
+    @property
+    def time(self) -> np.ndarray:
+        """Zero-copy int64 view of the bar times."""
+        return self._time[:self.size]
+
+    def column(self, name: str) -> np.ndarray:
+        """Zero-copy float64 view of one OHLCV column."""
+        return self._values[BAR_COLUMNS.index(name), :self.size]
+
+    def view(self) -> dict:
+        """Zero-copy NumPy views of every column, keyed by name."""
+        views = {"time": self.time}
+        for row, name in enumerate(BAR_COLUMNS):
+            views[name] = self._values[row, :self.size]
+        return views
+
+    def to_pandas(self) -> pd.DataFrame:
+        """
+        DataFrame with a datetime64 "date" column followed by OHLCV, the same
+        layout as ib_insync util.df(). OHLCV is handed over as one float block.
+        """
+        frame = pd.DataFrame(self._values[:, :self.size].T, columns=list(BAR_COLUMNS), copy=False)
+        frame.insert(0, "date", self.time.astype("datetime64[s]"))
+        return frame
+
+    def to_records(self) -> list:
+        """
+        Opt-in list of {"date", "open", "high", "low", "close", "volume"} dicts.
+        Dates are the raw values when kept, otherwise formatted "%Y%m%d %H:%M:%S".
+        """
+        dates = self.dates
+        if dates is None:
+            dates = [formatBarDate(t) for t in self.time.tolist()]
+        values = self._values[:, :self.size].T.tolist()
+        return [{"date": date, "open": o, "high": h, "low": l, "close": c, "volume": v}
+                for date, (o, h, l, c, v) in zip(dates, values)]
@@ -0,0 +1,112 @@
+"""
+Local bar resampling
+
+Every IBKR_PERIOD_MAPPING period costs its own reqHistoricalData call and
+pacing quota. BarResampler fetches nothing itself: it takes the bars of the
+finest period once and derives the coarser periods with vectorized OHLCV
+reductions (np.*.reduceat over bucket boundaries).
+
+Buckets follow IB's bar boundaries: intraday buckets are aligned to the wall
+clock from midnight and never span two session days, the first bucket of a
+day starts at the session open (09:30 for a 1 hour RTH bar, as IB labels it),
+daily bars are labelled with the day. The session open is the first bar of the
+day unless sessionStart (seconds after midnight) is given.
+
+Bar times follow the BarBuffer convention: int64 wall-clock seconds in the
+exchange time zone. Sessions crossing midnight (futures) are split at midnight.
+"""
+
+import numpy as np
+
+from bar_buffer import BarBuffer
+
+DAY_SECONDS = 86400
+
+
+def bucketLabels(times: np.ndarray, period: int, sessionStart: int = None) -> np.ndarray:
+    """
+    Start time of the period bucket of every bar time.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    days = times - times % DAY_SECONDS
+    if period >= DAY_SECONDS:
+        return days
+    buckets = days + (times - days) // period * period
+    if sessionStart is None:
+        first = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        opens = np.repeat(times[first], np.diff(np.r_[first, times.size]))
+    else:
+        opens = days + sessionStart
+    return np.where((buckets < opens) & (opens <= times), opens, buckets)
+
+
+def aggregateBars(view: dict, labels: np.ndarray) -> BarBuffer:
+    """
+    OHLCV of consecutive bars sharing a label, view as from BarBuffer.view().
+    A bucket holding a bar without volume (-1, e.g. BID bars) reports -1.
+    """
+    buffer = BarBuffer(max(1, labels.size))
+    if not labels.size:
+        return buffer
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    ends = np.r_[starts[1:], labels.size] - 1
+    volume = view["volume"]
+    volumes = np.where(np.minimum.reduceat(volume, starts) < 0, -1.0, np.add.reduceat(volume, starts))
+    buffer.extend(labels[starts], view["open"][starts], np.maximum.reduceat(view["high"], starts),
+                  np.minimum.reduceat(view["low"], starts), view["close"][ends], volumes)
+    return buffer
+
+
+def resampleBars(bars: BarBuffer, period: int, sessionStart: int = None) -> BarBuffer:
+    """
+    One-shot resample of bars into period seconds.
+    """
+    view = bars.view()
+    return aggregateBars(view, bucketLabels(view["time"], period, sessionStart))
+
+
+class BarResampler:
+    """
+    Incrementally maintained bars of several periods derived from one source period.
+    Args:
+        periods:       {name: seconds}, each a multiple of sourcePeriod
+        sourcePeriod:  seconds of the fetched bars
+        sessionStart:  seconds after midnight of the session open, default the first bar of each day
+
+    update() appends source bars; bars at or after the first new time replace the
+    stored ones (a revised forming bar), and only the affected day is recomputed.
+    """
+
+    def __init__(self, periods: dict, sourcePeriod: int, sessionStart: int = None):
+        for name, seconds in periods.items():
+            if seconds < sourcePeriod or seconds % sourcePeriod:
+                raise ValueError(f"period {name} ({seconds}s) is not a multiple of the {sourcePeriod}s source bars")
+        self.periods = dict(periods)
+        self.sourcePeriod = sourcePeriod
+        self.sessionStart = sessionStart
+        self.source = BarBuffer()
+        self.bars = {name: BarBuffer() for name in self.periods}
+
+    def __getitem__(self, name) -> BarBuffer:
+        return self.bars[name]
+
+    def update(self, bars) -> None:
+        """
+        Add source bars: a BarBuffer or BarData objects (ibapi, ib_insync BarDataList).
+        """
+        if not isinstance(bars, BarBuffer):
+            bars = BarBuffer.from_bars(bars)
+        if not len(bars):
+            return
+        first = int(bars.time[0])
+        self.source.truncate(int(np.searchsorted(self.source.time, first)))
+        self.source.extend(*bars.view().values())
+
+        dayStart = first - first % DAY_SECONDS
+        offset = int(np.searchsorted(self.source.time, dayStart))
+        tail = {name: column[offset:] for name, column in self.source.view().items()}
+        for name, period in self.periods.items():
+            derived = aggregateBars(tail, bucketLabels(tail["time"], period, self.sessionStart))
+            out = self.bars[name]
+            out.truncate(int(np.searchsorted(out.time, dayStart)))
+            out.extend(*derived.view().values())
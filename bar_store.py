@@ -0,0 +1,223 @@
+"""
+Local persistent bar store
+
+On-disk columnar store of OHLCV bars keyed by (source, symbol, bar size), so
+the wrappers only download the ranges that are not already on disk.
+
+Layout: <root>/<source>/<symbol>/<barSize>/
+    bars.npy       structured array (time int64, open..volume float64) sorted by
+                   time, memory-mapped on read
+    coverage.json  [[start, end], ...] inclusive time ranges known to be complete
+
+Both files are replaced atomically (write to a temp file, then os.replace), so
+readers never observe a partially written store.
+"""
+
+import json
+import math
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from bar_buffer import BAR_COLUMNS, BarBuffer
+
+BAR_DTYPE = np.dtype([("time", "<i8")] + [(name, "<f8") for name in BAR_COLUMNS])
+
+# Seconds of each IB duration unit ("N S", "N D", "N W", "N M", "N Y")
+IB_DURATION_UNITS = {"S": 1, "D": 86400, "W": 7 * 86400, "M": 31 * 86400, "Y": 366 * 86400}
+
+# Seconds of each IB bar size unit ("5 mins", "1 hour", "1 day", ...)
+IB_BAR_SIZE_UNITS = {"sec": 1, "secs": 1, "min": 60, "mins": 60, "hour": 3600, "hours": 3600,
+                     "day": 86400, "week": 7 * 86400, "month": 31 * 86400}
+
+
+def durationSeconds(duration: str) -> int:
+    """
+    Upper bound in seconds of an IB duration string, e.g. "2 W" -> 1209600.
+    """
+    count, unit = duration.split()
+    return int(count) * IB_DURATION_UNITS[unit.upper()]
+
+
+def durationString(seconds: float) -> str:
+    """
+    Shortest IB duration string covering at least the given number of seconds.
+    """
+    seconds = max(1, math.ceil(seconds))
+    if seconds <= 86400:
+        return f"{seconds} S"
+    days = math.ceil(seconds / 86400)
+    if days <= 365:
+        return f"{days} D"
+    return f"{math.ceil(days / 365)} Y"
+
+
+def barSizeSeconds(barSize: str) -> int:
+    """
+    Length in seconds of an IB bar size setting, e.g. "5 mins" -> 300.
+    """
+    count, unit = barSize.split()
+    return int(count) * IB_BAR_SIZE_UNITS[unit]
+
+
+def contractSymbol(contract) -> str:
+    """
+    Store symbol of an IB contract, stable whether or not its conId is resolved.
+    """
+    parts = [contract.symbol, contract.secType, contract.exchange, contract.currency]
+    expiry = getattr(contract, "lastTradeDateOrContractMonth", "")
+    if expiry:
+        parts.append(expiry)
+    return "-".join(str(part) for part in parts)
+
+
+def _mergeRanges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _safeName(name) -> str:
+    return "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in str(name))
+
+
+class BarStore:
+    """
+    Columnar bar store rooted at a directory.
+    Times follow the BarBuffer convention: int64 seconds, inclusive ranges.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.lock = threading.Lock()
+
+    def _dir(self, source, symbol, barSize) -> str:
+        return os.path.join(self.root, _safeName(source), _safeName(symbol), _safeName(barSize))
+
+    def _load(self, directory, mmap=True) -> np.ndarray:
+        path = os.path.join(directory, "bars.npy")
+        if not os.path.exists(path):
+            return np.empty(0, dtype=BAR_DTYPE)
+        return np.load(path, mmap_mode="r" if mmap else None)
+
+    def _replace(self, directory, name, write) -> None:
+        fd, tmpPath = tempfile.mkstemp(dir=directory, prefix=f".{name}.")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                write(handle)
+            os.replace(tmpPath, os.path.join(directory, name))
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
+
+    def coverage(self, source, symbol, barSize) -> list:
+        """
+        Inclusive [start, end] ranges known to be complete on disk.
+        """
+        path = os.path.join(self._dir(source, symbol, barSize), "coverage.json")
+        if not os.path.exists(path):
+            return []
+        with open(path) as handle:
+            return [tuple(span) for span in json.load(handle)]
+
+    def missing(self, source, symbol, barSize, start: int, end: int) -> list:
+        """
+        Sub-ranges of [start, end] that are not covered yet, in time order.
+        """
+        gaps = []
+        cursor = start
+        for coveredStart, coveredEnd in self.coverage(source, symbol, barSize):
+            if coveredEnd < cursor:
+                continue
+            if coveredStart > end:
+                break
+            if coveredStart > cursor:
+                gaps.append((cursor, coveredStart - 1))
+            cursor = max(cursor, coveredEnd + 1)
+        if cursor <= end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def window(self, source, symbol, barSize, start=None, end=None) -> np.ndarray:
+        """
+        Zero-copy BAR_DTYPE view of the bars with start <= time <= end in the memory-mapped file.
+        """
+        bars = self._load(self._dir(source, symbol, barSize))
+        times = bars["time"]
+        first = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+        last = len(bars) if end is None else int(np.searchsorted(times, end, side="right"))
+        return bars[first:last]
+
+    def read(self, source, symbol, barSize, start=None, end=None) -> BarBuffer:
+        """
+        Bars with start <= time <= end from the memory-mapped file.
+        """
+        window = self.window(source, symbol, barSize, start, end)
+        buffer = BarBuffer(len(window))
+        buffer.extend(window["time"], *(window[name] for name in BAR_COLUMNS))
+        return buffer
+
+    def write(self, source, symbol, barSize, bars: BarBuffer, covered=None) -> None:
+        """
+        Merge bars into the store (new bars replace stored bars with the same time)
+        and optionally record the inclusive covered=(start, end) range as complete.
+        """
+        directory = self._dir(source, symbol, barSize)
+        with self.lock:
+            os.makedirs(directory, exist_ok=True)
+            if len(bars):
+                incoming = np.empty(len(bars), dtype=BAR_DTYPE)
+                for name, column in bars.view().items():
+                    incoming[name] = column
+                stored = self._load(directory, mmap=False)
+                merged = np.concatenate([incoming, stored])
+                # np.unique keeps the first occurrence, i.e. the incoming bar
+                _, keep = np.unique(merged["time"], return_index=True)
+                merged = merged[keep]
+                self._replace(directory, "bars.npy", lambda handle: np.save(handle, merged))
+
+            if covered is not None and covered[0] <= covered[1]:
+                ranges = _mergeRanges(list(self.coverage(source, symbol, barSize)) + [tuple(covered)])
+                self._replace(directory, "coverage.json",
+                              lambda handle: handle.write(json.dumps(ranges).encode()))
+
+    def fill(self, source, symbol, barSize, start: int, end: int, fetch, completeUntil=None,
+             mergeGaps=False) -> BarBuffer:
+        """
+        Fetch only the missing parts of [start, end], store them and serve the
+        whole window from disk.
+        Args:
+            fetch:         callable(gapStart, gapEnd) -> BarBuffer
+            completeUntil: last bar time known to be final; later bars are stored
+                           but fetched again next time. Default to end
+            mergeGaps:     fetch one span from the first gap to end, for sources
+                           that can only download up to "now"
+        """
+        completeUntil = end if completeUntil is None else completeUntil
+        gaps = self.missing(source, symbol, barSize, start, end)
+        if mergeGaps and gaps:
+            gaps = [(gaps[0][0], end)]
+        for gapStart, gapEnd in gaps:
+            bars = fetch(gapStart, gapEnd)
+            self.write(source, symbol, barSize, bars, covered=(gapStart, min(gapEnd, completeUntil)))
+        return self.read(source, symbol, barSize, start, end)
+
+    async def fillAsync(self, source, symbol, barSize, start: int, end: int, fetch, completeUntil=None,
+                        mergeGaps=False) -> BarBuffer:
+        """
+        Coroutine variant of fill(), fetch is a coroutine function(gapStart, gapEnd) -> BarBuffer.
+        """
+        completeUntil = end if completeUntil is None else completeUntil
+        gaps = self.missing(source, symbol, barSize, start, end)
+        if mergeGaps and gaps:
+            gaps = [(gaps[0][0], end)]
+        for gapStart, gapEnd in gaps:
+            bars = await fetch(gapStart, gapEnd)
+            self.write(source, symbol, barSize, bars, covered=(gapStart, min(gapEnd, completeUntil)))
+        return self.read(source, symbol, barSize, start, end)
@@ -0,0 +1,122 @@
+"""
+IB wrapper benchmarks
+
+Runs IbkrApi and IbInsyncApi end to end against the fake TWS (no gateway
+needed) and reports latency percentiles and throughput of:
+  - get_historical_data / getHistoricalData         (one request per call)
+  - isRegTradingHour                                (cached calendar)
+  - getCashVal                                      (account summary / account cache)
+  - get_historical_data_many / getHistoricalDataMany (bulk jobs)
+  - place_brackets                                  (submission to acknowledgement)
+
+Pacing is disabled so the numbers measure the wrappers, not IB's limits.
+Results are written to benchmarks/results/ib-<commit>.json; pass --compare
+<commit> to print the change against an earlier run.
+
+    python benchmarks/bench_ib.py --bars 500 --latency 0.005 --compare 1a2b3c4
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_tws import FakeTws
+from benchmarks.harness import load_results, measure, report, save_results, summarize
+from ib_insync_if import IbInsyncApi
+from ib_pacing import PacingGovernor
+from ibkr_api import IbkrApi
+from order_engine import Bracket
+
+SYMBOLS = ["AAPL", "MSFT", "AMZN", "GOOG", "META", "NVDA", "TSLA", "AMD", "INTC", "NFLX"]
+
+
+def unpaced() -> PacingGovernor:
+    return PacingGovernor(maxRequests=10 ** 9, identicalInterval=0, contractMaxRequests=10 ** 9)
+
+
+def bench_ibkr(tws: FakeTws, args) -> dict:
+    api = IbkrApi("127.0.0.1", tws.port, clientId=1, timeout=30, pacing=unpaced())
+    api.connect()
+    reader = threading.Thread(target=api.run, daemon=True)
+    reader.start()
+    results = {}
+    try:
+        contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+        results["ibkr.get_historical_data"] = measure(
+            lambda: api.get_historical_data(contract, "5m", "1 D"), args.repeat)
+        results["ibkr.isRegTradingHour"] = measure(lambda: api.isRegTradingHour(contract), args.repeat * 10)
+        results["ibkr.getCashVal"] = measure(lambda: api.getCashVal("AvailableFunds"), args.repeat)
+
+        jobs = [(api.create_contract(SYMBOLS[index % len(SYMBOLS)], "STK", "SMART", "USD"), "5m", f"{index + 1} D")
+                for index in range(args.jobs)]
+        start = time.perf_counter()
+        bars = sum(len(result) for _, result, error in api.get_historical_data_many(jobs, max_in_flight=args.in_flight)
+                   if error is None)
+        elapsed = time.perf_counter() - start
+        results["ibkr.get_historical_data_many"] = summarize(
+            [elapsed / len(jobs)] * len(jobs), elapsed, bars_per_s=bars / elapsed)
+
+        brackets = [Bracket(contract, "BUY", 1, 100.0, 101.0, 99.0)] * args.brackets
+        start = time.perf_counter()
+        orders = api.place_brackets(brackets)
+        api.wait_order_acks([order.orderId for bracket in orders for order in bracket], timeout=30)
+        elapsed = time.perf_counter() - start
+        results["ibkr.place_brackets"] = summarize(list(api.orderEngine.latencies().values()), elapsed)
+    finally:
+        api.disconnect()
+    return results
+
+
+def bench_ib_insync(tws: FakeTws, args) -> dict:
+    api = IbInsyncApi("127.0.0.1", tws.port, clientId=2, pacing=unpaced())
+    api.connect()
+    results = {}
+    try:
+        contract = api.createContract("AAPL", "STK", "SMART", "USD")
+        results["insync.getHistoricalData"] = measure(
+            lambda: api.getHistoricalData("5m", "1 D", contract), args.repeat)
+        results["insync.isRegTradingHour"] = measure(lambda: api.isRegTradingHour(contract), args.repeat * 10)
+        results["insync.getCashVal"] = measure(api.getCashVal, args.repeat * 10)
+
+        contracts = [api.createContract(f"S{index}", "STK", "SMART", "USD") for index in range(args.jobs)]
+        start = time.perf_counter()
+        frames = api.getHistoricalDataMany(contracts, "5m", "1 D", maxConcurrency=args.in_flight)
+        elapsed = time.perf_counter() - start
+        bars = sum(len(frame) for frame in frames.values())
+        results["insync.getHistoricalDataMany"] = summarize(
+            [elapsed / len(contracts)] * len(contracts), elapsed, bars_per_s=bars / elapsed)
+    finally:
+        api.disconnect()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bars", type=int, default=500, help="bars per historical response")
+    parser.add_argument("--latency", type=float, default=0.0, help="historical response latency in seconds")
+    parser.add_argument("--repeat", type=int, default=50, help="calls per latency benchmark")
+    parser.add_argument("--jobs", type=int, default=100, help="jobs in the bulk benchmarks")
+    parser.add_argument("--in-flight", type=int, default=20, help="concurrent bulk requests")
+    parser.add_argument("--brackets", type=int, default=100, help="brackets placed in one batch")
+    parser.add_argument("--compare", help="commit of an earlier run to compare against")
+    parser.add_argument("--no-save", action="store_true", help="do not write the results file")
+    args = parser.parse_args(argv)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "no_save")}
+    with FakeTws(bars=args.bars, latency=args.latency) as tws:
+        results = bench_ibkr(tws, args)
+        results.update(bench_ib_insync(tws, args))
+
+    baseline = load_results("ib", args.compare) if args.compare else None
+    print(report(results, baseline))
+    if not args.no_save:
+        print("saved", save_results("ib", results, config))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Polygon client throughput benchmarks.
+
+Runs ``PolygonApi`` and ``AsyncPolygonApi`` against the local Polygon stub
+and reports requests/s, p50/p99 latency, bytes decoded, peak Python memory,
+TCP connections opened and retries for these workloads:
+
+- ``single``:         one-page daily aggregates of one ticker, repeated
+- ``paginated``:      minute aggregates across many ``next_url`` pages, merged
+- ``paginated_stream``: the same range streamed with ``iter_historical_data``
+- ``many_tickers``:   last trade of many tickers from a thread pool
+- ``many_tickers_async``: the same through ``AsyncPolygonApi.gather``
+
+Peak memory comes from a second, traced run so tracing does not skew the
+timings. Results are saved to ``benchmarks/results/polygon-<commit>.json``;
+``--compare <commit>`` prints the change against an earlier run::
+
+    python benchmarks/bench_polygon.py --latency 0.002 --throttle-every 50
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import load_results, report, save_results, summarize, with_peak_memory
+from benchmarks.polygon_stub import PolygonStub
+from polygon_api import PolygonApi
+from polygon_async_api import AsyncPolygonApi
+
+API_KEY = "stub"
+
+
+def _timed(fn: Callable[[], Any], latencies: List[float]) -> Any:
+    began = time.perf_counter()
+    result = fn()
+    latencies.append(time.perf_counter() - began)
+    return result
+
+
+def single(api: PolygonApi, args: argparse.Namespace) -> List[float]:
+    latencies: List[float] = []
+    for _ in range(args.repeat):
+        _timed(lambda: api.get_historical_data("AAPL", 1, "day", "2023-01-01", "2023-12-31"), latencies)
+    return latencies
+
+
+def paginated(api: PolygonApi, args: argparse.Namespace) -> List[float]:
+    latencies: List[float] = []
+    _timed(lambda: api.get_historical_data("AAPL", 1, "minute", "2024-01-01", args.to_date, limit=args.page_size),
+           latencies)
+    return latencies
+
+
+def paginated_stream(api: PolygonApi, args: argparse.Namespace) -> List[float]:
+    latencies: List[float] = []
+
+    def consume() -> float:
+        total = 0.0
+        for bar in api.iter_historical_data("AAPL", 1, "minute", "2024-01-01", args.to_date,
+                                            prefetch=True, limit=args.page_size):
+            total += bar["c"]
+        return total
+
+    _timed(consume, latencies)
+    return latencies
+
+
+def many_tickers(api: PolygonApi, args: argparse.Namespace) -> List[float]:
+    latencies: List[float] = []
+    tickers = [f"T{index}" for index in range(args.tickers)]
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(lambda ticker: _timed(lambda: api.get_last_trade(ticker), latencies), tickers))
+    return latencies
+
+
+def many_tickers_async(stub: PolygonStub, args: argparse.Namespace) -> List[float]:
+    latencies: List[float] = []
+
+    async def run() -> None:
+        async with AsyncPolygonApi(API_KEY, base_url=stub.url, max_concurrency=args.workers,
+                                   backoff_factor=0.01) as api:
+            async def timed_trade(ticker: str) -> Any:
+                began = time.perf_counter()
+                result = await api.get_last_trade(ticker)
+                latencies.append(time.perf_counter() - began)
+                return result
+
+            await api.gather(timed_trade, [f"T{index}" for index in range(args.tickers)])
+
+    asyncio.run(run())
+    return latencies
+
+
+def run_workload(stub: PolygonStub, workload: Callable[..., List[float]], args: argparse.Namespace,
+                 use_async: bool = False) -> Dict[str, Any]:
+    """Time *workload* once for throughput and once more under tracemalloc for memory."""
+
+    def once() -> Dict[str, Any]:
+        if use_async:
+            return {"latencies": workload(stub, args), "retries": None}
+        with PolygonApi(API_KEY, base_url=stub.url, pool_size=args.workers, backoff_factor=0.01) as api:
+            latencies = workload(api, args)
+            return {"latencies": latencies, "retries": api.connection_stats()["retries"]}
+
+    stub.reset_stats()
+    start = time.perf_counter()
+    run = once()
+    elapsed = time.perf_counter() - start
+    stats = stub.stats()
+    _, peak = with_peak_memory(once)
+
+    return summarize(
+        run["latencies"], elapsed,
+        requests=stats["requests"],
+        requests_per_s=stats["requests"] / elapsed if elapsed > 0 else float("inf"),
+        bytes_decoded=stats["bytes_sent"],
+        peak_memory_bytes=peak,
+        connections=stats["connections"],
+        throttled=stats["throttled"],
+        retries=run["retries"],
+    )
+
+
+def main(argv: Any = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub response latency in seconds")
+    parser.add_argument("--throttle-every", type=int, default=0, help="answer every Nth request with 429")
+    parser.add_argument("--bar-padding", type=int, default=0, help="extra bytes per bar")
+    parser.add_argument("--page-size", type=int, default=5000, help="bars per aggregates page")
+    parser.add_argument("--to-date", default="2024-01-31", help="end of the paginated minute range")
+    parser.add_argument("--repeat", type=int, default=50, help="calls in the single workload")
+    parser.add_argument("--tickers", type=int, default=200, help="tickers in the many-ticker workloads")
+    parser.add_argument("--workers", type=int, default=20, help="threads / concurrency / pool size")
+    parser.add_argument("--compare", help="commit of an earlier run to compare against")
+    parser.add_argument("--no-save", action="store_true", help="do not write the results file")
+    args = parser.parse_args(argv)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "no_save")}
+    results: Dict[str, Any] = {}
+    with PolygonStub(latency=args.latency, throttle_every=args.throttle_every,
+                     page_size=args.page_size, bar_padding=args.bar_padding) as stub:
+        results["polygon.single"] = run_workload(stub, single, args)
+        results["polygon.paginated"] = run_workload(stub, paginated, args)
+        results["polygon.paginated_stream"] = run_workload(stub, paginated_stream, args)
+        results["polygon.many_tickers"] = run_workload(stub, many_tickers, args)
+        results["polygon.many_tickers_async"] = run_workload(stub, many_tickers_async, args, use_async=True)
+
+    baseline = load_results("polygon", args.compare) if args.compare else None
+    print(report(results, baseline, metrics=("requests_per_s", "p50_ms", "p99_ms", "bytes_decoded",
+                                              "peak_memory_bytes", "connections")))
+    if not args.no_save:
+        print("saved", save_results("polygon", results, config))
+    return results
+
+
+if __name__ == "__main__":
+    main()
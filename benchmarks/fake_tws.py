@@ -0,0 +1,270 @@
+"""
+Fake TWS / IB Gateway
+
+A local stand-in that speaks enough of the TWS socket protocol for IbkrApi and
+IbInsyncApi to connect and run their request paths without a live gateway:
+handshake, nextValidId / managedAccounts, current time, contract details,
+historical bars, account summary and account updates, order acknowledgements,
+plus the start-up requests ib_insync synchronises on (positions, open and
+completed orders, executions, account updates multi).
+
+The server reports version 157, the one version both clients accept
+(ibapi 9.81 speaks 100..157, ib_insync 0.9.86 speaks 157..176), and encodes
+every message in the field layout of that version.
+
+Wire format: the client opens with b"API\\0" and a length-prefixed version
+range, every later message in both directions is a 4 byte big-endian length
+followed by NUL terminated fields.
+"""
+
+import datetime
+import socketserver
+import struct
+import threading
+import time as systime
+import zlib
+from zoneinfo import ZoneInfo
+
+SERVER_VERSION = 157
+US_EASTERN = ZoneInfo("America/New_York")
+
+# Incoming (client -> server) message ids
+REQ_OPEN_ORDERS, REQ_ACCOUNT_UPDATES, REQ_EXECUTIONS, REQ_IDS = 5, 6, 7, 8
+PLACE_ORDER, REQ_CONTRACT_DATA, REQ_HISTORICAL_DATA, CANCEL_HISTORICAL_DATA = 3, 9, 20, 25
+REQ_CURRENT_TIME, REQ_POSITIONS, REQ_ACCOUNT_SUMMARY, CANCEL_ACCOUNT_SUMMARY = 49, 61, 62, 63
+START_API, REQ_ACCOUNT_UPDATES_MULTI, REQ_COMPLETED_ORDERS = 71, 76, 99
+
+# Outgoing (server -> client) message ids
+ORDER_STATUS, ACCT_VALUE, NEXT_VALID_ID, CONTRACT_DATA, MANAGED_ACCTS = 3, 6, 9, 10, 15
+HISTORICAL_DATA, CURRENT_TIME, CONTRACT_DATA_END, OPEN_ORDER_END = 17, 49, 52, 53
+ACCT_DOWNLOAD_END, EXECUTION_DATA_END, POSITION_END = 54, 55, 62
+ACCOUNT_SUMMARY, ACCOUNT_SUMMARY_END, ACCOUNT_UPDATE_MULTI_END, COMPLETED_ORDERS_END = 63, 64, 74, 102
+
+# Offset of barSizeSetting in REQ_HISTORICAL_DATA: msgId, reqId, 12 contract fields, includeExpired, endDateTime
+HIST_BAR_SIZE = 16
+
+BAR_SIZE_SECONDS = {"secs": 1, "sec": 1, "mins": 60, "min": 60, "hour": 3600, "hours": 3600, "day": 86400}
+
+DEFAULT_ACCOUNT_VALUES = {
+    "AvailableFunds": ("100000.00", "USD"),
+    "TotalCashValue": ("150000.00", "USD"),
+    "NetLiquidation": ("250000.00", "USD"),
+    "BuyingPower": ("400000.00", "USD"),
+}
+
+
+def regularTradingHours(days: int = 7, now=None) -> str:
+    """
+    Trading hours string in the TWS format, 09:30-16:00 US/Eastern on weekdays,
+    starting from today.
+    """
+    today = (now or datetime.datetime.now(US_EASTERN)).date()
+    sessions = []
+    for offset in range(days):
+        day = (today + datetime.timedelta(days=offset)).strftime("%Y%m%d")
+        if (today + datetime.timedelta(days=offset)).weekday() < 5:
+            sessions.append(f"{day}:0930-{day}:1600")
+        else:
+            sessions.append(f"{day}:CLOSED")
+    return ";".join(sessions)
+
+
+def _message(*fields) -> bytes:
+    payload = "".join(f"{field}\0" for field in fields).encode()
+    return struct.pack(">I", len(payload)) + payload
+
+
+def _barSeconds(barSize: str) -> int:
+    count, unit = barSize.split()
+    return int(count) * BAR_SIZE_SECONDS[unit]
+
+
+class _Connection(socketserver.BaseRequestHandler):
+    """
+    One client session, requests are answered from the reading thread unless
+    a latency is configured, then from a timer so requests overlap like on TWS.
+    """
+
+    def setup(self):
+        self.tws = self.server.tws
+        self.sendLock = threading.Lock()
+        self.buffer = b""
+
+    def _read(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            chunk = self.request.recv(65536)
+            if not chunk:
+                raise ConnectionError
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def _readMessage(self) -> list:
+        size = struct.unpack(">I", self._read(4))[0]
+        return self._read(size).decode().split("\0")[:-1]
+
+    def send(self, *messages) -> None:
+        data = b"".join(messages)
+        with self.sendLock:
+            self.request.sendall(data)
+        with self.tws.lock:
+            self.tws.bytesSent += len(data)
+
+    def handle(self):
+        try:
+            if self._read(4) != b"API\0":
+                return
+            self._readMessage()     # "v100..157", the version is not negotiated further
+            connTime = datetime.datetime.now(US_EASTERN).strftime("%Y%m%d %H:%M:%S EST")
+            self.send(_message(SERVER_VERSION, connTime))
+            while True:
+                fields = self._readMessage()
+                msgId = int(fields[0])
+                with self.tws.lock:
+                    self.tws.requests += 1
+                    self.tws.requestCounts[msgId] = self.tws.requestCounts.get(msgId, 0) + 1
+                handler = self.tws.handlers.get(msgId)
+                if handler is not None:
+                    handler(self, fields)
+        except (ConnectionError, OSError):
+            pass
+
+
+class FakeTws:
+    """
+    Args:
+        bars:           bars returned per historical request
+        latency:        seconds before a historical request is answered
+        tradingHours:   contract details tradingHours, default regular weekday hours
+        accountValues:  {tag: (value, currency)} for account summary / updates
+        account:        managed account id
+        nextOrderId:    nextValidId sent on start
+        ackOrders:      answer placeOrder with a PreSubmitted orderStatus
+
+    Use as a context manager or start() / stop(), connect clients to ("127.0.0.1", fake.port).
+    """
+
+    def __init__(self, bars: int = 100, latency: float = 0.0, tradingHours: str = None,
+                 accountValues: dict = None, account: str = "DU123456", nextOrderId: int = 1,
+                 ackOrders: bool = True):
+        self.bars = bars
+        self.latency = latency
+        self.tradingHours = tradingHours if tradingHours is not None else regularTradingHours()
+        self.accountValues = dict(accountValues or DEFAULT_ACCOUNT_VALUES)
+        self.account = account
+        self.nextOrderId = nextOrderId
+        self.ackOrders = ackOrders
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.requestCounts = {}     # incoming msgId -> count
+        self.bytesSent = 0
+        self.server = None
+        self.thread = None
+        self.handlers = {
+            START_API: self._startApi,
+            REQ_IDS: self._startApi,
+            REQ_CURRENT_TIME: self._currentTime,
+            REQ_CONTRACT_DATA: self._contractDetails,
+            REQ_HISTORICAL_DATA: self._historicalData,
+            REQ_ACCOUNT_SUMMARY: self._accountSummary,
+            REQ_ACCOUNT_UPDATES: self._accountUpdates,
+            REQ_POSITIONS: lambda conn, fields: conn.send(_message(POSITION_END, 1)),
+            REQ_OPEN_ORDERS: lambda conn, fields: conn.send(_message(OPEN_ORDER_END, 1)),
+            REQ_COMPLETED_ORDERS: lambda conn, fields: conn.send(_message(COMPLETED_ORDERS_END)),
+            REQ_EXECUTIONS: lambda conn, fields: conn.send(_message(EXECUTION_DATA_END, 1, fields[2])),
+            REQ_ACCOUNT_UPDATES_MULTI: lambda conn, fields: conn.send(_message(ACCOUNT_UPDATE_MULTI_END, 1, fields[2])),
+            PLACE_ORDER: self._placeOrder,
+        }
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self) -> "FakeTws":
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Connection)
+        self.server.daemon_threads = True
+        self.server.tws = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Handlers
+    def _startApi(self, conn, fields):
+        conn.send(_message(NEXT_VALID_ID, 1, self.nextOrderId), _message(MANAGED_ACCTS, 1, self.account))
+
+    def _currentTime(self, conn, fields):
+        conn.send(_message(CURRENT_TIME, 1, int(systime.time())))
+
+    def _contractDetails(self, conn, fields):
+        reqId, symbol, secType = fields[2], fields[4], fields[5]
+        expiry, strike, right = fields[6], float(fields[7] or 0), fields[8]
+        exchange, currency = fields[10] or "SMART", fields[12] or "USD"
+        # Expiries and strikes of one underlying are distinct contracts
+        conId = zlib.crc32(f"{symbol}{expiry}{strike or ''}{right}".encode()) & 0x7FFFFFFF
+        conn.send(
+            _message(CONTRACT_DATA, 8, reqId, symbol, secType, expiry, strike, right, exchange, currency, symbol,
+                     symbol, symbol, conId, 0.01, 1, "", "LMT,MKT,STP", exchange, 1, 0, f"{symbol} INC",
+                     "NASDAQ", "", "Technology", "Computers", "Software", "US/Eastern",
+                     self.tradingHours, self.tradingHours, "", 0, 0, 1, "", "", "26,26", "", "COMMON"),
+            _message(CONTRACT_DATA_END, 1, reqId))
+
+    def _historicalData(self, conn, fields):
+        reqId, barSize = fields[1], fields[HIST_BAR_SIZE]
+        step = _barSeconds(barSize)
+        end = datetime.datetime.now(US_EASTERN).replace(tzinfo=None, microsecond=0)
+        if step < 86400:
+            end -= datetime.timedelta(seconds=(end.hour * 3600 + end.minute * 60 + end.second) % step)
+        dateFormat = "%Y%m%d" if step >= 86400 else "%Y%m%d  %H:%M:%S"
+        items = []
+        for index in range(self.bars):
+            date = (end - datetime.timedelta(seconds=step * (self.bars - 1 - index))).strftime(dateFormat)
+            price = 100.0 + index % 50
+            items += [date, price, price + 1, price - 1, price + 0.5, 1000 + index, price, 10]
+        start = (end - datetime.timedelta(seconds=step * self.bars)).strftime("%Y%m%d  %H:%M:%S")
+        message = _message(HISTORICAL_DATA, reqId, start, end.strftime("%Y%m%d  %H:%M:%S"), self.bars, *items)
+        self._later(conn, message)
+
+    def _accountSummary(self, conn, fields):
+        reqId, tags = fields[2], fields[4].split(",")
+        messages = [_message(ACCOUNT_SUMMARY, 1, reqId, self.account, tag, value, currency)
+                    for tag, (value, currency) in self.accountValues.items() if tag in tags or "All" in tags]
+        conn.send(*messages, _message(ACCOUNT_SUMMARY_END, 1, reqId))
+
+    def _accountUpdates(self, conn, fields):
+        if fields[2] not in ("1", "True"):
+            return
+        messages = [_message(ACCT_VALUE, 2, tag, value, currency, self.account)
+                    for tag, (value, currency) in self.accountValues.items()]
+        conn.send(*messages, _message(ACCT_DOWNLOAD_END, 1, self.account))
+
+    def _placeOrder(self, conn, fields):
+        if self.ackOrders:
+            conn.send(_message(ORDER_STATUS, fields[1], "PreSubmitted", 0, 1, 0, 0, 0, 0, 0, "", 0))
+
+    def _later(self, conn, message) -> None:
+        if self.latency <= 0:
+            conn.send(message)
+            return
+        timer = threading.Timer(self.latency, self._sendQuietly, (conn, message))
+        timer.daemon = True
+        timer.start()
+
+    @staticmethod
+    def _sendQuietly(conn, message) -> None:
+        try:
+            conn.send(message)
+        except OSError:
+            pass
@@ -0,0 +1,117 @@
+"""
+Benchmark helpers shared by the IB and Polygon suites
+
+Timing summaries, git-commit tagged result files under benchmarks/results/
+and a comparison against the results of an earlier commit.
+"""
+
+import datetime
+import json
+import math
+import os
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(samples, fraction: float) -> float:
+    """Nearest-rank percentile of samples (fraction in [0, 1])."""
+    ordered = sorted(samples)
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered), max(1, math.ceil(fraction * len(ordered)))) - 1]
+
+
+def summarize(latencies, elapsed: float, operations: int = None, **extra) -> dict:
+    """
+    Latency percentiles in milliseconds and throughput of one benchmark.
+    """
+    operations = len(latencies) if operations is None else operations
+    result = {
+        "operations": operations,
+        "elapsed_s": elapsed,
+        "ops_per_s": operations / elapsed if elapsed > 0 else float("inf"),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+    }
+    result.update(extra)
+    return result
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> dict:
+    """
+    Call fn() repeat times (after warmup calls) and summarize the latencies.
+    """
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        began = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - began)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def with_peak_memory(fn):
+    """
+    Run fn() under tracemalloc, returns (result, peak bytes allocated).
+    """
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(suite: str, results: dict, config: dict, commit: str = None) -> str:
+    """
+    Write results to benchmarks/results/<suite>-<commit>.json, returns the path.
+    """
+    commit = commit or git_commit()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{suite}-{commit}.json")
+    with open(path, "w") as file:
+        json.dump({"suite": suite, "commit": commit,
+                   "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                   "config": config, "results": results}, file, indent=2, sort_keys=True)
+    return path
+
+
+def load_results(suite: str, commit: str) -> dict:
+    with open(os.path.join(RESULTS_DIR, f"{suite}-{commit}.json")) as file:
+        return json.load(file)["results"]
+
+
+def report(results: dict, baseline: dict = None, metrics=("ops_per_s", "p50_ms", "p99_ms")) -> str:
+    """
+    Table of results, with the change against baseline (an earlier run) when given.
+    """
+    lines = []
+    for name, result in results.items():
+        cells = []
+        for metric in metrics:
+            if result.get(metric) is None:
+                continue
+            value = result[metric]
+            cell = f"{metric}={value:.3f}" if isinstance(value, float) else f"{metric}={value}"
+            before = (baseline or {}).get(name, {}).get(metric)
+            if before:
+                cell += f" ({(result[metric] - before) / before:+.1%})"
+            cells.append(cell)
+        lines.append(f"{name:<40} " + "  ".join(cells))
+    return "\n".join(lines)
@@ -0,0 +1,223 @@
+"""Local stand-in for the Polygon REST endpoints used by ``PolygonApi``.
+
+Serves ``/v1/marketstatus/now``, ``/v2/last/trade/{ticker}`` and
+``/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{from}/{to}`` over
+keep-alive HTTP/1.1. Aggregates are generated for the requested range and
+paged with ``next_url`` cursors like the real API.
+
+Latency, 429 injection and payload size are configurable, and the stub counts
+requests, throttled responses, body bytes and TCP connections so connection
+reuse and retry behaviour can be checked offline.
+"""
+
+import datetime
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+from zoneinfo import ZoneInfo
+
+MARKET_TZ = ZoneInfo("America/New_York")
+
+TIMESPAN_SECONDS: Dict[str, int] = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+    "week": 7 * 86400,
+    "month": 30 * 86400,
+    "quarter": 91 * 86400,
+    "year": 365 * 86400,
+}
+
+DEFAULT_LIMIT = 5000
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connection bursts, which then retry after 1 s
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class PolygonStub:
+    """Threaded Polygon stand-in, use as a context manager or ``start()``/``stop()``.
+
+    *latency* delays every response (seconds). Every *throttle_every*-th request
+    is answered ``429`` with ``Retry-After: retry_after`` (0 disables). Pages
+    hold at most *page_size* bars (or the request ``limit`` if lower), an
+    aggregates range yields at most *max_bars* bars, and *bar_padding* adds a
+    string of that many bytes to each bar to inflate the payload.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        throttle_every: int = 0,
+        retry_after: str = "0",
+        page_size: int = DEFAULT_LIMIT,
+        max_bars: int = 1_000_000,
+        bar_padding: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.page_size = page_size
+        self.max_bars = max_bars
+        self.bar_padding = bar_padding
+
+        self.lock = threading.Lock()
+        self.httpd: Optional[ThreadingHTTPServer] = None
+        self.reset_stats()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.requests = 0
+            self.throttled = 0
+            self.bytes_sent = 0
+            self.connections = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "bytes_sent": self.bytes_sent,
+                "connections": self.connections,
+            }
+
+    def start(self) -> "PolygonStub":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                # Headers and body are written separately, don't let Nagle hold the body back
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with stub.lock:
+                    stub.connections += 1
+
+            def do_GET(self) -> None:
+                status, headers, body = stub.handle(self.path)
+                if stub.latency > 0:
+                    time.sleep(stub.latency)
+                payload = json.dumps(body, separators=(",", ":")).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with stub.lock:
+                    stub.bytes_sent += len(payload)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.httpd = _Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self) -> "PolygonStub":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def handle(self, target: str) -> Tuple[int, Dict[str, str], Any]:
+        """Return ``(status, headers, body)`` for a request target."""
+        with self.lock:
+            self.requests += 1
+            throttle = self.throttle_every > 0 and self.requests % self.throttle_every == 0
+            if throttle:
+                self.throttled += 1
+        if throttle:
+            return 429, {"Retry-After": self.retry_after}, {"status": "ERROR", "error": "Too many requests"}
+
+        parts = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+        segments = parts.path.strip("/").split("/")
+        if parts.path == "/v1/marketstatus/now":
+            return 200, {}, self.market_status()
+        if segments[:3] == ["v2", "last", "trade"] and len(segments) == 4:
+            return 200, {}, self.last_trade(segments[3])
+        if segments[:3] == ["v2", "aggs", "ticker"] and len(segments) == 9 and segments[4] == "range":
+            ticker, multiplier, timespan, from_date, to_date = segments[3], *segments[5:9]
+            return 200, {}, self.aggs(parts.path, query, ticker, int(multiplier), timespan, from_date, to_date)
+        return 404, {}, {"status": "NOT_FOUND", "message": f"unknown path {parts.path}"}
+
+    def market_status(self) -> Dict[str, Any]:
+        return {
+            "market": "open",
+            "serverTime": datetime.datetime.now(MARKET_TZ).isoformat(),
+            "exchanges": {"nyse": "open", "nasdaq": "open", "otc": "open"},
+            "currencies": {"fx": "open", "crypto": "open"},
+        }
+
+    def last_trade(self, ticker: str) -> Dict[str, Any]:
+        return {
+            "status": "OK",
+            "request_id": "stub",
+            "results": {"T": ticker, "p": 100.25, "s": 100, "x": 4, "t": time.time_ns()},
+        }
+
+    def aggs(
+        self,
+        path: str,
+        query: Dict[str, str],
+        ticker: str,
+        multiplier: int,
+        timespan: str,
+        from_date: str,
+        to_date: str,
+    ) -> Dict[str, Any]:
+        step = multiplier * TIMESPAN_SECONDS[timespan]
+        start = int(datetime.datetime.combine(
+            datetime.date.fromisoformat(from_date), datetime.time(), MARKET_TZ).timestamp())
+        end = int(datetime.datetime.combine(
+            datetime.date.fromisoformat(to_date) + datetime.timedelta(days=1), datetime.time(), MARKET_TZ
+        ).timestamp())
+        total = min(self.max_bars, max(0, (end - start + step - 1) // step))
+
+        offset = int(query.get("cursor", 0))
+        limit = min(self.page_size, int(query.get("limit", DEFAULT_LIMIT)))
+        count = max(0, min(limit, total - offset))
+        padding = "x" * self.bar_padding
+        results = []
+        for index in range(offset, offset + count):
+            price = 100.0 + index % 100 * 0.01
+            bar = {"t": (start + index * step) * 1000, "o": price, "h": price + 0.05, "l": price - 0.05,
+                   "c": price + 0.01, "v": 1000 + index % 500, "vw": price, "n": 10}
+            if padding:
+                bar["pad"] = padding
+            results.append(bar)
+
+        page: Dict[str, Any] = {
+            "ticker": ticker,
+            "adjusted": query.get("adjusted", "true") != "false",
+            "queryCount": count,
+            "resultsCount": count,
+            "status": "OK",
+            "request_id": "stub",
+            "results": results,
+        }
+        if offset + count < total:
+            cursor_query = {name: value for name, value in query.items() if name != "apiKey"}
+            cursor_query.update(cursor=offset + count, limit=limit)
+            page["next_url"] = f"{self.url}{path}?{urlencode(cursor_query)}"
+        return page
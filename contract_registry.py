@@ -0,0 +1,208 @@
+"""
+Contract registry
+
+Interns contracts by their identifying fields (KEY_FIELDS: symbol, secType,
+exchange, currency plus expiry, strike, right, multiplier and localSymbol) so that
+building the same contract in a loop returns one shared object instead of a new
+one per call, and caches what TWS resolved for it: the conId and the contract
+details. Different futures expiries or option strikes of one underlying are
+separate entries.
+
+With a path the resolved contracts are persisted as JSON and loaded on the next
+start, so a restart qualifies its symbols without contract-details round trips.
+The conId of a contract never changes and is kept for good; the details carry a
+week of tradingHours and are served only while younger than maxAge.
+
+The registry knows no API: each wrapper passes its own Contract and
+ContractDetails classes (ibapi or ib_insync) to rebuild cached entries with.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time as systime
+
+# Contract fields filled in by qualification
+CONTRACT_FIELDS = ("conId", "symbol", "secType", "lastTradeDateOrContractMonth", "strike", "right", "multiplier",
+                   "exchange", "primaryExchange", "currency", "localSymbol", "tradingClass")
+# Persisted contract details fields, present in both ibapi and ib_insync
+DETAIL_FIELDS = ("marketName", "minTick", "orderTypes", "validExchanges", "priceMagnifier", "longName",
+                 "industry", "category", "subcategory", "timeZoneId", "tradingHours", "liquidHours",
+                 "stockType", "marketRuleIds")
+
+# Fields identifying a contract, a cached record never overwrites the ones the caller set
+KEY_FIELDS = ("symbol", "secType", "exchange", "currency", "lastTradeDateOrContractMonth", "strike", "right",
+              "multiplier", "localSymbol")
+# Key fields kept as requested even when unset, e.g. exchange "SMART" rather than the primary exchange
+REQUESTED_FIELDS = KEY_FIELDS[:4]
+
+# Details older than this are requested again, tradingHours only reach a week ahead
+DETAILS_MAX_AGE = 86400.0
+
+
+def registryKey(contract) -> tuple:
+    """
+    Interning key of a contract: the values of KEY_FIELDS
+    """
+    return tuple(getattr(contract, name, None) for name in KEY_FIELDS)
+
+
+def _fields(source, names) -> dict:
+    return {name: getattr(source, name) for name in names if hasattr(source, name)}
+
+
+class ContractRegistry:
+    """
+    Args:
+        contractType: Contract class to intern, ibapi or ib_insync
+        detailsType:  ContractDetails class cached details are rebuilt as
+        path:         JSON file the resolved contracts are persisted to, default in memory only
+        maxAge:       seconds cached details are served for
+        clock:        callable returning the current time in seconds
+    """
+
+    def __init__(self, contractType, detailsType, path: str = None, maxAge: float = DETAILS_MAX_AGE,
+                 clock=systime.time):
+        self.contractType = contractType
+        self.detailsType = detailsType
+        self.path = path
+        self.maxAge = maxAge
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.interned = {}   # key -> Contract
+        self.records = {}    # key -> {"contract": {...}, "details": {...}, "fetched": seconds}
+        self.details = {}    # key -> ContractDetails object of the record
+        self.conIds = {}     # conId -> key of its record
+        self.dirty = False
+        # Unset key fields of a new contract, completes the key of intern()
+        self.blankKey = registryKey(contractType())[len(REQUESTED_FIELDS):]
+        if path is not None and os.path.exists(path):
+            with open(path, "rb") as handle:
+                for record in json.load(handle):
+                    key = tuple(record["key"])
+                    if len(key) != len(KEY_FIELDS):
+                        continue   # written before the key covered expiry and strike
+                    self.records[key] = record
+                    if record["contract"].get("conId"):
+                        self.conIds[record["contract"]["conId"]] = key
+
+    def __len__(self) -> int:
+        return len(self.interned)
+
+    def __contains__(self, contract) -> bool:
+        return self._key(contract) in self.records
+
+    def _key(self, contract) -> tuple:
+        # A resolved contract keeps the key of its record even after empty key fields were filled in
+        with self.lock:
+            key = self.conIds.get(getattr(contract, "conId", 0))
+        return registryKey(contract) if key is None else key
+
+    def contracts(self) -> list:
+        """
+        Every interned contract, one per key
+        """
+        with self.lock:
+            return list(self.interned.values())
+
+    def intern(self, symbol, secType, exchange, currency):
+        """
+        The shared contract of (symbol, secType, exchange, currency), created on
+        first use with the resolved fields of a cached record applied
+        """
+        key = (symbol, secType, exchange, currency) + self.blankKey
+        with self.lock:
+            contract = self.interned.get(key)
+            if contract is None:
+                contract = self.contractType()
+                contract.symbol, contract.secType, contract.exchange, contract.currency = key[:4]
+                record = self.records.get(key)
+                if record is not None:
+                    self._apply(contract, record)
+                self.interned[key] = contract
+            return contract
+
+    @staticmethod
+    def _apply(contract, record) -> None:
+        # Key fields the caller set stay as requested, unset ones (e.g. localSymbol) are filled in
+        for name, value in record["contract"].items():
+            if name in REQUESTED_FIELDS or (name in KEY_FIELDS and getattr(contract, name, None)):
+                continue
+            setattr(contract, name, value)
+
+    def resolve(self, contract) -> bool:
+        """
+        Fill in the conId and the other resolved fields of contract from the cache.
+        Returns True if the contract is resolved.
+        """
+        if getattr(contract, "conId", 0):
+            return True
+        with self.lock:
+            record = self.records.get(self._key(contract))
+        if record is None:
+            return False
+        self._apply(contract, record)
+        return bool(contract.conId)
+
+    def lookup(self, contract, maxAge: float = None):
+        """
+        Cached ContractDetails of contract, None if unknown or older than maxAge
+        (default self.maxAge)
+        """
+        key = self._key(contract)
+        maxAge = self.maxAge if maxAge is None else maxAge
+        with self.lock:
+            record = self.records.get(key)
+            if record is None or not record.get("details") or self.clock() - record["fetched"] > maxAge:
+                return None
+            details = self.details.get(key)
+            if details is None:
+                details = self.detailsType()
+                for name, value in record["details"].items():
+                    setattr(details, name, value)
+                details.contract = self.contractType()
+                for name, value in record["contract"].items():
+                    setattr(details.contract, name, value)
+                self.details[key] = details
+            return details
+
+    def update(self, contract, details) -> None:
+        """
+        Record the details TWS returned for contract. The resolved fields are
+        applied to contract and to the interned contract of its key.
+        """
+        key = self._key(contract)
+        resolved = getattr(details, "contract", None) or contract
+        record = {"key": list(key), "contract": _fields(resolved, CONTRACT_FIELDS),
+                  "details": _fields(details, DETAIL_FIELDS), "fetched": self.clock()}
+        with self.lock:
+            self.records[key] = record
+            self.details[key] = details
+            if record["contract"].get("conId"):
+                self.conIds[record["contract"]["conId"]] = key
+            self.dirty = True
+            interned = self.interned.get(key)
+        for target in (contract, interned):
+            if target is not None:
+                self._apply(target, record)
+
+    def save(self) -> None:
+        """
+        Persist the records to path if anything changed, written atomically
+        """
+        with self.lock:
+            if self.path is None or not self.dirty:
+                return
+            payload = json.dumps(list(self.records.values())).encode()
+            self.dirty = False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(self.path)}.")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(payload)
+            os.replace(tmpPath, self.path)
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
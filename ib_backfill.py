@@ -0,0 +1,110 @@
+"""
+Long-history backfill planning
+
+IB limits how far back a single reqHistoricalData may reach for each bar size:
+https://interactivebrokers.github.io/tws-api/historical_limitations.html
+A long span is split into legal (endDateTime, duration) chunks walking back
+from the current server time. IbkrApi.backfill_historical_data() and
+IbInsyncApi.backfillHistoricalData() send them pipelined through the pacing
+governor and stitch the results into one ordered, de-duplicated BarBuffer.
+
+With a BarStore as checkpoint every finished chunk is written to disk with the
+range it covers, so a rerun (e.g. after a disconnect) plans chunks only for the
+ranges still missing. The wrappers store under the same keys as their
+barStore path, so a backfill also warms get_historical_data().
+
+Times follow the BarBuffer convention: int64 wall-clock seconds.
+"""
+
+from collections import namedtuple
+import datetime
+
+import numpy as np
+
+from bar_buffer import BarBuffer
+from bar_store import durationString
+
+DAY_SECONDS = 86400
+
+# Longest span one request may cover per bar size, from IB's duration / bar size table.
+# Spans of a day or more are requested in "D" units, IB counts those in trading days,
+# so a chunk never reaches back less than its calendar span.
+MAX_CHUNK_SECONDS = {
+    "1 secs": 1800, "5 secs": 3600, "10 secs": 14400, "15 secs": 14400, "30 secs": 28800,
+    "1 min": DAY_SECONDS, "2 mins": 2 * DAY_SECONDS,
+    "3 mins": 7 * DAY_SECONDS, "5 mins": 7 * DAY_SECONDS, "10 mins": 7 * DAY_SECONDS,
+    "15 mins": 7 * DAY_SECONDS, "20 mins": 7 * DAY_SECONDS,
+    "30 mins": 28 * DAY_SECONDS, "1 hour": 28 * DAY_SECONDS, "2 hours": 28 * DAY_SECONDS,
+    "3 hours": 28 * DAY_SECONDS, "4 hours": 28 * DAY_SECONDS, "8 hours": 28 * DAY_SECONDS,
+    "1 day": 365 * DAY_SECONDS, "1 week": 365 * DAY_SECONDS, "1 month": 365 * DAY_SECONDS,
+}
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+# One request: bars in [start, end], sent as endDateTime=end with duration
+Chunk = namedtuple("Chunk", ["start", "end", "duration"])
+
+
+class BackfillError(Exception):
+    """
+    Raised once every chunk has been tried and some failed. The others are
+    already stored in the checkpoint, rerun the backfill to fetch the rest.
+    """
+
+    def __init__(self, errors, bars):
+        super().__init__(f"{len(errors)} backfill chunk(s) failed, first: {errors[0][1]!r}")
+        self.errors = errors    # [(Chunk, exception)]
+        self.bars = bars        # stitched bars of the chunks that succeeded
+
+
+def chunkDuration(seconds: int) -> str:
+    """
+    IB duration string of a chunk, one day is "1 D": "86400 S" exceeds the S range of minute bars.
+    """
+    return "1 D" if seconds == DAY_SECONDS else durationString(seconds)
+
+
+def planChunks(start: int, end: int, barSize: str) -> list:
+    """
+    Legal chunks covering [start, end], newest first.
+    """
+    step = MAX_CHUNK_SECONDS.get(barSize)
+    if step is None:
+        raise ValueError(f"no duration limit known for bar size {barSize!r}")
+    chunks = []
+    while end > start:
+        length = min(step, end - start)
+        chunks.append(Chunk(end - length, end, chunkDuration(length)))
+        end -= length
+    return chunks
+
+
+def planMissing(store, key, start: int, end: int, barSize: str) -> list:
+    """
+    Chunks for the parts of [start, end] the store does not cover yet, newest first.
+    key is the (source, symbol, barSize) the bars are stored under.
+    """
+    return [chunk for gapStart, gapEnd in reversed(store.missing(*key, start, end))
+            for chunk in planChunks(gapStart, gapEnd, barSize)]
+
+
+def formatEndDateTime(wallSeconds: int, zone: str = "US/Eastern") -> str:
+    """
+    endDateTime of a chunk, "%Y%m%d %H:%M:%S <zone>"
+    """
+    return (_EPOCH + datetime.timedelta(seconds=int(wallSeconds))).strftime(f"%Y%m%d %H:%M:%S {zone}")
+
+
+def stitchBars(buffers) -> BarBuffer:
+    """
+    Merge chunk results into one buffer ordered by time, keeping one bar per time.
+    """
+    buffers = [buffer for buffer in buffers if len(buffer)]
+    if not buffers:
+        return BarBuffer()
+    views = [buffer.view() for buffer in buffers]
+    columns = {name: np.concatenate([view[name] for view in views]) for name in views[0]}
+    _, keep = np.unique(columns["time"], return_index=True)
+    stitched = BarBuffer(len(keep))
+    stitched.extend(*(column[keep] for column in columns.values()))
+    return stitched
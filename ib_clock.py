@@ -0,0 +1,134 @@
+"""
+Local server clock
+
+Estimates the offset between the TWS server clock and the local monotonic clock
+from a few reqCurrentTime() samples, NTP style: the server reading is assumed to
+be taken at the midpoint of the round trip, and the sample with the shortest
+round trip wins. The time is then served locally and only re-synced every
+resyncInterval seconds.
+
+TWS reports whole seconds (truncated), so half a second is added to each reading
+and the estimate is good to about +/-0.5 s plus half the round trip.
+"""
+
+from zoneinfo import ZoneInfo
+import datetime
+import threading
+import time as systime
+
+US_EASTERN = ZoneInfo("America/New_York")
+
+
+class ServerClock:
+    """
+    Args:
+        fetch:          callable returning the server time as epoch seconds
+        fetchAsync:     optional coroutine function returning the same, used by nowAsync()
+        samples:        round trips taken per sync (TWS allows ~2 time requests per second)
+        resyncInterval: seconds between syncs
+        tz:             ZoneInfo for datetime and string output, default US/Eastern
+    """
+
+    def __init__(self, fetch, samples: int = 2, resyncInterval: float = 300.0,
+                 tz=US_EASTERN, monotonic=systime.monotonic, fetchAsync=None):
+        self.fetch = fetch
+        self.fetchAsync = fetchAsync
+        self.samples = max(1, samples)
+        self.resyncInterval = resyncInterval
+        self.tz = tz
+        self.monotonic = monotonic
+        self.lock = threading.Lock()
+
+        self.offset = None      # server epoch seconds - local monotonic seconds
+        self.roundTrip = None   # round trip of the sample the offset came from
+        self.lastSync = None    # monotonic time of the last successful sync
+
+    def _sample(self, best, sentAt: float, serverTime, receivedAt: float):
+        serverTime = float(serverTime) + 0.5
+        roundTrip = receivedAt - sentAt
+        if best is None or roundTrip < best[0]:
+            best = (roundTrip, serverTime - (sentAt + receivedAt) / 2)
+        return best
+
+    def _update(self, best) -> float:
+        with self.lock:
+            self.roundTrip, self.offset = best
+            self.lastSync = self.monotonic()
+            return self.offset
+
+    def sync(self) -> float:
+        """
+        Sample the server clock and update the offset. Returns the new offset.
+        """
+        best = None
+        for _ in range(self.samples):
+            sentAt = self.monotonic()
+            serverTime = self.fetch()
+            best = self._sample(best, sentAt, serverTime, self.monotonic())
+        return self._update(best)
+
+    async def syncAsync(self) -> float:
+        """
+        Coroutine variant of sync() sampling with fetchAsync.
+        """
+        best = None
+        for _ in range(self.samples):
+            sentAt = self.monotonic()
+            serverTime = await self.fetchAsync()
+            best = self._sample(best, sentAt, serverTime, self.monotonic())
+        return self._update(best)
+
+    def needsSync(self) -> bool:
+        return self.offset is None or self.monotonic() - self.lastSync >= self.resyncInterval
+
+    def now(self) -> float:
+        """
+        Server time as epoch seconds, syncing first if the estimate is due.
+        A failed re-sync keeps serving the previous estimate.
+        """
+        if self.needsSync():
+            try:
+                self.sync()
+            except Exception:
+                if self.offset is None:
+                    raise
+        return self.monotonic() + self.offset
+
+    async def nowAsync(self) -> float:
+        """
+        Coroutine variant of now() for callers running inside the event loop.
+        """
+        if self.needsSync():
+            try:
+                await self.syncAsync()
+            except Exception:
+                if self.offset is None:
+                    raise
+        return self.monotonic() + self.offset
+
+    def nowDatetime(self) -> datetime.datetime:
+        """
+        Server time as an aware datetime in self.tz.
+        """
+        return datetime.datetime.fromtimestamp(self.now(), self.tz)
+
+    def nowString(self) -> str:
+        """
+        Server time in IB request format: "%Y%m%d %H:%M:%S US/Eastern"
+        """
+        return formatIbTime(self.now(), self.tz)
+
+    async def nowStringAsync(self) -> str:
+        """
+        Coroutine variant of nowString().
+        """
+        return formatIbTime(await self.nowAsync(), self.tz)
+
+
+def formatIbTime(epoch: float, tz=US_EASTERN) -> str:
+    """
+    Format epoch seconds as "%Y%m%d %H:%M:%S US/Eastern" with real DST rules
+    (or the zone key instead of US/Eastern for other time zones).
+    """
+    label = "US/Eastern" if tz is US_EASTERN else tz.key
+    return datetime.datetime.fromtimestamp(epoch, tz).strftime(f"%Y%m%d %H:%M:%S {label}")
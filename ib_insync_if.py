@@ -10,8 +10,23 @@ https://ib-insync.readthedocs.io/api.html
 
 from ib_insync import *
 import pandas as pd
+import asyncio
 import datetime
 
+from trading_hours import SessionTagger, TradingHoursCalendar, contractKey
+from bar_buffer import BarBuffer, parseBarDate
+from bar_store import barSizeSeconds, contractSymbol, durationSeconds, durationString
+from bar_resample import BarResampler
+from ib_backfill import BackfillError, formatEndDateTime, planChunks, planMissing, stitchBars
+from ib_pacing import PacingGovernor
+from ib_clock import ServerClock
+from ib_realtime import RealTimeHub, wallClockSeconds
+from account_store import AccountStore
+from order_engine import OrderEngine
+from instrumentation import Instrumentation
+from contract_registry import ContractRegistry
+import time as systime
+
 IBKR_PERIOD_MAPPING = {
     "5m"  :  "5 mins",
     "10m" : "10 mins",
@@ -22,7 +37,7 @@ IBKR_PERIOD_MAPPING = {
 }
 
 class IbInsyncApi(IB):
-    def __init__(self, host, port, clientId):
+    def __init__(self, host, port, clientId, barStore=None, pacing=None, instrumentation=None, contractCache=None):
         IB.__init__(self)
         self.host = host
         self.port = port
@@ -30,10 +45,42 @@ class IbInsyncApi(IB):
 
         self.reqId = 10000
         self.orderId = 1
-        self.prevSysTime = datetime.datetime.now(tz=datetime.timezone.utc)
-        self.CurrTime = None
         self.connectAttempt = 0
 
+        # Offset-tracking server clock, re-synced with reqCurrentTime() every few minutes
+        self.clock = ServerClock(lambda: self.reqCurrentTime().timestamp(), fetchAsync=self._currentTimeAsync)
+
+        # Session calendars keyed by conId (or symbol/secType/exchange/currency if unresolved)
+        self.tradingCalendars = {}
+
+        # Interned contracts with their resolved conIds and details, persisted to contractCache if given
+        self.contracts = ContractRegistry(Contract, ContractDetails, contractCache)
+
+        # Optional bar_store.BarStore, historical requests then only download missing bars
+        self.barStore = barStore
+
+        # Historical pacing governor, may be shared with other sessions on the same gateway.
+        # Waits run the ib_insync event loop (IB.sleep) so the connection stays serviced.
+        self.pacing = pacing if pacing is not None else PacingGovernor(sleep=self.sleep)
+
+        # Request timings (instrumentation.Instrumentation), disabled unless one is passed in.
+        # ib_insync hands back finished responses, so only the queue and total spans are recorded.
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+
+        # Streaming subscriptions, updates land in per-symbol ring buffers
+        self.realtime = RealTimeHub({period: barSizeSeconds(barSize) for period, barSize in IBKR_PERIOD_MAPPING.items()})
+
+        # Account values and positions kept current by the account update events
+        self.accountStore = AccountStore()
+        self.accountValueEvent += self._onAccountValue
+        self.accountSummaryEvent += self._onAccountValue
+        self.updatePortfolioEvent += self._onPortfolioItem
+
+        # Batches of brackets placed with contiguous order ids, acknowledged by the order events
+        self.orderEngine = OrderEngine(self._reserveOrderIds, self.placeOrder, self._buildBracket)
+        self.openOrderEvent += self._onOrderAck
+        self.orderStatusEvent += self._onOrderAck
+
     def connect(self):
         self.connectAttempt += 1
         return super().connect(self.host, self.port, self.clientId)
@@ -41,20 +88,17 @@ class IbInsyncApi(IB):
     def getCurrTime(self):
         """Get current time from IBKR server in US/Eastern timezone.
         TWS api has a limitation of no more than two requests per second.
-        Hence, a time cache is used to prevent overloading the server.
+        Hence, the time is served from a local clock that tracks the server
+        offset and only re-syncs with reqCurrentTime() every few minutes.
         """
-        # Current time is YYYY-MM-DD HH:mm:ss+zz:zz in datetime.datetime format
-        if datetime.datetime.now(tz=datetime.timezone.utc) - self.prevSysTime > datetime.timedelta(seconds=1) or self.CurrTime is None:
-            self.prevSysTime = datetime.datetime.now(tz=datetime.timezone.utc)
-            self.CurrTime = self.reqCurrentTime()
+        return self.clock.nowString()
 
-        # Convert to our conventional US/Eastern trading time
-        baseTimeZone = self.CurrTime.utcoffset()
-        usTimeZone = datetime.timedelta(hours=-5)
-        currTimeUs = self.CurrTime + usTimeZone - baseTimeZone
-        currTimeUsStr = currTimeUs.strftime("%Y%m%d %H:%M:%S US/Eastern")
+    async def _currentTimeAsync(self) -> float:
+        return (await self.reqCurrentTimeAsync()).timestamp()
 
-        return currTimeUsStr
+    async def getCurrTimeAsync(self):
+        """Coroutine variant of getCurrTime(), for use inside the ib_insync event loop."""
+        return await self.clock.nowStringAsync()
 
     def modifySession(self, host, port, clientId):
         self.host = host
@@ -64,15 +108,136 @@ class IbInsyncApi(IB):
 
     def createContract(self, symbol, secType, exchange, currency):
         '''
-        Create trade contract for corresponded symbol
+        Create trade contract for corresponded symbol, the same object for the
+        same arguments, with its conId filled in once resolved
         '''
-        self.contract = Contract()
-        self.contract.symbol = symbol
-        self.contract.secType = secType
-        self.contract.exchange = exchange
-        self.contract.currency = currency
+        self.contract = self.contracts.intern(symbol, secType, exchange, currency)
         return self.contract
 
+    async def qualifyContractsAsync(self, *contracts: Contract) -> list:
+        '''
+        Resolve the conId of many contracts at once. Contracts known to the registry
+        are filled in locally, the others are requested concurrently and recorded.
+        qualifyContracts() runs this on the event loop.
+
+        Args: Contract objects, updated in place
+
+        return: list of the contracts that were resolved, unknown or ambiguous ones are left out
+        '''
+        pending = [contract for contract in contracts if not self.contracts.resolve(contract)]
+        results = await asyncio.gather(*(self.reqContractDetailsAsync(contract) for contract in pending))
+        for contract, contractDetails in zip(pending, results):
+            if len(contractDetails) == 1:
+                self.contracts.update(contract, contractDetails[0])
+        self.contracts.save()
+        return [contract for contract in contracts if contract.conId]
+
+    def getContractDetails(self, contract: Contract, refresh=False) -> ContractDetails:
+        '''
+        Contract details of a contract, served from the contract registry while fresh,
+        otherwise requested. refresh forces a new request. The first match is returned
+        if contract is ambiguous, None if it is unknown; only an unambiguous match is
+        recorded and resolves contract.
+
+        Args: Contract, refresh
+
+        return: ContractDetails or None
+        '''
+        if not refresh:
+            contractDetail = self.contracts.lookup(contract)
+            if contractDetail is not None:
+                return contractDetail
+
+        timer = self.instrumentation.start("reqContractDetails")
+        timer.sent()
+        try:
+            contractDetail = super().reqContractDetails(contract)
+        except BaseException:
+            timer.done(error=True)
+            raise
+        timer.done(len(contractDetail))
+        return self._recordContractDetails(contract, contractDetail)
+
+    def _recordContractDetails(self, contract: Contract, contractDetail: list):
+        '''
+        First of the matches, recorded in the registry only if it is the single one
+        as in qualifyContractsAsync()
+        '''
+        if not contractDetail:
+            return None
+        if len(contractDetail) == 1:
+            self.contracts.update(contract, contractDetail[0])
+            self.contracts.save()
+        return contractDetail[0]
+
+    async def getContractDetailsAsync(self, contract: Contract, refresh=False) -> ContractDetails:
+        '''
+        Coroutine variant of getContractDetails() built on reqContractDetailsAsync
+        '''
+        if not refresh:
+            contractDetail = self.contracts.lookup(contract)
+            if contractDetail is not None:
+                return contractDetail
+
+        timer = self.instrumentation.start("reqContractDetails")
+        timer.sent()
+        try:
+            contractDetail = await self.reqContractDetailsAsync(contract)
+        except BaseException:
+            timer.done(error=True)
+            raise
+        timer.done(len(contractDetail))
+        return self._recordContractDetails(contract, contractDetail)
+
+    def getTradingCalendar(self, contract: Contract, when=None) -> TradingHoursCalendar:
+        '''
+        Cached session calendar of a contract, contract details are requested
+        only on first use or once the cached week has rolled over
+
+        Args: Contract, datetime the calendar must cover (optional)
+
+        return: TradingHoursCalendar
+        '''
+        key = contractKey(contract)
+        calendar = self.tradingCalendars.get(key)
+        if calendar is not None and (when is None or not calendar.isStale(when)):
+            return calendar
+
+        # request for contract details, a stale calendar means the cached details are stale too
+        refresh = calendar is not None
+        calendar = TradingHoursCalendar(self.getContractDetails(contract, refresh).tradingHours)
+        if not refresh and when is not None and calendar.isStale(when):
+            calendar = TradingHoursCalendar(self.getContractDetails(contract, refresh=True).tradingHours)
+        self.tradingCalendars[key] = calendar
+        return calendar
+
+    async def getTradingCalendarAsync(self, contract: Contract, when=None) -> TradingHoursCalendar:
+        '''
+        Coroutine variant of getTradingCalendar() built on reqContractDetailsAsync
+        '''
+        key = contractKey(contract)
+        calendar = self.tradingCalendars.get(key)
+        if calendar is not None and (when is None or not calendar.isStale(when)):
+            return calendar
+
+        refresh = calendar is not None
+        calendar = TradingHoursCalendar((await self.getContractDetailsAsync(contract, refresh)).tradingHours)
+        if not refresh and when is not None and calendar.isStale(when):
+            calendar = TradingHoursCalendar((await self.getContractDetailsAsync(contract, refresh=True)).tradingHours)
+        self.tradingCalendars[key] = calendar
+        return calendar
+
+    def getSessionTagger(self, contract: Contract) -> SessionTagger:
+        '''
+        Vectorized pre-market / RTH / post-market / closed tagger of a contract,
+        built from its tradingHours and liquidHours
+
+        Args: Contract
+
+        return: SessionTagger, e.g. getSessionTagger(contract).tag(df["date"])
+        '''
+        return SessionTagger.fromContractDetails(self.getContractDetails(contract))
+
     def isRegTradingHour(self, contract: Contract) -> int:
         '''
         Check if a contract under valid trading hour
@@ -81,35 +246,30 @@ class IbInsyncApi(IB):
 
         return: bool (Yes, No)
         '''
-        # request for contract details
-        contractDetail = super().reqContractDetails(contract)
-
-        # Note that tradingHours format:
-        # "%Y%m%d:%H%M-%Y%m%d:%H%M;%Y%m%d:%H%M-%Y%m%d:%H%M:%Y%m%d:%H%M:CLOSED" Format length last for a week
-        # It is being dissected as below
-        tradingHours = contractDetail[0].tradingHours
-        tradingRanges = tradingHours.split(';')
-
         # Convert serverTime string to datetime format
         currTime = self.getCurrTime()
         currTime = datetime.datetime.strptime(currTime, "%Y%m%d %H:%M:%S US/Eastern")
 
-        for tradingRange in tradingRanges:
-            closedKeyword = False
+        # Note that tradingHours format:
+        # "%Y%m%d:%H%M-%Y%m%d:%H%M;%Y%m%d:%H%M-%Y%m%d:%H%M:%Y%m%d:%H%M:CLOSED" Format length last for a week
+        # It is parsed once per contract and week by TradingHoursCalendar
+        calendar = self.getTradingCalendar(contract, currTime)
+        return int(calendar.isOpen(currTime))
 
-            if len(tradingRange) == 0: # string is empty
-                continue
-            if "CLOSED" in tradingRange:
-                closedKeyword = True
-            else:
-                startTime, endTime = tradingRange.split('-')
-                startTime = datetime.datetime.strptime(startTime, "%Y%m%d:%H%M")
-                endTime = datetime.datetime.strptime(endTime, "%Y%m%d:%H%M")
-
-                # Check if current time is within this trading range
-                if not closedKeyword and startTime <= currTime <= endTime:
-                    return 1
-        return 0
+    async def isRegTradingHourAsync(self, contract: Contract) -> int:
+        '''
+        Coroutine variant of isRegTradingHour()
+        '''
+        currTime = datetime.datetime.strptime(await self.getCurrTimeAsync(), "%Y%m%d %H:%M:%S US/Eastern")
+        calendar = await self.getTradingCalendarAsync(contract, currTime)
+        return int(calendar.isOpen(currTime))
+
+    def isRegTradingHourMany(self, contract: Contract, timestamps) -> list:
+        '''
+        Bulk trading hour check of many naive US/Eastern datetimes for one contract.
+        Timestamps outside the cached week are reported as closed.
+        '''
+        return self.getTradingCalendar(contract).isOpenMany(timestamps)
 
     def getHistoricalData(self, period, duration, contract:Contract = None):
         '''
@@ -122,19 +282,320 @@ class IbInsyncApi(IB):
 
         return
             Dataframe of the symbol historical data
+
+        With self.barStore set, only bars missing from the store are requested and
+        the whole window (date and OHLCV columns) is served from disk.
         '''
         if contract is None:
             contract = self.contract
         rth = self.isRegTradingHour(contract)
         currTime = self.getCurrTime()
-        bars = self.reqHistoricalData(contract, currTime, duration, IBKR_PERIOD_MAPPING[period], 'BID', rth, 1, False, [])
-        dataframe = util.df(bars)
+        if self.barStore is not None:
+            dataframe = self._getStoredHistoricalData(contract, period, duration, rth, currTime).to_pandas()
+        else:
+            bars = self._reqHistoricalDataPaced(contract, currTime, duration, IBKR_PERIOD_MAPPING[period], rth)
+            dataframe = util.df(bars)
 
         if dataframe.empty:
             print("[Warning]: getHistoricalData() Historical dataframe is empty.")
 
         return dataframe
 
+    def getHistoricalDataMulti(self, periods, duration, contract:Contract = None) -> dict:
+        '''
+        Historical data of several periods from a single request of the finest one,
+        the coarser periods are resampled locally (bar_resample.BarResampler)
+
+        Args:
+            periods     (IBKR_PERIOD_MAPPING keys, e.g. ["5m", "1h", "1d"])
+            duration    (Duration for the candle)
+            contract    (symbol contract) - default to self.contract
+
+        return
+            {period: Dataframe of the symbol historical data}
+        '''
+        if contract is None:
+            contract = self.contract
+        seconds = {period: barSizeSeconds(IBKR_PERIOD_MAPPING[period]) for period in periods}
+        finest = min(seconds, key=seconds.get)
+        rth = self.isRegTradingHour(contract)
+        currTime = self.getCurrTime()
+        if self.barStore is not None:
+            bars = self._getStoredHistoricalData(contract, finest, duration, rth, currTime)
+        else:
+            bars = BarBuffer.from_bars(self._reqHistoricalDataPaced(contract, currTime, duration,
+                                                                    IBKR_PERIOD_MAPPING[finest], rth))
+        resampler = BarResampler(seconds, seconds[finest])
+        resampler.update(bars)
+        return {period: buffer.to_pandas() for period, buffer in resampler.bars.items()}
+
+    def _historicalRequestKeys(self, contract, endDateTime, duration, barSize, rth):
+        '''
+        (requestKey, contractKey) the pacing governor tracks a historical request under
+        '''
+        symbol = contractSymbol(contract)
+        return (symbol, endDateTime, duration, barSize, 'BID', rth), (symbol, 'BID')
+
+    def _reqHistoricalDataPaced(self, contract, endDateTime, duration, barSize, rth):
+        '''
+        reqHistoricalData routed through the pacing governor, identical
+        requests in flight share one response as in _reqHistoricalDataPacedAsync()
+        '''
+        requestKey, sameContractKey = self._historicalRequestKeys(contract, endDateTime, duration, barSize, rth)
+        future, isNew = self.pacing.claim(requestKey)
+        if not isNew:
+            # The owner may be a coroutine on this event loop, run it until the response is in
+            return self.run(asyncio.wrap_future(future, loop=util.getLoop()))
+        timer = self.instrumentation.start("reqHistoricalData")
+        try:
+            self.pacing.acquire(requestKey, sameContractKey)
+            timer.sent()
+            bars = self.reqHistoricalData(contract, endDateTime, duration, barSize, 'BID', rth, 1, False, [])
+        except BaseException as exception:
+            timer.done(error=True)
+            future.set_exception(exception)
+            raise
+        timer.done(len(bars))
+        future.set_result(bars)
+        return bars
+
+    def _getStoredHistoricalData(self, contract, period, duration, rth, currTime) -> BarBuffer:
+        '''
+        Gap-fill the bar store up to currTime and read the window back
+        '''
+        now = parseBarDate(currTime)
+
+        def fetch(gapStart, gapEnd):
+            bars = self._reqHistoricalDataPaced(contract, currTime, durationString(now - gapStart),
+                                                IBKR_PERIOD_MAPPING[period], rth)
+            return BarBuffer.from_bars(bars)
+
+        return self.barStore.fill(
+            "ibkr", contractSymbol(contract), f"{period}-BID-{'rth' if rth else 'all'}",
+            now - durationSeconds(duration), now, fetch,
+            completeUntil=now - barSizeSeconds(IBKR_PERIOD_MAPPING[period]), mergeGaps=True)
+
+    async def getHistoricalDataAsync(self, period, duration, contract:Contract = None):
+        '''
+        Coroutine variant of getHistoricalData() built on reqHistoricalDataAsync,
+        so many requests can share the ib_insync event loop
+        '''
+        if contract is None:
+            contract = self.contract
+        rth = await self.isRegTradingHourAsync(contract)
+        currTime = await self.getCurrTimeAsync()
+        if self.barStore is not None:
+            buffer = await self._getStoredHistoricalDataAsync(contract, period, duration, rth, currTime)
+            dataframe = buffer.to_pandas()
+        else:
+            bars = await self._reqHistoricalDataPacedAsync(contract, currTime, duration, IBKR_PERIOD_MAPPING[period], rth)
+            dataframe = util.df(bars)
+
+        if dataframe is None or dataframe.empty:
+            print(f"[Warning]: getHistoricalDataAsync() Historical dataframe of {contract.symbol} is empty.")
+            dataframe = pd.DataFrame() if dataframe is None else dataframe
+
+        return dataframe
+
+    async def getHistoricalDataManyAsync(self, contracts, period, duration, maxConcurrency=10, concat=False):
+        '''
+        Fetch historical data of many contracts concurrently
+
+        Args:
+            contracts       (list of contracts)
+            period          (candle stick pattern)
+            duration        (Duration for the candle)
+            maxConcurrency  (requests awaiting a response at once)
+            concat          (return one frame with symbol and job columns instead of a dict)
+
+        return
+            {position in contracts: Dataframe}, or one Dataframe when concat whose job
+            column is that position, so contracts sharing a symbol (e.g. two expiries)
+            stay apart. A contract whose request failed is reported and left out.
+        '''
+        contracts = list(contracts)
+        semaphore = asyncio.Semaphore(maxConcurrency)
+
+        async def fetch(contract):
+            async with semaphore:
+                return await self.getHistoricalDataAsync(period, duration, contract)
+
+        results = await asyncio.gather(*(fetch(contract) for contract in contracts), return_exceptions=True)
+
+        frames = {}
+        for index, (contract, result) in enumerate(zip(contracts, results)):
+            if isinstance(result, BaseException):
+                print(f"[Warning]: getHistoricalDataManyAsync() {contract.symbol} failed: {result!r}")
+                continue
+            frames[index] = result
+
+        if not concat:
+            return frames
+        if not frames:
+            return pd.DataFrame()
+        dataframe = pd.concat(frames, names=["job", None]).reset_index(level="job")
+        dataframe.insert(0, "symbol", [contracts[index].symbol for index in dataframe["job"]])
+        return dataframe.reset_index(drop=True)
+
+    def getHistoricalDataMany(self, contracts, period, duration, maxConcurrency=10, concat=False):
+        '''
+        Blocking wrapper of getHistoricalDataManyAsync(), runs the requests on the ib_insync event loop
+        '''
+        return self.run(self.getHistoricalDataManyAsync(contracts, period, duration, maxConcurrency, concat))
+
+    async def backfillHistoricalDataAsync(self, period, duration, contract:Contract = None, maxConcurrency=10,
+                                          checkpoint=None) -> BarBuffer:
+        '''
+        Historical data of a span longer than one request may cover (e.g. "5m" over "2 Y"),
+        split into legal chunks walking back from the server time and requested
+        concurrently within pacing limits (ib_backfill)
+
+        Args:
+            period          (candle stick pattern)
+            duration        (Duration for the candle, e.g. "2 Y")
+            contract        (symbol contract) - default to self.contract
+            maxConcurrency  (chunks requested at once)
+            checkpoint      (BarStore finished chunks are written to, default self.barStore,
+                             a rerun only requests the ranges still missing)
+
+        return
+            BarBuffer of the whole span, ordered and de-duplicated (.to_pandas() for a Dataframe)
+
+        Raises BackfillError once all chunks were tried and some failed
+        '''
+        if contract is None:
+            contract = self.contract
+        barSize = IBKR_PERIOD_MAPPING[period]
+        currTime = await self.getCurrTimeAsync()
+        now = parseBarDate(currTime)
+        zone = currTime.rsplit(" ", 1)[1]
+        start = now - durationSeconds(duration)
+        rth = await self.isRegTradingHourAsync(contract)
+        store = checkpoint if checkpoint is not None else self.barStore
+        key = ("ibkr", contractSymbol(contract), f"{period}-BID-{'rth' if rth else 'all'}")
+        chunks = planMissing(store, key, start, now, barSize) if store is not None else planChunks(start, now, barSize)
+        completeUntil = now - barSizeSeconds(barSize)
+        semaphore = asyncio.Semaphore(maxConcurrency)
+
+        async def fetch(chunk):
+            async with semaphore:
+                bars = await self._reqHistoricalDataPacedAsync(contract, formatEndDateTime(chunk.end, zone),
+                                                               chunk.duration, barSize, rth)
+            bars = BarBuffer.from_bars(bars)
+            if store is not None:
+                store.write(*key, bars, covered=(chunk.start, min(chunk.end, completeUntil)))
+            return bars
+
+        results = await asyncio.gather(*(fetch(chunk) for chunk in chunks), return_exceptions=True)
+        errors = [(chunk, result) for chunk, result in zip(chunks, results) if isinstance(result, BaseException)]
+        if store is not None:
+            bars = store.read(*key, start, now)
+        else:
+            bars = stitchBars(result for result in results if not isinstance(result, BaseException))
+        if errors:
+            raise BackfillError(errors, bars)
+        return bars
+
+    def backfillHistoricalData(self, period, duration, contract:Contract = None, maxConcurrency=10,
+                               checkpoint=None) -> BarBuffer:
+        '''
+        Blocking wrapper of backfillHistoricalDataAsync(), runs the requests on the ib_insync event loop
+        '''
+        return self.run(self.backfillHistoricalDataAsync(period, duration, contract, maxConcurrency, checkpoint))
+
+    async def _reqHistoricalDataPacedAsync(self, contract, endDateTime, duration, barSize, rth):
+        '''
+        reqHistoricalDataAsync routed through the pacing governor, identical
+        requests in flight share one response
+        '''
+        requestKey, sameContractKey = self._historicalRequestKeys(contract, endDateTime, duration, barSize, rth)
+        future, isNew = self.pacing.claim(requestKey)
+        if not isNew:
+            return await asyncio.wrap_future(future)
+        timer = self.instrumentation.start("reqHistoricalData")
+        try:
+            await self.pacing.acquireAsync(requestKey, sameContractKey)
+            timer.sent()
+            bars = await self.reqHistoricalDataAsync(contract, endDateTime, duration, barSize, 'BID', rth, 1, False, [])
+        except BaseException as exception:
+            timer.done(error=True)
+            future.set_exception(exception)
+            raise
+        timer.done(len(bars))
+        future.set_result(bars)
+        return bars
+
+    async def _getStoredHistoricalDataAsync(self, contract, period, duration, rth, currTime) -> BarBuffer:
+        '''
+        Coroutine variant of _getStoredHistoricalData()
+        '''
+        now = parseBarDate(currTime)
+
+        async def fetch(gapStart, gapEnd):
+            bars = await self._reqHistoricalDataPacedAsync(contract, currTime, durationString(now - gapStart),
+                                                           IBKR_PERIOD_MAPPING[period], rth)
+            return BarBuffer.from_bars(bars)
+
+        return await self.barStore.fillAsync(
+            "ibkr", contractSymbol(contract), f"{period}-BID-{'rth' if rth else 'all'}",
+            now - durationSeconds(duration), now, fetch,
+            completeUntil=now - barSizeSeconds(IBKR_PERIOD_MAPPING[period]), mergeGaps=True)
+
+    def subscribeRealTimeBars(self, contract: Contract, whatToShow='TRADES', useRTH=False) -> RealTimeBarList:
+        '''
+        Subscribe to 5 second real-time bars, aggregated into every IBKR_PERIOD_MAPPING period.
+        Read with self.realtime.latestBar / partialBar / bars(contractSymbol(contract), period)
+        Cancel with self.cancelRealTimeBars(bars)
+        '''
+        symbol = contractSymbol(contract)
+        self.realtime.stream(symbol, sourcePeriod=5)
+
+        def onUpdate(bars, hasNewBar):
+            if hasNewBar:
+                bar = bars[-1]
+                self.realtime.onBar(symbol, wallClockSeconds(bar.time), bar.open_, bar.high, bar.low,
+                                    bar.close, bar.volume)
+
+        bars = self.reqRealTimeBars(contract, 5, whatToShow, useRTH)
+        bars.updateEvent += onUpdate
+        return bars
+
+    def subscribeHistoricalUpdates(self, contract: Contract, period, duration='1 D', whatToShow='BID') -> BarDataList:
+        '''
+        keepUpToDate historical bars of period, the forming bar is revised in place
+        and aggregated into the coarser IBKR_PERIOD_MAPPING periods.
+        Cancel with self.cancelHistoricalData(bars)
+        '''
+        symbol = contractSymbol(contract)
+        self.realtime.stream(symbol, sourcePeriod=barSizeSeconds(IBKR_PERIOD_MAPPING[period]))
+
+        def onBar(bar):
+            self.realtime.onBar(symbol, parseBarDate(bar.date), bar.open, bar.high, bar.low,
+                                bar.close, bar.volume, revision=True)
+
+        bars = self.reqHistoricalData(contract, '', duration, IBKR_PERIOD_MAPPING[period], whatToShow, False, 1, True, [])
+        for bar in bars:
+            onBar(bar)
+        bars.updateEvent += lambda bars, hasNewBar: onBar(bars[-1])
+        return bars
+
+    def subscribeMarketData(self, contract: Contract, genericTickList='') -> Ticker:
+        '''
+        Streaming bid/ask/last ticks, read with self.realtime.latestQuote(contractSymbol(contract))
+        Cancel with self.cancelMktData(contract)
+        '''
+        symbol = contractSymbol(contract)
+        self.realtime.stream(symbol)
+
+        def onUpdate(ticker):
+            time = wallClockSeconds(ticker.time) if ticker.time else None
+            for tick in ticker.ticks:
+                self.realtime.onTickData(symbol, time, tick.tickType, tick.price, tick.size)
+
+        ticker = self.reqMktData(contract, genericTickList, False, False)
+        ticker.updateEvent += onUpdate
+        return ticker
+
     def getAccountSummary(self) -> list:
         '''
         Portfolio viewing API: get portfolio summary only using tags as input via .reqAccountSummary with 
@@ -151,48 +612,107 @@ class IbInsyncApi(IB):
             accSum = self.accountSummary(accountName[0])
         except Exception as e:
             print(e)
+            raise
         return accSum
 
-    def getAccountSummaryDf(self) -> list:
+    def _onAccountValue(self, accountValue: AccountValue) -> None:
+        self.accountStore.updateValue(accountValue.account, accountValue.tag, accountValue.value,
+                                      accountValue.currency, accountValue.modelCode)
+
+    def _onPortfolioItem(self, item: PortfolioItem) -> None:
+        self.accountStore.updatePosition(item.account, item.contract, item.position, item.marketPrice,
+                                         item.marketValue, item.averageCost, item.unrealizedPNL, item.realizedPNL)
+
+    def _primeAccountStore(self) -> None:
+        '''
+        Seed the account cache once, the summary subscription started here keeps it current
+        '''
+        for accountValue in self.accountValues():
+            self._onAccountValue(accountValue)
+        for accountValue in self.getAccountSummary():
+            self._onAccountValue(accountValue)
+
+    def _accountValue(self, tag: str) -> float:
+        value = self.accountStore.value(tag)
+        if value is None:
+            self._primeAccountStore()
+            value = self.accountStore.value(tag)
+        assert value is not None, f"{tag} not found in the account summary."
+        return value
+
+    def getAccountSummaryDf(self) -> pd.DataFrame:
         '''
-        get account summary in dataframe
+        get account summary in dataframe, built from the account cache
         '''
-        accSum = self.getAccountSummary()
-        # Convert AccountValue objects to dictionaries
-        accSumDicts = [{'account': av.account,
-                        'tag': av.tag,
-                        'value': av.value,
-                        'currency': av.currency,
-                        'modelCode': av.modelCode} for av in accSum]
-        accSumDf = pd.DataFrame(accSumDicts)
+        if not len(self.accountStore):
+            self._primeAccountStore()
+        accSumDf = pd.DataFrame(self.accountStore.rows(), columns=['account', 'tag', 'value', 'currency', 'modelCode'])
         assert accSumDf is not None, "accSumDf is empty"
         return accSumDf
-    
+
     def getCashVal(self) -> float:
         '''
         get current cash value, how much available to buy
+        Served from the account cache, see self.accountStore.age() for staleness
         '''
-        accsum = self.getAccountSummary()
-        cashValue = float(next((value for value in accsum if value.tag == 'AvailableFunds'), None).value)
-
-        assert cashValue is not None, "Total Cash Value not found in the list."
-        return cashValue
+        return self._accountValue('AvailableFunds')
 
     def getTotalCashVal(self) -> float:
         '''
         get total portfolio value, how much we have
+        Served from the account cache, see self.accountStore.age() for staleness
+        '''
+        return self._accountValue('TotalCashValue')
+
+    def _reserveOrderIds(self, count: int) -> range:
+        '''
+        Consecutive order ids taken from the client sequence (seeded by nextValidId),
+        contiguous because the event loop is single-threaded
+        '''
+        first = self.client.getReqId()
+        for _ in range(count - 1):
+            self.client.getReqId()
+        return range(first, first + count)
+
+    def _buildBracket(self, parentId, action, quantity, limitPrice, takeProfitPrice, stopLossPrice) -> BracketOrder:
+        parent, takeProfit, stopLoss = self.bracketOrder(
+            action, quantity, limitPrice, takeProfitPrice, stopLossPrice, False,
+            orderIds=range(parentId, parentId + 3))
+        # Sending the last child transmits the whole bracket
+        stopLoss.transmit = True
+        return BracketOrder(parent, takeProfit, stopLoss)
+
+    def _onOrderAck(self, trade: Trade) -> None:
+        self.orderEngine.onAck(trade.order.orderId, trade.orderStatus.status)
+
+    def placeBrackets(self, brackets) -> list:
+        '''
+        Place a batch of brackets with one contiguous order id block
+
+        Args:
+            brackets: iterable of order_engine.Bracket(contract, action, quantity,
+                      limitPrice, takeProfitPrice, stopLossPrice)
+
+        return: list of BracketOrder
+        '''
+        return [BracketOrder(*orders) for orders in self.orderEngine.placeBrackets(brackets)]
+
+    def waitOrderAcks(self, orderIds=None, timeout=10.0) -> bool:
+        '''
+        Run the event loop until TWS acknowledged orderIds (default all placed orders),
+        latencies are then in self.orderEngine.latencies()
         '''
-        # Finding AccountValue with tag equal to 'TotalCashValue'
-        accsum = self.getAccountSummary()
-        totalCashValue = float(next((value for value in accsum if value.tag == 'TotalCashValue'), None).value)
+        deadline = systime.monotonic() + timeout
+        while not self.orderEngine.acked(orderIds):
+            if systime.monotonic() >= deadline:
+                return False
+            self.sleep(0.001)
+        return True
 
-        assert totalCashValue is not None, "Total Cash Value not found in the list."
-        return totalCashValue
-    
     def bracketOrder(
             self, action: str, quantity: float,
             limitPrice: float, takeProfitPrice: float,
-            stopLossPrice: float, transmit : bool, **kwargs) -> BracketOrder:
+            stopLossPrice: float, transmit : bool, orderIds=None, **kwargs) -> BracketOrder:
         """
         ###############################################
          Override parent class bracket order function 
@@ -213,23 +733,25 @@ class IbInsyncApi(IB):
             limitPrice: Limit price of entry order.
             takeProfitPrice: Limit price of profit order.
             stopLossPrice: Stop price of loss order.
+            orderIds: three consecutive order ids, default reserved from the client sequence.
         """
         assert action in ('BUY', 'SELL')
         reverseAction = 'BUY' if action == 'SELL' else 'SELL'
+        parentId, takeProfitId, stopLossId = orderIds if orderIds is not None else self._reserveOrderIds(3)
         parent = LimitOrder(
             action, quantity, limitPrice,
-            orderId=self.client.getReqId(),
+            orderId=parentId,
             transmit=transmit,
             **kwargs)
         takeProfit = LimitOrder(
             reverseAction, quantity, takeProfitPrice,
-            orderId=self.client.getReqId(),
+            orderId=takeProfitId,
             transmit=transmit,
             parentId=parent.orderId,
             **kwargs)
         stopLoss = StopOrder(
             reverseAction, quantity, stopLossPrice,
-            orderId=self.client.getReqId(),
+            orderId=stopLossId,
             transmit=transmit,
             parentId=parent.orderId,
             **kwargs)
@@ -0,0 +1,203 @@
+"""
+IB historical-data pacing
+
+Interactive Brokers answers historical requests with a pacing violation
+(error 162) and a penalty box when any of these rules is broken:
+  - more than 60 requests within any 10 minute window
+  - an identical request within 15 seconds
+  - six or more requests for the same contract, exchange and tick type
+    within 2 seconds
+It also allows at most 50 simultaneously open historical requests.
+
+IbkrApi and IbInsyncApi route every reqHistoricalData through one governor,
+which delays each request just long enough to satisfy all rules and lets
+identical requests that are still in flight share one response.
+
+Checkout IBKR historical limitations:
+https://interactivebrokers.github.io/tws-api/historical_limitations.html
+"""
+
+from collections import deque
+from concurrent.futures import Future
+import asyncio
+import threading
+import time as systime
+
+MAX_REQUESTS_PER_WINDOW = 60
+PACING_WINDOW_SEC = 600.0
+IDENTICAL_REQUEST_INTERVAL_SEC = 15.0
+MAX_SAME_CONTRACT_REQUESTS = 5
+SAME_CONTRACT_WINDOW_SEC = 2.0
+MAX_SIMULTANEOUS_HISTORICAL_REQUESTS = 50
+
+
+class PacingGovernor:
+    """
+    Sliding-window scheduler for historical data requests.
+
+    requestKey identifies a request (contract, end, duration, bar size, tick type,
+    useRTH), contractKey the (contract/exchange, tick type) pair it counts against.
+    Both are optional, without them only the global window applies.
+    """
+
+    def __init__(self, maxRequests: int = MAX_REQUESTS_PER_WINDOW,
+                 window: float = PACING_WINDOW_SEC,
+                 identicalInterval: float = IDENTICAL_REQUEST_INTERVAL_SEC,
+                 contractMaxRequests: int = MAX_SAME_CONTRACT_REQUESTS,
+                 contractWindow: float = SAME_CONTRACT_WINDOW_SEC,
+                 clock=systime.monotonic, sleep=systime.sleep):
+        self.maxRequests = maxRequests
+        self.window = window
+        self.identicalInterval = identicalInterval
+        self.contractMaxRequests = contractMaxRequests
+        self.contractWindow = contractWindow
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+        self.sentTimes = deque()
+        self.identicalSent = {}     # requestKey -> last send time
+        self.contractSent = {}      # contractKey -> deque of send times
+        self.inFlight = {}          # requestKey -> Future shared by identical requests
+
+        # Metrics
+        self.queueDepth = 0
+        self.sent = 0
+        self.deduplicated = 0
+        self.totalWait = 0.0
+        self.maxWait = 0.0
+        self.lastWait = 0.0
+
+    def _expire(self, now: float) -> None:
+        while self.sentTimes and now - self.sentTimes[0] >= self.window:
+            self.sentTimes.popleft()
+        for key in [key for key, sentAt in self.identicalSent.items()
+                    if now - sentAt >= self.identicalInterval]:
+            del self.identicalSent[key]
+        for key in list(self.contractSent):
+            times = self.contractSent[key]
+            while times and now - times[0] >= self.contractWindow:
+                times.popleft()
+            if not times:
+                del self.contractSent[key]
+
+    def _delayLocked(self, now: float, requestKey, contractKey) -> float:
+        self._expire(now)
+        wait = 0.0
+        if len(self.sentTimes) >= self.maxRequests:
+            wait = self.sentTimes[0] + self.window - now
+        if requestKey is not None and requestKey in self.identicalSent:
+            wait = max(wait, self.identicalSent[requestKey] + self.identicalInterval - now)
+        if contractKey is not None:
+            times = self.contractSent.get(contractKey)
+            if times is not None and len(times) >= self.contractMaxRequests:
+                wait = max(wait, times[0] + self.contractWindow - now)
+        return max(0.0, wait)
+
+    def _recordLocked(self, now: float, requestKey, contractKey) -> None:
+        self.sentTimes.append(now)
+        if requestKey is not None:
+            self.identicalSent[requestKey] = now
+        if contractKey is not None:
+            self.contractSent.setdefault(contractKey, deque()).append(now)
+        self.sent += 1
+
+    def _recordWait(self, waited: float) -> None:
+        self.totalWait += waited
+        self.lastWait = waited
+        self.maxWait = max(self.maxWait, waited)
+
+    def delay(self, requestKey=None, contractKey=None) -> float:
+        """
+        Seconds until this request may be sent without breaking any rule (0 if now).
+        """
+        with self.lock:
+            return self._delayLocked(self.clock(), requestKey, contractKey)
+
+    def acquire(self, requestKey=None, contractKey=None) -> float:
+        """
+        Block until the request may be sent, record it as sent and return the wait.
+        """
+        start = self.clock()
+        with self.lock:
+            self.queueDepth += 1
+        try:
+            while True:
+                with self.lock:
+                    now = self.clock()
+                    wait = self._delayLocked(now, requestKey, contractKey)
+                    if wait <= 0:
+                        self._recordLocked(now, requestKey, contractKey)
+                        self._recordWait(now - start)
+                        return now - start
+                self.sleep(wait)
+        finally:
+            with self.lock:
+                self.queueDepth -= 1
+
+    async def acquireAsync(self, requestKey=None, contractKey=None) -> float:
+        """
+        Coroutine variant of acquire() for asyncio callers.
+        """
+        start = self.clock()
+        with self.lock:
+            self.queueDepth += 1
+        try:
+            while True:
+                with self.lock:
+                    now = self.clock()
+                    wait = self._delayLocked(now, requestKey, contractKey)
+                    if wait <= 0:
+                        self._recordLocked(now, requestKey, contractKey)
+                        self._recordWait(now - start)
+                        return now - start
+                await asyncio.sleep(wait)
+        finally:
+            with self.lock:
+                self.queueDepth -= 1
+
+    def claim(self, requestKey):
+        """
+        De-duplicate identical in-flight requests.
+        Returns (future, isNew): when isNew the caller must send the request and
+        resolve future, otherwise future belongs to an identical request in flight.
+        """
+        with self.lock:
+            future = self.inFlight.get(requestKey)
+            if future is not None and not future.done():
+                self.deduplicated += 1
+                return future, False
+            future = Future()
+            self.inFlight[requestKey] = future
+        future.add_done_callback(lambda done: self._release(requestKey, done))
+        return future, True
+
+    def isInFlight(self, requestKey) -> bool:
+        """
+        True if claim(requestKey) would share the response of a request in flight.
+        """
+        with self.lock:
+            future = self.inFlight.get(requestKey)
+            return future is not None and not future.done()
+
+    def _release(self, requestKey, future) -> None:
+        with self.lock:
+            if self.inFlight.get(requestKey) is future:
+                del self.inFlight[requestKey]
+
+    def stats(self) -> dict:
+        """
+        Queue depth, requests in the current window and wait times in seconds.
+        """
+        with self.lock:
+            self._expire(self.clock())
+            return {
+                "queueDepth": self.queueDepth,
+                "inFlight": len(self.inFlight),
+                "windowRequests": len(self.sentTimes),
+                "sent": self.sent,
+                "deduplicated": self.deduplicated,
+                "totalWait": self.totalWait,
+                "maxWait": self.maxWait,
+                "lastWait": self.lastWait,
+            }
@@ -0,0 +1,268 @@
+"""
+Real-time bar and tick pipeline
+
+Per-symbol fixed-size ring buffers fed by reqRealTimeBars or keepUpToDate
+historical bars (one bar source per symbol), with incremental aggregation into
+the periods of IBKR_PERIOD_MAPPING as updates arrive, plus a latest-quote
+snapshot fed by reqMktData ticks.
+
+Writers are the API reader thread (IbkrApi) or event loop (IbInsyncApi).
+Readers normally take no lock: quote and partial-bar snapshots are immutable
+tuples swapped in by a single assignment, and ring reads use a sequence counter
+and retry, yielding to the writer, if a write overlapped the copy. Only after
+SNAPSHOT_RETRIES overlapped attempts does a read wait for the ring's write lock.
+
+Bar times follow the BarBuffer convention: int64 wall-clock seconds in the
+exchange time zone, so buckets line up with session days.
+"""
+
+from collections import namedtuple
+import datetime
+import threading
+import time as systime
+
+import numpy as np
+
+from bar_buffer import BAR_COLUMNS, BarBuffer
+from ib_clock import US_EASTERN
+
+Bar = namedtuple("Bar", ["time", "open", "high", "low", "close", "volume"])
+Quote = namedtuple("Quote", ["time", "bid", "ask", "last", "bidSize", "askSize", "lastSize"])
+
+# reqMktData tick types: https://interactivebrokers.github.io/tws-api/tick_types.html
+TICK_BID_SIZE, TICK_BID, TICK_ASK, TICK_ASK_SIZE, TICK_LAST, TICK_LAST_SIZE = 0, 1, 2, 3, 4, 5
+DELAYED_TICKS = {66: TICK_BID, 67: TICK_ASK, 68: TICK_LAST,
+                 69: TICK_BID_SIZE, 70: TICK_ASK_SIZE, 71: TICK_LAST_SIZE}
+QUOTE_FIELDS = {TICK_BID: "bid", TICK_ASK: "ask", TICK_LAST: "last",
+                TICK_BID_SIZE: "bidSize", TICK_ASK_SIZE: "askSize", TICK_LAST_SIZE: "lastSize"}
+SIZE_TICKS = {TICK_BID_SIZE, TICK_ASK_SIZE, TICK_LAST_SIZE}
+
+EMPTY_QUOTE = Quote(None, None, None, None, None, None, None)
+
+# Lock-free ring read attempts before a snapshot waits for the write lock instead
+SNAPSHOT_RETRIES = 8
+
+
+def wallClockSeconds(epoch, tz=US_EASTERN) -> int:
+    """
+    Convert epoch seconds (or an aware datetime) to wall-clock seconds in tz.
+    """
+    if isinstance(epoch, datetime.datetime):
+        epoch = epoch.timestamp()
+    offset = datetime.datetime.fromtimestamp(epoch, tz).utcoffset()
+    return int(epoch + offset.total_seconds())
+
+
+def _merge(bar: Bar, other: Bar) -> Bar:
+    return Bar(bar.time, bar.open, max(bar.high, other.high), min(bar.low, other.low),
+               other.close, bar.volume + other.volume)
+
+
+class BarRing:
+    """
+    Fixed-size columnar ring of bars, overwriting the oldest.
+    Single writer, any number of readers that only block on repeated overlaps.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = max(1, capacity)
+        self._time = np.zeros(self.capacity, dtype=np.int64)
+        self._values = np.zeros((len(BAR_COLUMNS), self.capacity), dtype=np.float64)
+        self.count = 0      # bars ever written
+        self._seq = 0       # odd while a write is in progress
+        self.last = None    # latest Bar, swapped in atomically
+        self.lock = threading.Lock()    # held by writes, taken by readers only as a fallback
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, bar: Bar) -> None:
+        with self.lock:
+            index = self.count % self.capacity
+            self._seq += 1
+            self._time[index] = bar.time
+            self._values[:, index] = bar[1:]
+            self.count += 1
+            self._seq += 1
+            self.last = bar
+
+    def replaceLast(self, bar: Bar) -> None:
+        """
+        Overwrite the most recent bar, for revisions of the same bar time.
+        """
+        if not self.count:
+            return self.append(bar)
+        with self.lock:
+            index = (self.count - 1) % self.capacity
+            self._seq += 1
+            self._time[index] = bar.time
+            self._values[:, index] = bar[1:]
+            self._seq += 1
+            self.last = bar
+
+    def snapshot(self, n: int = None) -> BarBuffer:
+        """
+        Copy of the last n (default all retained) bars in time order.
+        """
+        for _ in range(SNAPSHOT_RETRIES):
+            seq = self._seq
+            if not seq % 2:
+                time, values = self._copy(n)
+                if self._seq == seq:
+                    break
+            # Let the writer finish instead of spinning through the switch interval
+            systime.sleep(0)
+        else:
+            with self.lock:
+                time, values = self._copy(n)
+        buffer = BarBuffer(len(time))
+        buffer.extend(time, *values)
+        return buffer
+
+    def _copy(self, n: int = None) -> tuple:
+        count = self.count
+        size = min(count, self.capacity) if n is None else min(n, count, self.capacity)
+        indices = np.arange(count - size, count) % self.capacity
+        return self._time[indices], self._values[:, indices]
+
+
+class BarAggregator:
+    """
+    Incrementally aggregates source bars into one period.
+
+    The latest source bar may be revised (keepUpToDate updates), so the bucket is
+    kept as the merge of its finished source bars plus the current source bar.
+    """
+
+    def __init__(self, period: int, ring: BarRing):
+        self.period = period
+        self.ring = ring
+        self.bucket = None      # bucket start time
+        self.closed = None      # merge of finished source bars in the bucket
+        self.open = None        # current (revisable) source bar
+        self.partial = None     # published merge of closed and open
+
+    def _roll(self, time: int) -> None:
+        bucket = time - time % self.period
+        if bucket == self.bucket:
+            return
+        if self.partial is not None:
+            self.ring.append(self.partial)
+        self.bucket, self.closed, self.open, self.partial = bucket, None, None, None
+
+    def _publish(self) -> None:
+        parts = [part for part in (self.closed, self.open) if part is not None]
+        partial = parts[0] if len(parts) == 1 else _merge(*parts)
+        self.partial = partial._replace(time=self.bucket)
+
+    def addBar(self, bar: Bar, revision: bool = False) -> None:
+        """
+        Add a source bar. revision=True replaces the current source bar if it has
+        the same time (keepUpToDate), otherwise the current one is finished first.
+        """
+        self._roll(bar.time)
+        if self.open is not None and not (revision and self.open.time == bar.time):
+            self.closed = self.open if self.closed is None else _merge(self.closed, self.open)
+        self.open = bar
+        self._publish()
+
+
+class SymbolStream:
+    """
+    Ring buffers, aggregators and latest quote of one symbol.
+    """
+
+    def __init__(self, periods: dict, sourcePeriod: int, ringSize: int):
+        self.source = BarRing(ringSize)
+        self.quote = EMPTY_QUOTE
+        self.aggregators = {name: BarAggregator(seconds, BarRing(ringSize))
+                            for name, seconds in periods.items() if seconds >= sourcePeriod}
+
+    def addBar(self, bar: Bar, revision: bool) -> None:
+        last = self.source.last
+        if revision and last is not None and last.time == bar.time:
+            self.source.replaceLast(bar)
+        else:
+            self.source.append(bar)
+        for aggregator in self.aggregators.values():
+            aggregator.addBar(bar, revision)
+
+
+class RealTimeHub:
+    """
+    Per-symbol streams keyed by symbol name.
+    Args:
+        periods:  {name: seconds} to aggregate into, e.g. from IBKR_PERIOD_MAPPING
+        ringSize: bars retained per ring
+    """
+
+    def __init__(self, periods: dict, ringSize: int = 4096):
+        self.periods = dict(periods)
+        self.ringSize = ringSize
+        self.streams = {}
+
+    def stream(self, symbol, sourcePeriod: int = 1) -> SymbolStream:
+        """
+        Stream of symbol, created on first use with aggregators for every period
+        of at least sourcePeriod seconds.
+        """
+        stream = self.streams.get(symbol)
+        if stream is None:
+            stream = SymbolStream(self.periods, sourcePeriod, self.ringSize)
+            self.streams[symbol] = stream
+        return stream
+
+    # Writers
+    def onBar(self, symbol, time: int, open, high, low, close, volume, revision: bool = False) -> None:
+        """
+        A source bar (real-time 5 s bar, or keepUpToDate bar with revision=True).
+        """
+        self.stream(symbol).addBar(Bar(int(time), float(open), float(high), float(low),
+                                       float(close), float(volume)), revision)
+
+    def onTick(self, symbol, time: int, tickType: int, value) -> None:
+        """
+        A reqMktData price or size tick, updates the latest quote snapshot.
+        """
+        tickType = DELAYED_TICKS.get(tickType, tickType)
+        field = QUOTE_FIELDS.get(tickType)
+        if field is None:
+            return
+        stream = self.stream(symbol)
+        stream.quote = stream.quote._replace(time=time, **{field: float(value)})
+
+    def onTickData(self, symbol, time: int, tickType: int, price, size) -> None:
+        """
+        A tick carrying both price and size (ib_insync TickData), the value
+        matching its tick type is used.
+        """
+        normalized = DELAYED_TICKS.get(tickType, tickType)
+        self.onTick(symbol, time, tickType, size if normalized in SIZE_TICKS else price)
+
+    # Non-blocking readers
+    def latestBar(self, symbol):
+        """Latest source Bar of symbol, or None."""
+        stream = self.streams.get(symbol)
+        return None if stream is None else stream.source.last
+
+    def latestQuote(self, symbol) -> Quote:
+        """Latest bid/ask/last snapshot of symbol."""
+        stream = self.streams.get(symbol)
+        return EMPTY_QUOTE if stream is None else stream.quote
+
+    def partialBar(self, symbol, period: str):
+        """Current, still forming bar of period, or None."""
+        stream = self.streams.get(symbol)
+        aggregator = None if stream is None else stream.aggregators.get(period)
+        return None if aggregator is None else aggregator.partial
+
+    def bars(self, symbol, period: str = None, n: int = None) -> BarBuffer:
+        """
+        Last n completed bars of period (default the source bars) as a BarBuffer.
+        """
+        stream = self.streams.get(symbol)
+        if stream is None:
+            return BarBuffer()
+        if period is None:
+            return stream.source.snapshot(n)
+        return stream.aggregators[period].ring.snapshot(n)
@@ -0,0 +1,375 @@
+"""
+Historical replay
+
+Drives the IB wrappers from a BarStore instead of a gateway, so strategies are
+tested against the same calls and return shapes as live code at memory speed:
+
+    IbkrReplayApi      IbkrApi answering reqHistoricalData, reqCurrentTime and
+                       reqContractDetails through its own callbacks
+                       (historicalData / historicalDataEnd, currentTime,
+                       contractDetails / contractDetailsEnd)
+    IbInsyncReplayApi  IbInsyncApi answering reqHistoricalDataAsync with a
+                       BarDataList, reqCurrentTimeAsync and reqContractDetailsAsync
+
+Both keep a simulated server time. replay() walks the stored bars of one or
+more symbols in time order in batches (zero-copy slices of the memory-mapped
+bars.npy files) and moves the time to the close of the last bar of each batch
+before handing it out, as fast as possible (speed=None), at wall-clock pace
+(speed=1) or scaled (speed=60 plays an hour a minute). Requests only ever see
+bars that closed by the simulated time, there is no forming bar and no look-ahead.
+
+Contract details are synthesized for the simulated week (US equity hours by
+default), with the conId and descriptive fields of the contract registry when
+known. Bar times follow the BarBuffer convention: int64 wall-clock seconds in
+US/Eastern.
+"""
+
+from collections import namedtuple
+import asyncio
+import datetime
+import zlib
+import time as systime
+
+import numpy as np
+
+from ibapi.common import BarData
+from ibapi.contract import ContractDetails
+import ib_insync
+
+from bar_buffer import BAR_COLUMNS, BarBuffer, parseBarDate
+from bar_store import barSizeSeconds, contractSymbol, durationSeconds
+from ib_clock import ServerClock, US_EASTERN
+from ib_insync_if import IbInsyncApi
+from ib_pacing import PacingGovernor
+from ib_realtime import wallClockSeconds
+from ibkr_api import IbkrApi, IBKR_PERIOD_MAPPING
+from instrumentation import NULL_TIMER
+from trading_hours import weekdayHours
+
+# Bars per replay batch
+REPLAY_BATCH_SIZE = 65536
+
+# IBKR_PERIOD_MAPPING reversed, "5 mins" -> "5m", to find the stored bars of a request
+PERIOD_OF_BAR_SIZE = {barSize: period for period, barSize in IBKR_PERIOD_MAPPING.items()}
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+# One step of replay(): bars {symbol: BarBuffer} closing at or before time (wall-clock seconds)
+ReplayBatch = namedtuple("ReplayBatch", ["time", "bars"])
+
+
+def wallToEpoch(wallSeconds: int, tz=US_EASTERN) -> float:
+    """
+    Epoch seconds of wall-clock seconds in tz, inverse of ib_realtime.wallClockSeconds
+    """
+    return (_EPOCH + datetime.timedelta(seconds=int(wallSeconds))).replace(tzinfo=tz).timestamp()
+
+
+def unpaced() -> PacingGovernor:
+    """
+    Pacing governor that never waits, replay requests cost nothing
+    """
+    return PacingGovernor(maxRequests=10 ** 9, identicalInterval=0, contractMaxRequests=10 ** 9)
+
+
+class ReplayClock:
+    """
+    Simulated server time in epoch seconds, moved forward by advance().
+    Args:
+        start: epoch seconds the replay starts at
+        speed: None as fast as possible, 1.0 wall-clock pace, k k times faster
+    """
+
+    def __init__(self, start: float, speed: float = None, sleep=systime.sleep, monotonic=systime.monotonic):
+        self.time = float(start)
+        self.speed = speed
+        self.sleep = sleep
+        self.monotonic = monotonic
+        self.anchor = None      # (simulated, monotonic) time pacing is measured from
+
+    def now(self) -> float:
+        return self.time
+
+    def _delay(self, to: float) -> float:
+        if not self.speed:
+            return 0.0
+        if self.anchor is None:
+            self.anchor = (self.time, self.monotonic())
+        return self.anchor[1] + (to - self.anchor[0]) / self.speed - self.monotonic()
+
+    def advance(self, to: float) -> None:
+        """
+        Move the time forward to to, first waiting out the pace if any
+        """
+        delay = self._delay(to)
+        if delay > 0:
+            self.sleep(delay)
+        self.time = max(self.time, float(to))
+
+    async def advanceAsync(self, to: float) -> None:
+        """
+        Coroutine variant of advance(), waits with asyncio.sleep
+        """
+        delay = self._delay(to)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.time = max(self.time, float(to))
+
+
+class ReplayFeed:
+    """
+    Time-ordered batches of stored bars of several (source, symbol, barSize) keys.
+    Args:
+        store:     bar_store.BarStore
+        keys:      {name: (source, symbol, barSize)} of the streams to merge
+        barSeconds: bar length, a bar is handed out once it closed
+        start, end: inclusive wall-clock second bounds of the bar times, default everything
+        batchSize: bars per batch; bars sharing a time are never split over two batches
+    """
+
+    def __init__(self, store, keys: dict, barSeconds: int, start=None, end=None, batchSize: int = REPLAY_BATCH_SIZE):
+        self.barSeconds = barSeconds
+        self.batchSize = max(1, batchSize)
+        self.windows = {name: store.window(*key, start, end) for name, key in keys.items()}
+
+    def __len__(self) -> int:
+        return sum(len(window) for window in self.windows.values())
+
+    def _cuts(self) -> np.ndarray:
+        # Last bar time of every batch
+        windows = [window["time"] for window in self.windows.values() if len(window)]
+        if not windows:
+            return np.empty(0, dtype=np.int64)
+        times = windows[0] if len(windows) == 1 else np.sort(np.concatenate(windows), kind="stable")
+        cuts = times[self.batchSize - 1::self.batchSize]
+        if not cuts.size or cuts[-1] != times[-1]:
+            cuts = np.append(cuts, times[-1])
+        return np.unique(cuts)
+
+    def __iter__(self):
+        offsets = dict.fromkeys(self.windows, 0)
+        for cut in self._cuts():
+            bars = {}
+            for name, window in self.windows.items():
+                stop = int(np.searchsorted(window["time"], cut, side="right"))
+                if stop > offsets[name]:
+                    chunk = window[offsets[name]:stop]
+                    buffer = BarBuffer(len(chunk))
+                    buffer.extend(chunk["time"], *(chunk[column] for column in BAR_COLUMNS))
+                    bars[name] = buffer
+                    offsets[name] = stop
+            yield ReplayBatch(int(cut) + self.barSeconds, bars)
+
+
+class _ReplaySession:
+    """
+    Store lookups and simulated time shared by both replay APIs.
+    """
+
+    def _initReplay(self, store, start, speed, source, regular, extended) -> None:
+        self.replayStore = store
+        self.replaySource = source
+        self.replayHours = (regular, extended)
+        self.replayClock = ReplayClock(wallToEpoch(parseBarDate(start)), speed)
+
+    def replayWallTime(self) -> int:
+        """Simulated server time as wall-clock seconds."""
+        return wallClockSeconds(self.replayClock.now())
+
+    def replayBars(self, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH) -> BarBuffer:
+        """
+        Stored bars a reqHistoricalData would return at the simulated time: bars of
+        durationStr up to endDateTime (default now) that closed by now. RTH requests
+        fall back to the all-hours bars filtered by the session tagger.
+        """
+        barSeconds = barSizeSeconds(barSizeSetting)
+        now = self.replayWallTime()
+        end = now if not endDateTime else min(parseBarDate(endDateTime), now)
+        end = min(end, now - barSeconds)
+        start = end - durationSeconds(durationStr)
+        period, symbol = PERIOD_OF_BAR_SIZE.get(barSizeSetting, barSizeSetting), contractSymbol(contract)
+        key = (self.replaySource, symbol, f"{period}-{whatToShow}-{'rth' if useRTH else 'all'}")
+        bars = self.replayStore.read(*key, start + 1, end)
+        if not len(bars) and useRTH:
+            bars = self.replayStore.read(self.replaySource, symbol, f"{period}-{whatToShow}-all", start + 1, end)
+            view = bars.view()
+            mask = self.replayTagger(contract).rthMask(bars)
+            bars = BarBuffer(int(mask.sum()))
+            bars.extend(*(column[mask] for column in view.values()))
+        return bars
+
+    def replayDetails(self, contract, detailsType):
+        """
+        Contract details of contract for the simulated week: registry fields when
+        known, otherwise a crc32 conId, with synthesized weekday sessions.
+        """
+        details = detailsType()
+        cached = self.contracts.lookup(contract, maxAge=float("inf"))
+        if cached is not None:
+            for name in ("marketName", "minTick", "longName", "timeZoneId", "industry", "category", "subcategory"):
+                setattr(details, name, getattr(cached, name))
+            details.contract = cached.contract
+        else:
+            details.contract = type(contract)()
+            for name in ("symbol", "secType", "exchange", "currency"):
+                setattr(details.contract, name, getattr(contract, name))
+            details.contract.conId = zlib.crc32(contractSymbol(contract).encode()) & 0x7FFFFFFF
+            details.timeZoneId = "US/Eastern"
+        today = (_EPOCH + datetime.timedelta(seconds=self.replayWallTime())).date()
+        regular, extended = self.replayHours
+        lastDay = today + datetime.timedelta(days=6)
+        details.tradingHours = weekdayHours(today, lastDay, extended)
+        details.liquidHours = weekdayHours(today, lastDay, regular)
+        return details
+
+    def _replayKeys(self, contracts, period, rth) -> dict:
+        barSize = f"{period}-BID-{'rth' if rth else 'all'}"
+        return {contractSymbol(contract): (self.replaySource, contractSymbol(contract), barSize) for contract in contracts}
+
+
+class IbkrReplayApi(_ReplaySession, IbkrApi):
+    """
+    IbkrApi replaying a BarStore, no gateway connection.
+    Args:
+        store:    bar_store.BarStore with the bars under the keys the wrappers store them,
+                  ("ibkr", symbol, "<period>-BID-<rth|all>")
+        start:    simulated start time, a bar date ("20240102 09:30:00") or wall-clock seconds
+        speed:    None as fast as possible, 1.0 wall-clock pace, k k times faster
+        source:   store source name
+        regular, extended: (open, close) of the synthesized liquid and trading hours
+        kwargs:   IbkrApi arguments (barStore, contractCache, instrumentation, ...)
+
+        api = IbkrReplayApi(BarStore("bars"), "20240102 09:30:00")
+        contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+        for batch in api.replay([contract], "5m"):
+            strategy.onBars(batch.bars["AAPL-STK-SMART-USD"], api.get_historical_data(contract, "1h", "5 D"))
+    """
+
+    def __init__(self, store, start, speed=None, source="ibkr", regular=("0930", "1600"),
+                 extended=("0400", "2000"), **kwargs):
+        kwargs.setdefault("pacing", unpaced())
+        IbkrApi.__init__(self, "replay", 0, 0, **kwargs)
+        self._initReplay(store, start, speed, source, regular, extended)
+        self.clock = ServerClock(self._fetch_server_time, samples=1, monotonic=self.replayClock.now)
+
+    def isConnected(self):
+        return True
+
+    def replayTagger(self, contract):
+        return self.get_session_tagger(contract)
+
+    def replay(self, contracts, period, rth=False, start=None, end=None, batchSize=REPLAY_BATCH_SIZE):
+        """
+        Iterate ReplayBatch(time, {symbol: BarBuffer}) over the stored period bars of
+        contracts, in time order, with the simulated time moved to each batch's time.
+        """
+        barSeconds = barSizeSeconds(IBKR_PERIOD_MAPPING[period])
+        # By default the bars closing after the current simulated time
+        start = self.replayWallTime() - barSeconds + 1 if start is None else parseBarDate(start)
+        end = None if end is None else parseBarDate(end)
+        for batch in ReplayFeed(self.replayStore, self._replayKeys(contracts, period, rth), barSeconds,
+                                start, end, batchSize):
+            self.replayClock.advance(wallToEpoch(batch.time))
+            yield batch
+
+    def reqCurrentTime(self):
+        self.currentTime(int(self.replayClock.now()))
+
+    def reqContractDetails(self, reqId, contract):
+        self.contractDetails(reqId, self.replayDetails(contract, ContractDetails))
+        self.contractDetailsEnd(reqId)
+
+    def reqHistoricalData(self, reqId, contract, endDateTime, durationStr, barSizeSetting, whatToShow,
+                          useRTH, formatDate, keepUpToDate, chartOptions):
+        bars = self.replayBars(contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH)
+        buffer = self.histBuffers.get(reqId)
+        if buffer is not None and buffer.dates is None and type(self).historicalData is IbkrApi.historicalData:
+            # Same result as the per-bar callbacks, without building a BarData per bar
+            self.requestTimers.get(reqId, NULL_TIMER).firstByte()
+            buffer.extend(*bars.view().values())
+        else:
+            dateFormat = "%Y%m%d" if barSizeSeconds(barSizeSetting) >= 86400 else "%Y%m%d  %H:%M:%S"
+            for time, open, high, low, close, volume in zip(bars.time.tolist(), *(bars.column(name).tolist() for name in BAR_COLUMNS)):
+                bar = BarData()
+                bar.date = (_EPOCH + datetime.timedelta(seconds=time)).strftime(dateFormat)
+                bar.open, bar.high, bar.low, bar.close, bar.volume = open, high, low, close, volume
+                self.historicalData(reqId, bar)
+        self.historicalDataEnd(reqId, "", "")
+
+    def cancelHistoricalData(self, reqId):
+        pass
+
+
+class IbInsyncReplayApi(_ReplaySession, IbInsyncApi):
+    """
+    IbInsyncApi replaying a BarStore, no gateway connection. Arguments as IbkrReplayApi,
+    reqHistoricalData / getHistoricalData return what a live session would.
+    """
+
+    def __init__(self, store, start, speed=None, source="ibkr", regular=("0930", "1600"),
+                 extended=("0400", "2000"), **kwargs):
+        kwargs.setdefault("pacing", unpaced())
+        IbInsyncApi.__init__(self, "replay", 0, 0, **kwargs)
+        self._initReplay(store, start, speed, source, regular, extended)
+        self.clock = ServerClock(lambda: self.replayClock.now(), samples=1, monotonic=self.replayClock.now,
+                                 fetchAsync=self._currentTimeAsync)
+
+    def isConnected(self):
+        return True
+
+    def replayTagger(self, contract):
+        return self.getSessionTagger(contract)
+
+    async def replayAsync(self, contracts, period, rth=False, start=None, end=None, batchSize=REPLAY_BATCH_SIZE,
+                          asBarDataList=False):
+        """
+        Async iterator of ReplayBatch(time, {symbol: bars}), as IbkrReplayApi.replay().
+        asBarDataList hands out each symbol's bars as a BarDataList instead of a BarBuffer.
+        """
+        barSize = IBKR_PERIOD_MAPPING[period]
+        barSeconds = barSizeSeconds(barSize)
+        # By default the bars closing after the current simulated time
+        start = self.replayWallTime() - barSeconds + 1 if start is None else parseBarDate(start)
+        end = None if end is None else parseBarDate(end)
+        for batch in ReplayFeed(self.replayStore, self._replayKeys(contracts, period, rth), barSeconds,
+                                start, end, batchSize):
+            await self.replayClock.advanceAsync(wallToEpoch(batch.time))
+            if asBarDataList:
+                batch = ReplayBatch(batch.time, {symbol: toBarDataList(bars, barSize) for symbol, bars in batch.bars.items()})
+            yield batch
+
+    async def reqCurrentTimeAsync(self):
+        return datetime.datetime.fromtimestamp(int(self.replayClock.now()), datetime.timezone.utc)
+
+    async def reqContractDetailsAsync(self, contract):
+        return [self.replayDetails(contract, ib_insync.ContractDetails)]
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH,
+                                     formatDate=1, keepUpToDate=False, chartOptions=[], timeout=60):
+        bars = self.replayBars(contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH)
+        barDataList = toBarDataList(bars, barSizeSetting)
+        self.reqId += 1
+        barDataList.reqId = self.reqId
+        barDataList.contract = contract
+        barDataList.endDateTime = endDateTime
+        barDataList.durationStr = durationStr
+        barDataList.whatToShow = whatToShow
+        barDataList.useRTH = useRTH
+        barDataList.formatDate = formatDate
+        barDataList.keepUpToDate = keepUpToDate
+        barDataList.chartOptions = chartOptions or []
+        return barDataList
+
+
+def toBarDataList(bars: BarBuffer, barSizeSetting: str) -> ib_insync.BarDataList:
+    """
+    ib_insync BarDataList of a BarBuffer, dates as ib_insync parses formatDate=1:
+    datetime.date for daily bars, naive datetimes otherwise
+    """
+    barDataList = ib_insync.BarDataList()
+    barDataList.barSizeSetting = barSizeSetting
+    daily = barSizeSeconds(barSizeSetting) >= 86400
+    dates = bars.time.astype("datetime64[s]").tolist()
+    for date, open, high, low, close, volume in zip(dates, *(bars.column(name).tolist() for name in BAR_COLUMNS)):
+        barDataList.append(ib_insync.BarData(date.date() if daily else date, open, high, low, close, volume))
+    return barDataList
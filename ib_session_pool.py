@@ -0,0 +1,273 @@
+"""
+IB session pool
+
+One IbkrApi connection decodes every message on its single reader thread and
+sends every request through one socket. IbSessionPool opens several
+connections to the same gateway, each with its own clientId and reader thread,
+and spreads historical and contract-detail requests across them:
+  - each member runs `slots` worker threads, a job goes to an idle worker of
+    the least loaded healthy member (fewest requests in flight)
+  - all members share one PacingGovernor, since IB paces historical requests
+    per gateway, not per connection
+  - a member whose connection drops is reconnected in the background with a
+    fresh IbkrApi; its in-flight jobs fail with ConnectionError and are put
+    back at the front of the queue, so queued work is never lost
+
+    with IbSessionPool("127.0.0.1", 7497, size=4) as pool:
+        futures = [pool.getHistoricalData(contract, "5m", "1 D") for contract in contracts]
+        bars = [future.result() for future in futures]
+"""
+
+from collections import deque
+from concurrent.futures import Future
+import threading
+
+from ib_pacing import PacingGovernor
+from ibkr_api import IbkrApi
+
+RECONNECT_DELAY_SEC = 1.0
+MAX_RECONNECT_DELAY_SEC = 30.0
+
+
+class _Member:
+    """
+    One pooled connection and its counters
+    """
+
+    def __init__(self, clientId: int):
+        self.clientId = clientId
+        self.api = None
+        self.healthy = False
+        self.reconnecting = False
+        self.inFlight = 0
+        self.completed = 0
+        self.failures = 0
+        self.reconnects = 0
+
+
+class _Job:
+    __slots__ = ("fn", "args", "future", "attempts")
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+        self.attempts = 0
+
+
+class IbSessionPool:
+    """
+    Args:
+        host, port:      gateway / TWS address
+        size:            number of connections, clientIds baseClientId .. baseClientId + size - 1
+        baseClientId:    first clientId
+        slots:           concurrent requests per connection
+        timeout:         per-request timeout of every member
+        pacing:          PacingGovernor shared by the members, default a new one
+        maxAttempts:     times a job is tried on a connection that went down before it fails
+        reconnectDelay:  first delay between reconnect attempts, doubled up to MAX_RECONNECT_DELAY_SEC
+        factory:         callable(clientId) returning an unconnected IbkrApi, overrides the above
+        **apiKwargs:     passed on to IbkrApi (barStore, instrumentation, ...)
+
+    Use as a context manager or start() / close().
+    """
+
+    def __init__(self, host, port, size: int = 4, baseClientId: int = 1, slots: int = 4,
+                 timeout: float = 10.0, pacing=None, maxAttempts: int = 3,
+                 reconnectDelay: float = RECONNECT_DELAY_SEC, factory=None, **apiKwargs):
+        self.slots = max(1, slots)
+        self.maxAttempts = max(1, maxAttempts)
+        self.reconnectDelay = reconnectDelay
+        self.pacing = pacing if pacing is not None else PacingGovernor()
+        self.factory = factory or (lambda clientId: IbkrApi(host, port, clientId, timeout=timeout,
+                                                            pacing=self.pacing, **apiKwargs))
+
+        self.members = [_Member(baseClientId + index) for index in range(max(1, size))]
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self.closed = threading.Event()
+        self.workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self) -> "IbSessionPool":
+        """
+        Connect every member, members that fail to connect keep retrying in the background
+        """
+        for member in self.members:
+            api = self._open(member.clientId)
+            with self.cond:
+                if api is not None:
+                    member.api, member.healthy = api, True
+                else:
+                    self._markFailed(member)
+            for slot in range(self.slots):
+                worker = threading.Thread(target=self._work, args=(member,), daemon=True,
+                                          name=f"ib-pool-{member.clientId}-{slot}")
+                worker.start()
+                self.workers.append(worker)
+        return self
+
+    def close(self) -> None:
+        """
+        Stop the workers, cancel queued jobs and disconnect every member
+        """
+        with self.cond:
+            self.closed.set()
+            pending, self.pending = list(self.pending), deque()
+            self.cond.notify_all()
+        for job in pending:
+            job.future.cancel()
+        for member in self.members:
+            if member.api is not None:
+                member.api.disconnect()
+
+    # Dispatch
+    def submit(self, fn, *args) -> Future:
+        """
+        Queue fn(api, *args) for the next free connection, returns a Future of its result
+        """
+        job = _Job(fn, args)
+        with self.cond:
+            if self.closed.is_set():
+                raise RuntimeError("session pool is closed")
+            self.pending.append(job)
+            self.cond.notify_all()
+        return job.future
+
+    def getHistoricalData(self, contract, period, duration, as_records=False) -> Future:
+        """
+        IbkrApi.get_historical_data() on the least loaded connection
+        """
+        return self.submit(lambda api: api.get_historical_data(contract, period, duration, as_records))
+
+    def getContractDetails(self, contract) -> Future:
+        """
+        IbkrApi.get_contract_details() on the least loaded connection
+        """
+        return self.submit(lambda api: api.get_contract_details(contract))
+
+    def stats(self) -> dict:
+        """
+        Queue depth and per clientId health, in-flight, completed, failure and reconnect counts
+        """
+        with self.cond:
+            return {
+                "pending": len(self.pending),
+                "members": {member.clientId: {"healthy": member.healthy, "inFlight": member.inFlight,
+                                              "completed": member.completed, "failures": member.failures,
+                                              "reconnects": member.reconnects}
+                            for member in self.members},
+            }
+
+    # Workers
+    def _mayTake(self, member: _Member) -> bool:
+        if not self.pending or not member.healthy:
+            return False
+        least = min(other.inFlight for other in self.members if other.healthy and other.inFlight < self.slots)
+        return member.inFlight <= least
+
+    def _work(self, member: _Member) -> None:
+        while True:
+            with self.cond:
+                while not self.closed.is_set() and not self._mayTake(member):
+                    self.cond.wait()
+                if self.closed.is_set():
+                    return
+                job = self.pending.popleft()
+                if job.future.cancelled():
+                    continue
+                member.inFlight += 1
+                api = member.api
+            try:
+                result = job.fn(api, *job.args)
+            except BaseException as exc:
+                self._finish(member, api, job, exc=exc)
+            else:
+                self._finish(member, api, job, result=result)
+
+    def _finish(self, member: _Member, api, job: _Job, result=None, exc=None) -> None:
+        retry = False
+        with self.cond:
+            member.inFlight -= 1
+            if exc is None:
+                member.completed += 1
+            else:
+                # A duplicate of a request lost on another connection fails with
+                # ConnectionError too, only a closed socket takes the member down
+                if not api.isConnected() and member.api is api:
+                    self._markFailed(member)
+                if isinstance(exc, ConnectionError) or not api.isConnected():
+                    job.attempts += 1
+                    retry = job.attempts < self.maxAttempts and not self.closed.is_set()
+                if retry:
+                    self.pending.appendleft(job)
+            self.cond.notify_all()
+        if retry or job.future.done():
+            return
+        if exc is None:
+            job.future.set_result(result)
+        else:
+            job.future.set_exception(exc)
+
+    # Connections
+    def _open(self, clientId: int):
+        """
+        Connect a new IbkrApi with its reader thread, returns it once it answered
+        a reqCurrentTime() round trip, None if it did not come up
+        """
+        api = self.factory(clientId)
+        try:
+            api.connect()
+            reader = threading.Thread(target=self._read, args=(clientId, api), daemon=True,
+                                      name=f"ib-pool-reader-{clientId}")
+            reader.start()
+            api.clock.sync()
+        except Exception:
+            api.disconnect()
+            return None
+        if not api.isConnected():
+            return None
+        return api
+
+    def _read(self, clientId: int, api) -> None:
+        api.run()
+        with self.cond:
+            for member in self.members:
+                if member.api is api and not self.closed.is_set():
+                    self._markFailed(member)
+
+    def _markFailed(self, member: _Member) -> None:
+        """
+        Take member out of dispatch and start reconnecting it, called holding self.cond
+        """
+        if member.api is not None and member.healthy:
+            member.failures += 1
+        member.healthy = False
+        if not member.reconnecting and not self.closed.is_set():
+            member.reconnecting = True
+            threading.Thread(target=self._reconnect, args=(member,), daemon=True,
+                             name=f"ib-pool-reconnect-{member.clientId}").start()
+
+    def _reconnect(self, member: _Member) -> None:
+        if member.api is not None:
+            member.api.disconnect()
+        delay = self.reconnectDelay
+        while not self.closed.is_set():
+            api = self._open(member.clientId)
+            if api is not None:
+                with self.cond:
+                    if self.closed.is_set():
+                        api.disconnect()
+                        return
+                    if member.api is not None:
+                        member.reconnects += 1
+                    member.api, member.healthy, member.reconnecting = api, True, False
+                    self.cond.notify_all()
+                return
+            self.closed.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY_SEC)
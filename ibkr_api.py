@@ -8,9 +8,25 @@ https://interactivebrokers.github.io/tws-api
 from ibapi.client import EClient
 from ibapi.common import BarData
 from ibapi.wrapper import EWrapper
-from ibapi.contract import Contract
+from ibapi.contract import Contract, ContractDetails
 from ibapi.order import Order
 
+from ib_pacing import PacingGovernor, MAX_SIMULTANEOUS_HISTORICAL_REQUESTS
+from trading_hours import SessionTagger, TradingHoursCalendar, contractKey
+from bar_buffer import BarBuffer, parseBarDate
+from ib_clock import ServerClock, formatIbTime
+from bar_store import barSizeSeconds, contractSymbol, durationSeconds, durationString
+from bar_resample import BarResampler
+from ib_backfill import BackfillError, formatEndDateTime, planChunks, planMissing, stitchBars
+from ib_realtime import RealTimeHub, wallClockSeconds
+from account_store import AccountStore, AccountValue
+from order_engine import BRACKET_SIZE, OrderEngine, OrderIdAllocator
+from instrumentation import Instrumentation, NULL_TIMER
+from contract_registry import ContractRegistry
+
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+import threading
+import weakref
 import time as systime
 import datetime
 
@@ -23,28 +39,89 @@ IBKR_PERIOD_MAPPING = {
     "1d"  : "1 day"
 }
 
+# reqCurrentTime() carries no reqId, its response is correlated under this key
+CURRENT_TIME_REQ_ID = -1
+
+
+class IbkrRequestError(Exception):
+    """Raised when TWS reports an error against a pending request."""
+
+    def __init__(self, reqId, errorCode, errorString):
+        super().__init__(f"reqId {reqId}: [{errorCode}] {errorString}")
+        self.reqId = reqId
+        self.errorCode = errorCode
+        self.errorString = errorString
+
+
 class IbkrApi(EWrapper, EClient):
-    def __init__(self, host, port, clientId):
+    def __init__(self, host, port, clientId, timeout=10.0, barStore=None, pacing=None, accountLog=None,
+                 instrumentation=None, contractCache=None):
         EClient.__init__(self, self)
         # Conection parameters
         self.host = host
         self.port = port
         self.clientId = clientId
 
-        # Request and Order IDs
+        # Request IDs, order ids come from self.orderIds
         self.reqId = 10000
-        self.orderId = 1
+
+        # Interned contracts with their resolved conIds and details, persisted to contractCache if given
+        self.contracts = ContractRegistry(Contract, ContractDetails, contractCache)
 
         # Variables for storing temporary data
-        self.contract_list =   []
         self.hist_data_temp =  []
         self.conDetTemp =      None
         self.serverTime =      None
         self.accountDataTemp = []
+
+        # Request/response correlation: reqId -> Future resolved by the *End callbacks
+        self.timeout = timeout
+        self.pendingRequests = {}
+        self.pendingLock = threading.Lock()
+
+        # Request timings (instrumentation.Instrumentation), disabled unless one is passed in
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+        self.requestTimers = {}
+
+        # Per-reqId response buffers so several requests can be in flight at once
+        self.histBuffers = {}
+        self.conDetBuffers = {}
+        # Historical future -> reqId of the request that resolves it, for jobs sharing it
+        self.histOwners = weakref.WeakKeyDictionary()
+
+        # Historical pacing governor, may be shared with other sessions on the same gateway
+        self.pacing = pacing if pacing is not None else PacingGovernor()
+
+        # Session calendars keyed by conId (or symbol/secType/exchange/currency if unresolved)
+        self.tradingCalendars = {}
+
+        # Offset-tracking server clock, re-synced with reqCurrentTime() every few minutes
+        self.clock = ServerClock(self._fetch_server_time)
+
+        # Optional bar_store.BarStore, historical requests then only download missing bars
+        self.barStore = barStore
+
+        # Streaming subscriptions: reqId -> symbol, updates land in per-symbol ring buffers
+        self.realtime = RealTimeHub({period: barSizeSeconds(barSize) for period, barSize in IBKR_PERIOD_MAPPING.items()})
+        self.realtimeSubscriptions = {}
+
+        # Account values and positions updated by the account callbacks, accountLog(event, payload) is optional
+        self.accountStore = AccountStore(log=accountLog)
+        self.accountSummaryBuffers = {}
+
+        # Block order id allocation kept above nextValidId, batches of brackets are placed by the engine
+        self.orderIds = OrderIdAllocator(1)
+        self.orderEngine = OrderEngine(self.reserve_order_ids, lambda contract, order: self.placeOrder(order.orderId, contract, order),
+                                       self.BracketOrder)
        
     def connect(self):
         return super().connect(self.host, self.port, self.clientId)
 
+    @property
+    def contract_list(self) -> list:
+        """Contracts created so far, one per (symbol, secType, exchange, currency)."""
+        return self.contracts.contracts()
+
     def modifySession(self, host, port, clientId):
         self.host = host
         self.port = port
@@ -52,18 +129,25 @@ class IbkrApi(EWrapper, EClient):
         self.connect()
     
     def resetAccountDataTemp(self) -> None:
-        print("reset account data temp")
         self.accountDataTemp = []
 
     def get_order_id(self):
         '''
         Segregation between reqId and orderId. Chances are you will only have 1M orderIds but unlimited reqIDs in your lifetime.
         Auto orderId generator that appends +1 every time it is being called. Could use .reqIds(-1) to verify.
+        Shares one sequence with reserve_order_ids / place_brackets and never goes below nextValidId.
         '''
-        # if ibkrApi.reqIds(-1) relook into reset
-        current_id = self.orderId
-        self.orderId = (self.orderId + 1) % 10000  # Reset to 1 if it exceeds 9999
-        return current_id
+        return self.orderIds.reserve(1)[0]
+
+    def reserve_order_ids(self, count: int) -> range:
+        '''
+        Reserve count consecutive order ids, never below nextValidId or an id from get_order_id
+        '''
+        return self.orderIds.reserve(count)
+
+    def nextValidId(self, orderId: int):
+        super().nextValidId(orderId)
+        self.orderIds.sync(orderId)
 
     def get_req_id(self):
         '''
@@ -74,6 +158,62 @@ class IbkrApi(EWrapper, EClient):
         self.reqId = (self.reqId + 1) % 20000  # Reset to 10000 if it exceeds 19999
         return current_id
 
+    def _register_request(self, reqId, future=None, timer=NULL_TIMER) -> Future:
+        """
+        Register a future under reqId before the request is sent, so a fast
+        response can never arrive ahead of its waiter. timer (from
+        self.instrumentation.start()) is marked sent and completed with the future.
+        Concurrent reqCurrentTime() callers share the pending future.
+        """
+        with self.pendingLock:
+            if future is None:
+                future = self.pendingRequests.get(reqId)
+                if future is not None and not future.done():
+                    return future
+                future = Future()
+            self.pendingRequests[reqId] = future
+            timer.sent()
+            self.requestTimers[reqId] = timer
+            return future
+
+    def _resolve_request(self, reqId, result, size=None) -> None:
+        """
+        Resolve the future registered under reqId. Called from the reader thread.
+        size is the payload size recorded by the request timer (bars, rows).
+        """
+        with self.pendingLock:
+            future = self.pendingRequests.pop(reqId, None)
+            timer = self.requestTimers.pop(reqId, NULL_TIMER)
+        timer.done(size)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def _fail_request(self, reqId, exc) -> bool:
+        with self.pendingLock:
+            future = self.pendingRequests.pop(reqId, None)
+            timer = self.requestTimers.pop(reqId, NULL_TIMER)
+        timer.done(error=True)
+        if future is None or future.done():
+            return False
+        future.set_exception(exc)
+        return True
+
+    def _wait_request(self, reqId, future, timeout=None):
+        """
+        Block until the response for reqId arrives and return it.
+        Raises TimeoutError after timeout (default self.timeout) seconds instead of
+        returning a partially filled buffer.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            with self.pendingLock:
+                if self.pendingRequests.get(reqId) is future:
+                    del self.pendingRequests[reqId]
+                    self.requestTimers.pop(reqId, NULL_TIMER).done(error=True)
+            raise TimeoutError(f"reqId {reqId} did not complete within {timeout}s") from None
+
     def create_contract(self, symbol, sec_type, exchange, currency) -> Contract:
         """
         Create trade contract for corresponded symbol
@@ -84,16 +224,48 @@ class IbkrApi(EWrapper, EClient):
         currency: str, e.g. "USD" for US Dollar, "EUR" for Euro
 
         Returns:
-        contract: Contract object with specified parameters
+        contract: Contract object with specified parameters, the same object for the
+                  same arguments, with its conId filled in once resolved
         """
-        contract = Contract()
-        contract.symbol = symbol
-        contract.secType = sec_type
-        contract.exchange = exchange
-        contract.currency = currency
-        self.contract_list.append(contract)
+        return self.contracts.intern(symbol, sec_type, exchange, currency)
 
-        return contract
+    def qualify_contracts(self, contracts, max_in_flight=50, timeout=None) -> list:
+        """
+        Resolve the conId of many contracts at once. Contracts known to the registry
+        are filled in locally, the others are requested with up to max_in_flight
+        contract details requests open at once.
+        Args:
+            contracts:     iterable of Contract objects, updated in place
+            max_in_flight: int, number of concurrently open requests
+            timeout:       float, per-request timeout, default to self.timeout
+        Returns:
+            list of the contracts that were resolved, unknown, ambiguous or failed ones are left out
+        """
+        contracts = list(contracts)
+        pending = [contract for contract in contracts if not self.contracts.resolve(contract)]
+        timeout = self.timeout if timeout is None else timeout
+        inFlight = {}   # future -> contract
+        while pending or inFlight:
+            while pending and len(inFlight) < max(1, max_in_flight):
+                contract = pending.pop()
+                reqId = self.get_req_id()
+                future = self._register_request(reqId, timer=self.instrumentation.start("reqContractDetails"))
+                self.reqContractDetails(reqId, contract)
+                inFlight[future] = (reqId, contract)
+            done, _ = wait(inFlight, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Nothing arrived within timeout, fail the open requests and go on with the pending ones
+                for future, (reqId, _) in inFlight.items():
+                    if self._fail_request(reqId, TimeoutError(f"reqId {reqId} did not complete within {timeout}s")):
+                        self.conDetBuffers.pop(reqId, None)
+                done = list(inFlight)
+            for future in done:
+                _, contract = inFlight.pop(future)
+                # Like ib_insync's qualifyContracts, only an unambiguous match qualifies
+                if future.exception() is None and len(future.result()) == 1:
+                    self.contracts.update(contract, future.result()[0])
+        self.contracts.save()
+        return [contract for contract in contracts if contract.conId]
 
     #! [bracket]
     def BracketOrder(self, parentOrderId:int, action:str, quantity:float, 
@@ -101,7 +273,8 @@ class IbkrApi(EWrapper, EClient):
                      stopLossPrice:float):
         """ 
         Args:   
-        parentOrderId:        generated from api.get_order_id()
+        parentOrderId:        generated from api.get_order_id(), or None to reserve all three ids here.
+                              The children use parentOrderId+1 and +2, which are reserved as well.
         action:               BUY or SELL
         quantity:             number of positions 
         limitPrice:           float
@@ -116,6 +289,12 @@ class IbkrApi(EWrapper, EClient):
 
         Returns: bracketOrder: list of Order(s)
         """
+        if parentOrderId is None:
+            parentOrderId = self.orderIds.reserve(BRACKET_SIZE)[0]
+        else:
+            # Keep later get_order_id / reserve_order_ids calls off the children ids
+            self.orderIds.sync(parentOrderId + BRACKET_SIZE)
+
         #This will be our main or "parent" order
         parent = Order()
         parent.orderId = parentOrderId
@@ -150,91 +329,380 @@ class IbkrApi(EWrapper, EClient):
         bracketOrder = [parent, takeProfit, stopLoss]
         return bracketOrder
 
+    def place_brackets(self, brackets) -> list:
+        """
+        Place a batch of brackets with one contiguous order id block.
+        Args:
+            brackets: iterable of order_engine.Bracket(contract, action, quantity,
+                      limitPrice, takeProfitPrice, stopLossPrice)
+        Returns: list of [parent, takeProfit, stopLoss] per bracket
+        """
+        return self.orderEngine.placeBrackets(brackets)
+
+    def wait_order_acks(self, orderIds=None, timeout=None) -> bool:
+        """
+        Block until TWS acknowledged orderIds (default all placed orders),
+        latencies are then in self.orderEngine.latencies()
+        """
+        return self.orderEngine.wait(orderIds, self.timeout if timeout is None else timeout)
+
+    def openOrder(self, orderId, contract, order, orderState):
+        super().openOrder(orderId, contract, order, orderState)
+        self.orderEngine.onAck(orderId, orderState.status)
+
+    def orderStatus(self, orderId, status, filled, remaining, avgFillPrice, permId, parentId,
+                    lastFillPrice, clientId, whyHeld, mktCapPrice):
+        super().orderStatus(orderId, status, filled, remaining, avgFillPrice, permId, parentId,
+                            lastFillPrice, clientId, whyHeld, mktCapPrice)
+        self.orderEngine.onAck(orderId, status)
+
+    def getTradingCalendar(self, contract, when=None) -> TradingHoursCalendar:
+        """
+        Return the cached session calendar of the contract, requesting contract
+        details only on first use or once the cached week has rolled over.
+        Args:
+            contract: Contract object for the symbol
+            when:     datetime the calendar must cover, default to no staleness check
+        """
+        key = contractKey(contract)
+        calendar = self.tradingCalendars.get(key)
+        if calendar is not None and (when is None or not calendar.isStale(when)):
+            return calendar
+
+        # A stale calendar means the cached details are stale too
+        refresh = calendar is not None
+        calendar = TradingHoursCalendar(self.get_contract_details(contract, refresh).tradingHours)
+        if not refresh and when is not None and calendar.isStale(when):
+            calendar = TradingHoursCalendar(self.get_contract_details(contract, refresh=True).tradingHours)
+        self.tradingCalendars[key] = calendar
+        return calendar
+
+    def get_contract_details(self, contract, refresh=False) -> ContractDetails:
+        """
+        Contract details of contract, served from the contract registry while fresh,
+        otherwise requested and waited for. refresh forces a new request.
+        The first match is returned if contract is ambiguous, None if it is unknown;
+        only an unambiguous match is recorded and resolves contract.
+        """
+        if not refresh:
+            details = self.contracts.lookup(contract)
+            if details is not None:
+                return details
+        reqId = self.get_req_id()
+        future = self._register_request(reqId, timer=self.instrumentation.start("reqContractDetails"))
+        self.reqContractDetails(reqId, contract)
+        matches = self._wait_request(reqId, future)
+        if not matches:
+            return None
+        if len(matches) == 1:
+            self.contracts.update(contract, matches[0])
+            self.contracts.save()
+        return matches[0]
+
+    def get_session_tagger(self, contract) -> SessionTagger:
+        """
+        Vectorized pre-market / RTH / post-market / closed tagger of the contract,
+        built from its tradingHours and liquidHours, e.g. to filter useRTH=0 bars:
+            bars = api.get_historical_data(contract, "5m", "1 M")
+            rth = api.get_session_tagger(contract).rthMask(bars)
+        """
+        return SessionTagger.fromContractDetails(self.get_contract_details(contract))
+
     def isRegTradingHour(self, contract) -> bool:
         """
         Check if current time is within regular trading hours for the contract.
 
         Note that tradingHours format:
         "%Y%m%d:%H%M-%Y%m%d:%H%M;%Y%m%d:%H%M-%Y%m%d:%H%M:%Y%m%d:%H%M:CLOSED" 
-        Format length last for a week, It is being dissected as below
+        Format length last for a week, it is parsed once per contract and week
+        by TradingHoursCalendar.
         """
-        reqId = self.get_req_id()
-        self.reqContractDetails(reqId, contract)
-        systime.sleep(3)
-        contractDetail = self.conDetTemp
-        tradingHours = contractDetail.tradingHours.split(';')
+        # Convert serverTime string to datetime format
+        currTime = datetime.datetime.strptime(self.getCurrTime(), "%Y%m%d %H:%M:%S US/Eastern")
+        calendar = self.getTradingCalendar(contract, currTime)
+        return int(calendar.isOpen(currTime))
 
-        for tradingRange in tradingHours:
-            closedKeyword = False
-
-            if len(tradingRange) == 0:
-                pass 
-            elif "CLOSED" in tradingRange:
-                closedKeyword = True
-            else:
-                startTime, endTime = tradingRange.split('-')
-                startTime = datetime.datetime.strptime(startTime, "%Y%m%d:%H%M")
-                endTime = datetime.datetime.strptime(endTime, "%Y%m%d:%H%M")
-                # Check if current time is within this trading range
-                currTime = self.getCurrTime()
-                # Convert serverTime string to datetime format
-                currTime = datetime.datetime.strptime(currTime, "%Y%m%d %H:%M:%S US/Eastern")
-
-                if not closedKeyword and startTime <= currTime <= endTime:
-                    return 1
-        return 0
+    def isRegTradingHourMany(self, contract, timestamps) -> list:
+        """
+        Bulk trading hour check of many naive US/Eastern datetimes for one contract.
+        Timestamps outside the cached week are reported as closed.
+        """
+        return self.getTradingCalendar(contract).isOpenMany(timestamps)
 
     def contractDetails(self, reqId, contractDetails):
         """
         Call back function from reqContractDetails()
         """
         self.conDetTemp = contractDetails
+        # A late response to a failed or timed out request is dropped
+        with self.pendingLock:
+            if reqId in self.pendingRequests:
+                self.conDetBuffers.setdefault(reqId, []).append(contractDetails)
+        self.requestTimers.get(reqId, NULL_TIMER).firstByte()
 
-    def getCurrTime(self):
-
-        self.reqCurrentTime()
-        systime.sleep(0.1)
+    def contractDetailsEnd(self, reqId: int):
+        """
+        Call back function marking the end of reqContractDetails()
+        """
+        contractDetails = self.conDetBuffers.pop(reqId, [])
+        self._resolve_request(reqId, contractDetails, len(contractDetails))
 
+    def getCurrTime(self):
         """
+        Server time served from the local offset-tracking clock, reqCurrentTime()
+        is only sent when the clock is due for a re-sync.
+
         Output is string format: "%Y%m%d %H:%M:%S US/Eastern"
         You might need to convert to datetime format if required:
         currTime = datetime.datetime.strptime(currTime, "%Y%m%d %H:%M:%S US/Eastern")
         """
+        self.serverTime = self.clock.nowString()
         return self.serverTime
 
+    def _fetch_server_time(self):
+        """
+        One reqCurrentTime() round trip, returns the server epoch seconds.
+        """
+        future = self._register_request(CURRENT_TIME_REQ_ID, timer=self.instrumentation.start("reqCurrentTime"))
+        self.reqCurrentTime()
+        return self._wait_request(CURRENT_TIME_REQ_ID, future)
+
     def currentTime(self, time):
         """
         Call back function from api: reqCurrentTime()
         """
-        # Get the local time offset
-        currentSysTime = systime.time()
-        localTime = systime.localtime(currentSysTime)
-        localOffsetSec = systime.mktime(localTime) - currentSysTime
-        # Calculate the offset in hours
-        localOffsetHr = datetime.timedelta(hours=round(localOffsetSec / 3600))
-        # Example: ukOffset = datetime.timedelta(hours=0)  # UK is UTC+0
-        usEasternOffset = datetime.timedelta(hours=-4)     # US/Eastern is UTC-4
-        self.serverTime = datetime.datetime.fromtimestamp(time) + (usEasternOffset - localOffsetHr)
-        self.serverTime = self.serverTime.strftime("%Y%m%d %H:%M:%S US/Eastern")
+        self.requestTimers.get(CURRENT_TIME_REQ_ID, NULL_TIMER).firstByte()
+        self.serverTime = formatIbTime(time)
+        self._resolve_request(CURRENT_TIME_REQ_ID, time)
 
-    def get_historical_data(self, contract, period, duration):
+    def get_historical_data(self, contract, period, duration, as_records=False):
         """
         Get Historical Data function by calling reqHistorical api
         Args:
             contract: Contract object for the symbol
             period: str, e.g. "5m", "1h", "1d"
             duration: str, e.g. "1 D", "1 W", "1 M"
+            as_records: bool, return the former list of bar dicts instead
         Returns:
-            hist_data_temp: list of historical data bars
+            hist_data_temp: BarBuffer of historical data bars (.view(), .to_pandas()),
+                            or list of bar dicts if as_records
+        With self.barStore set, only bars missing from the store are requested and
+        the whole window is served from disk.
         """
         self.reset_hist_data_temp()
         rth = self.isRegTradingHour(contract)
-        reqId = self.get_req_id()
-        self.reqHistoricalData(reqId, contract, self.serverTime, duration, IBKR_PERIOD_MAPPING[period], 'BID', rth, 1, False, [])
-        systime.sleep(5)
+        if self.barStore is not None:
+            bars = self._get_stored_historical_data(contract, period, duration, rth)
+        else:
+            reqId, future = self._send_historical_request(contract, period, duration, self.serverTime, rth, as_records)
+            bars = self._wait_request(reqId, future)
+        self.hist_data_temp = bars.to_records() if as_records else bars
 
         return self.hist_data_temp
 
+    def get_historical_data_multi(self, contract, periods, duration) -> dict:
+        """
+        Bars of several periods from a single request of the finest one, the
+        coarser periods are resampled locally (bar_resample.BarResampler).
+        Args:
+            contract: Contract object for the symbol
+            periods:  iterable of IBKR_PERIOD_MAPPING keys, e.g. ["5m", "1h", "1d"]
+            duration: str, e.g. "1 D", "1 W", "1 M"
+        Returns:
+            {period: BarBuffer}
+        """
+        seconds = {period: barSizeSeconds(IBKR_PERIOD_MAPPING[period]) for period in periods}
+        finest = min(seconds, key=seconds.get)
+        resampler = BarResampler(seconds, seconds[finest])
+        resampler.update(self.get_historical_data(contract, finest, duration))
+        return resampler.bars
+
+    def backfill_historical_data(self, contract, period, duration, max_in_flight=10, checkpoint=None) -> BarBuffer:
+        """
+        Historical data of a span longer than one request may cover (e.g. "5m" over "2 Y"),
+        split into legal chunks walking back from the server time and sent pipelined
+        within pacing limits (ib_backfill).
+        Args:
+            contract:      Contract object for the symbol
+            period:        str, e.g. "5m", "1h", "1d"
+            duration:      str, e.g. "6 M", "2 Y"
+            max_in_flight: int, chunks requested at once
+            checkpoint:    BarStore every finished chunk is written to, default self.barStore.
+                           A rerun only requests the ranges still missing.
+        Returns:
+            BarBuffer of the whole span, ordered and de-duplicated
+        Raises:
+            BackfillError once all chunks were tried and some failed
+        """
+        barSize = IBKR_PERIOD_MAPPING[period]
+        endDateTime = self.getCurrTime()
+        now = parseBarDate(endDateTime)
+        zone = endDateTime.rsplit(" ", 1)[1]
+        start = now - durationSeconds(duration)
+        rth = self.isRegTradingHour(contract)
+        store = checkpoint if checkpoint is not None else self.barStore
+        key = ("ibkr", contractSymbol(contract), f"{period}-BID-{'rth' if rth else 'all'}")
+        chunks = planMissing(store, key, start, now, barSize) if store is not None else planChunks(start, now, barSize)
+        completeUntil = now - barSizeSeconds(barSize)
+
+        results, errors = [], []
+        jobs = [(contract, period, chunk.duration, formatEndDateTime(chunk.end, zone), chunk) for chunk in chunks]
+        for job, bars, error in self.get_historical_data_many(jobs, max_in_flight):
+            chunk = job[4]
+            if error is not None:
+                errors.append((chunk, error))
+            elif store is not None:
+                store.write(*key, bars, covered=(chunk.start, min(chunk.end, completeUntil)))
+            else:
+                results.append(bars)
+
+        bars = store.read(*key, start, now) if store is not None else stitchBars(results)
+        if errors:
+            raise BackfillError(errors, bars)
+        return bars
+
+    def _get_stored_historical_data(self, contract, period, duration, rth):
+        """
+        Gap-fill the bar store up to the current server time and read the window back.
+        """
+        endDateTime = self.serverTime
+        now = parseBarDate(endDateTime)
+
+        def fetch(gapStart, gapEnd):
+            reqId, future = self._send_historical_request(contract, period, durationString(now - gapStart), endDateTime, rth)
+            return self._wait_request(reqId, future)
+
+        return self.barStore.fill(
+            "ibkr", contractSymbol(contract), f"{period}-BID-{'rth' if rth else 'all'}",
+            now - durationSeconds(duration), now, fetch,
+            completeUntil=now - barSizeSeconds(IBKR_PERIOD_MAPPING[period]), mergeGaps=True)
+
+    def get_historical_data_many(self, jobs, max_in_flight=10, timeout=None, as_records=False):
+        """
+        Bulk historical download keeping up to max_in_flight requests open at once,
+        within IB pacing limits. Jobs the pacing governor would hold back (e.g. a
+        sixth request for one contract within 2 s) are overtaken by jobs that may
+        go now, and identical jobs share a single request.
+        Args:
+            jobs: iterable of (contract, period, duration) tuples, optionally with a
+                  fourth endDateTime element (default the current server time)
+            max_in_flight: int, number of concurrently open requests (IB allows 50)
+            timeout: float, per-request timeout, default to self.timeout
+            as_records: bool, yield lists of bar dicts instead of BarBuffer
+        Yields:
+            (job, bars, error) in completion order, where bars is the BarBuffer
+            (or list of bar dicts) of the job, or None if it failed with error
+        """
+        timeout = self.timeout if timeout is None else timeout
+        max_in_flight = max(1, min(max_in_flight, MAX_SIMULTANEOUS_HISTORICAL_REQUESTS))
+        jobs = iter(jobs)
+        endDateTime = self.getCurrTime()
+        ready = []      # (job, rth, endDateTime, requestKey, contractKey) read ahead but not sent yet
+        inFlight = {}   # future -> [reqId, deadline, jobs sharing the future]
+        exhausted = False
+
+        while True:
+            sendDelay = None    # seconds until the governor lets the next ready job go
+            while not exhausted and len(ready) < max_in_flight:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    break
+                contract, period, duration = job[:3]
+                jobEnd = job[3] if len(job) > 3 else endDateTime
+                try:
+                    rth = self.isRegTradingHour(contract)
+                except Exception as e:
+                    yield job, None, e
+                    continue
+                ready.append((job, rth, jobEnd) + self._historical_request_keys(contract, period, duration, jobEnd, rth, as_records))
+
+            while ready and len(inFlight) < max_in_flight:
+                # Send whichever job the governor lets through soonest, identical in-flight jobs share at once
+                delays = [0.0 if self.pacing.isInFlight(requestKey) else self.pacing.delay(requestKey, contractKey)
+                          for _, _, _, requestKey, contractKey in ready]
+                index = min(range(len(ready)), key=delays.__getitem__)
+                if delays[index] > 0 and inFlight:
+                    # Collect finished requests instead of blocking in the governor
+                    sendDelay = delays[index]
+                    break
+                job, rth, jobEnd, _, _ = ready.pop(index)
+                contract, period, duration = job[:3]
+                try:
+                    reqId, future = self._send_historical_request(contract, period, duration, jobEnd, rth, as_records)
+                except Exception as e:
+                    yield job, None, e
+                    continue
+                if future in inFlight:
+                    inFlight[future][2].append(job)
+                else:
+                    inFlight[future] = [reqId, systime.monotonic() + timeout, [job]]
+
+            if not inFlight:
+                return
+
+            waitFor = min(deadline for _, deadline, _ in inFlight.values()) - systime.monotonic()
+            if sendDelay is not None:
+                waitFor = min(waitFor, sendDelay)
+            done, _ = wait(inFlight, timeout=max(0.0, waitFor), return_when=FIRST_COMPLETED)
+            for future in done:
+                _, _, doneJobs = inFlight.pop(future)
+                for job in doneJobs:
+                    if future.exception() is not None:
+                        yield job, None, future.exception()
+                    else:
+                        bars = future.result()
+                        yield job, bars.to_records() if as_records else bars, None
+
+            now = systime.monotonic()
+            for future, (reqId, deadline, expiredJobs) in list(inFlight.items()):
+                if deadline <= now and not future.done():
+                    del inFlight[future]
+                    if reqId is not None:
+                        self._fail_request(reqId, TimeoutError())
+                        self.histBuffers.pop(reqId, None)
+                        self.cancelHistoricalData(reqId)
+                    # A shared future reports the reqId of the request that owns it
+                    ownerId = reqId if reqId is not None else self.histOwners.get(future)
+                    for job in expiredJobs:
+                        yield job, None, TimeoutError(f"reqId {ownerId} did not complete within {timeout}s")
+
+    def _historical_request_keys(self, contract, period, duration, endDateTime, rth, keepDates=False):
+        """
+        (requestKey, contractKey) the pacing governor tracks a historical request under
+        """
+        symbol = contractSymbol(contract)
+        requestKey = (symbol, endDateTime, duration, IBKR_PERIOD_MAPPING[period], 'BID', rth, keepDates)
+        return requestKey, (symbol, 'BID')
+
+    def _send_historical_request(self, contract, period, duration, endDateTime, rth, keepDates=False):
+        """
+        Wait for the pacing governor, then send reqHistoricalData with its own bar buffer.
+        Returns (reqId, future) resolved with the bars by historicalDataEnd(). An
+        identical request still in flight is not sent again: (None, its future),
+        self.histOwners maps the future to the reqId it was sent under.
+        """
+        requestKey, contractKey = self._historical_request_keys(contract, period, duration, endDateTime, rth, keepDates)
+        future, isNew = self.pacing.claim(requestKey)
+        if not isNew:
+            return None, future
+
+        reqId = None
+        timer = self.instrumentation.start("reqHistoricalData")
+        try:
+            self.pacing.acquire(requestKey, contractKey)
+            reqId = self.get_req_id()
+            self.histOwners[future] = reqId
+            self.histBuffers[reqId] = BarBuffer(keepDates=keepDates)
+            self._register_request(reqId, future, timer)
+            self.reqHistoricalData(reqId, contract, endDateTime, duration, IBKR_PERIOD_MAPPING[period], 'BID', rth, 1, False, [])
+        except BaseException as e:
+            if reqId is None or not self._fail_request(reqId, e):
+                timer.done(error=True)
+                future.set_exception(e)
+            raise
+        return reqId, future
+
     def reset_hist_data_temp(self) -> None:
         self.hist_data_temp = []
 
@@ -242,17 +710,109 @@ class IbkrApi(EWrapper, EClient):
         """
         Call back function from reqHistoricalData(), User should not call this function directly.
         """
-        self.hist_data_temp.append({
-            "date": bar.date,
-            "open": bar.open,
-            "high": bar.high,
-            "low" : bar.low,
-            "close": bar.close,
-            "volume": bar.volume
-        })
+        buffer = self.histBuffers.get(reqId)
+        if buffer is None:
+            if reqId in self.realtimeSubscriptions:
+                self.historicalDataUpdate(reqId, bar)
+            return
+        if not buffer:
+            self.requestTimers.get(reqId, NULL_TIMER).firstByte()
+        buffer.append_bar(bar)
+
+    def historicalDataEnd(self, reqId: int, start: str, end: str):
+        """
+        Call back function marking the end of reqHistoricalData()
+        """
+        # An empty buffer is falsy, compare with None to keep its keepDates setting
+        bars = self.histBuffers.pop(reqId, None)
+        if bars is None:
+            bars = BarBuffer()
+        self._resolve_request(reqId, bars, len(bars))
+
+# Streaming subscriptions
+    def subscribe_realtime_bars(self, contract, whatToShow="TRADES", useRTH=False) -> int:
+        """
+        Subscribe to 5 second real-time bars, aggregated into every IBKR_PERIOD_MAPPING period.
+        Read with self.realtime.latestBar / partialBar / bars(contractSymbol(contract), period)
+        Returns: reqId, pass to unsubscribe()
+        """
+        reqId = self.get_req_id()
+        symbol = contractSymbol(contract)
+        self.realtime.stream(symbol, sourcePeriod=5)
+        self.realtimeSubscriptions[reqId] = (symbol, "realtimeBars")
+        self.reqRealTimeBars(reqId, contract, 5, whatToShow, useRTH, [])
+        return reqId
+
+    def subscribe_historical_updates(self, contract, period, duration="1 D", whatToShow="BID") -> int:
+        """
+        keepUpToDate historical bars of period, the forming bar is revised in place
+        and aggregated into the coarser IBKR_PERIOD_MAPPING periods.
+        Returns: reqId, pass to unsubscribe()
+        """
+        reqId = self.get_req_id()
+        symbol = contractSymbol(contract)
+        self.realtime.stream(symbol, sourcePeriod=barSizeSeconds(IBKR_PERIOD_MAPPING[period]))
+        self.realtimeSubscriptions[reqId] = (symbol, "historicalUpdates")
+        self.reqHistoricalData(reqId, contract, "", duration, IBKR_PERIOD_MAPPING[period], whatToShow, 0, 1, True, [])
+        return reqId
+
+    def subscribe_market_data(self, contract, genericTickList="") -> int:
+        """
+        Streaming bid/ask/last ticks, read with self.realtime.latestQuote(contractSymbol(contract))
+        Returns: reqId, pass to unsubscribe()
+        """
+        reqId = self.get_req_id()
+        symbol = contractSymbol(contract)
+        self.realtime.stream(symbol)
+        self.realtimeSubscriptions[reqId] = (symbol, "marketData")
+        self.reqMktData(reqId, contract, genericTickList, False, False, [])
+        return reqId
+
+    def unsubscribe(self, reqId) -> None:
+        symbol, kind = self.realtimeSubscriptions.pop(reqId)
+        if kind == "realtimeBars":
+            self.cancelRealTimeBars(reqId)
+        elif kind == "historicalUpdates":
+            self.cancelHistoricalData(reqId)
+        else:
+            self.cancelMktData(reqId)
+
+    def realtimeBar(self, reqId, time, open_, high, low, close, volume, wap, count):
+        """
+        Call back function from reqRealTimeBars(), time is epoch seconds
+        """
+        subscription = self.realtimeSubscriptions.get(reqId)
+        if subscription is not None:
+            self.realtime.onBar(subscription[0], wallClockSeconds(time), open_, high, low, close, volume)
+
+    def historicalDataUpdate(self, reqId: int, bar: BarData):
+        """
+        Call back function from reqHistoricalData() with keepUpToDate=True
+        """
+        subscription = self.realtimeSubscriptions.get(reqId)
+        if subscription is not None:
+            self.realtime.onBar(subscription[0], parseBarDate(bar.date), bar.open, bar.high, bar.low,
+                                bar.close, bar.volume, revision=True)
+
+    def tickPrice(self, reqId, tickType, price, attrib):
+        subscription = self.realtimeSubscriptions.get(reqId)
+        if subscription is not None:
+            self.realtime.onTick(subscription[0], wallClockSeconds(systime.time()), tickType, price)
+
+    def tickSize(self, reqId, tickType, size):
+        subscription = self.realtimeSubscriptions.get(reqId)
+        if subscription is not None:
+            self.realtime.onTick(subscription[0], wallClockSeconds(systime.time()), tickType, size)
 
 # Added other portfolio viewing API
-    def error(self, reqId, errorCode, errorString, errorHint):
+    def error(self, reqId, errorCode, errorString, errorHint=""):
+        # 2100-2199 are informational (farm connection status etc.), not failures.
+        # System notices (connectivity 1100/1101/1102, ...) come with reqId -1, which is
+        # also the key of reqCurrentTime(), they must not fail a pending time request.
+        if reqId != CURRENT_TIME_REQ_ID and not 2100 <= errorCode < 2200:
+            if self._fail_request(reqId, IbkrRequestError(reqId, errorCode, errorString)):
+                self.histBuffers.pop(reqId, None)
+                self.conDetBuffers.pop(reqId, None)
         print("Error: ", reqId, " ", errorCode, " ", errorString, " ", errorHint)
 
     def getCashVal(self, tags:str):
@@ -264,90 +824,78 @@ class IbkrApi(EWrapper, EClient):
         tags	a comma separated list with the desired tags:
 
         Return:
-        run callback function self.accountDataTemp to get the account summary data
+        list of AccountValue(account, tag, value, currency, modelCode), also kept in
+        self.accountDataTemp and self.accountStore
         '''
         try:
             reqId = self.get_req_id()
             self.resetAccountDataTemp()
+            self.accountSummaryBuffers[reqId] = []
+            future = self._register_request(reqId, timer=self.instrumentation.start("reqAccountSummary"))
             self.reqAccountSummary(reqId, "All", tags)
-            systime.sleep(1)  
-            self.cancelAccountSummary(reqId)
-            return self.accountDataTemp
+            try:
+                return self._wait_request(reqId, future)
+            finally:
+                self.cancelAccountSummary(reqId)
+                self.accountSummaryBuffers.pop(reqId, None)
         except Exception as e:
             print(e)
             return []
 
+    def subscribe_account_updates(self, account: str = "") -> None:
+        '''
+        Stream account values and portfolio positions of account into self.accountStore
+        '''
+        self.reqAccountUpdates(True, account)
+
+    def updateAccountValue(self, key: str, val: str, currency: str, accountName: str):
+        '''
+        Callback function of .reqAccountUpdates
+        '''
+        self.accountStore.updateValue(accountName, key, val, currency)
+
     def updatePortfolio(self, contract: Contract, position: float, marketPrice: float, marketValue: float,
                         averageCost: float, unrealizedPNL: float, realizedPNL: float, accountName: str):
         """
-        Portfolio viewing API
+        Portfolio viewing API, positions are kept in self.accountStore
         """
-        try:
-            super().updatePortfolio(
-                contract,
-                position,
-                marketPrice,
-                marketValue,
-                averageCost,
-                unrealizedPNL,
-                realizedPNL,
-                accountName,
-            )
-            print(
-                "UpdatePortfolio.",
-                "Symbol:",
-                contract.symbol,
-                "SecType:",
-                contract.secType,
-                "Exchange:",
-                contract.exchange,
-                "Position:",
-                position,
-                "MarketPrice:",
-                marketPrice,
-                "MarketValue:",
-                marketValue,
-                "AverageCost:",
-                averageCost,
-                "UnrealizedPNL:",
-                unrealizedPNL,
-                "RealizedPNL:",
-                realizedPNL,
-                "AccountName:",
-                accountName,
-            )
-        except Exception as e:
-            print(e)
-            return []
+        self.accountStore.updatePosition(accountName, contract, position, marketPrice, marketValue,
+                                         averageCost, unrealizedPNL, realizedPNL)
 
     def accountSummary(self, reqId: int, account: str, tag: str, value: str, currency: str):
         '''
         Callback function
         '''
-        super().accountSummary(reqId, account, tag, value, currency)
-        self.accountDataTemp.append({
-            "AccountSummary. ReqId": reqId,
-            "Tag": tag,
-            "Value": value, 
-            "Currency": currency, 
-            "AccountName": account 
-        })
+        self.accountStore.updateValue(account, tag, value, currency)
+        buffer = self.accountSummaryBuffers.get(reqId)
+        if buffer is not None:
+            if not buffer:
+                self.requestTimers.get(reqId, NULL_TIMER).firstByte()
+            buffer.append(AccountValue(account, tag, value, currency, ""))
 
     def accountSummaryEnd(self, reqId: int):
         '''
         Callback function that terminate the .reqAccountSummarygicom request
         '''
-        super().accountSummaryEnd(reqId)
-        print("AccountSummaryEnd.Curr ReqId:", reqId)
-        print("Next Valid ID:",reqId+1)
+        self.accountDataTemp = self.accountSummaryBuffers.get(reqId, [])
+        self._resolve_request(reqId, self.accountDataTemp, len(self.accountDataTemp))
 
     def updateAccountTime(self, timeStamp: str):
-        super().updateAccountTime(timeStamp)
-        print("UpdateAccountTime. Time:", timeStamp)
+        self.accountStore.updateAccountTime(timeStamp)
 
     def accountDownloadEnd(self, accountName: str):
-        super().accountDownloadEnd(accountName)
-        print("AccountDownloadEnd. Account:", accountName)
+        self.accountStore.downloadEnd(accountName)
+
+    def connectionClosed(self):
+        """
+        Fail every pending request at once instead of leaving its waiter to the timeout
+        """
+        with self.pendingLock:
+            reqIds = list(self.pendingRequests)
+        for reqId in reqIds:
+            if self._fail_request(reqId, ConnectionError(f"connection to {self.host}:{self.port} closed")):
+                self.histBuffers.pop(reqId, None)
+                self.conDetBuffers.pop(reqId, None)
 
     def run(self):
         super().run()
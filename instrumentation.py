@@ -0,0 +1,264 @@
+"""
+Request instrumentation
+
+One timing surface shared by IbkrApi, IbInsyncApi and PolygonApi. Each request
+is timed at four marks:
+  - enqueue:  the caller asked for it, before pacing, retries or pool waits
+  - send:     it went out on the wire (the last attempt when retried)
+  - first:    first byte of the response, or first callback for IB
+  - done:     the response is complete, or failed
+and the spans between the marks land in per-endpoint histograms
+  queue = send - enqueue, firstByte = first - send,
+  transfer = done - first, total = done - enqueue
+together with the payload size (body bytes for HTTP, bars or rows for IB) and
+request / error counters. A span whose marks were not both taken is skipped.
+
+Read the aggregates with snapshot() (plain dict) or prometheus() (text
+exposition format). Disabled instrumentation, the default of every client,
+hands out one shared no-op timer, so an uninstrumented request costs a few
+method calls that do nothing.
+"""
+
+from bisect import bisect_left
+import threading
+import time as systime
+
+# Histogram upper bounds: seconds for the spans, bytes / items for payloads
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+PHASES = ("queue", "firstByte", "transfer", "total")
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram, quantiles are estimated as the upper bound of the
+    bucket holding the rank (the largest observation for the overflow bucket).
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+
+    def observe(self, value) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, fraction: float):
+        if not self.count:
+            return None
+        rank = max(1, fraction * self.count)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def cumulative(self):
+        """
+        [(upper bound, observations <= bound)], the last bound is inf
+        """
+        total = 0
+        buckets = []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.quantile(0.50),
+            "p90": self.quantile(0.90),
+            "p99": self.quantile(0.99),
+        }
+
+
+class RequestTimer:
+    """
+    Marks of one request, created by Instrumentation.start() (the enqueue mark).
+    sent() may be called again per retry, firstByte() keeps the first call,
+    done() records the request once and ignores later calls.
+    """
+
+    __slots__ = ("instrumentation", "endpoint", "clock", "enqueuedAt", "sentAt", "firstAt", "doneAt")
+
+    def __init__(self, instrumentation, endpoint: str, clock):
+        self.instrumentation = instrumentation
+        self.endpoint = endpoint
+        self.clock = clock
+        self.enqueuedAt = clock()
+        self.sentAt = None
+        self.firstAt = None
+        self.doneAt = None
+
+    def sent(self) -> None:
+        self.sentAt = self.clock()
+        self.firstAt = None
+
+    def firstByte(self, sinceSent: float = None) -> None:
+        """
+        Mark the first byte / callback now, or sinceSent seconds after the send
+        mark when the transport measured it (requests' Response.elapsed)
+        """
+        if self.firstAt is not None:
+            return
+        if sinceSent is not None and self.sentAt is not None:
+            self.firstAt = self.sentAt + sinceSent
+        else:
+            self.firstAt = self.clock()
+
+    def done(self, size: int = None, error: bool = False) -> None:
+        if self.doneAt is not None:
+            return
+        self.doneAt = self.clock()
+        self.instrumentation._record(self, size, error)
+
+    def spans(self) -> dict:
+        marks = (self.enqueuedAt, self.sentAt, self.firstAt, self.doneAt)
+        spans = {}
+        for phase, (start, end) in zip(PHASES, ((0, 1), (1, 2), (2, 3), (0, 3))):
+            if marks[start] is not None and marks[end] is not None:
+                spans[phase] = max(0.0, marks[end] - marks[start])
+        return spans
+
+
+class _NullTimer:
+    """
+    Timer of disabled instrumentation, every mark is a no-op
+    """
+
+    __slots__ = ()
+
+    def sent(self) -> None:
+        pass
+
+    def firstByte(self, sinceSent: float = None) -> None:
+        pass
+
+    def done(self, size: int = None, error: bool = False) -> None:
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _EndpointStats:
+    __slots__ = ("requests", "errors", "phases", "size")
+
+    def __init__(self, timeBuckets, sizeBuckets):
+        self.requests = 0
+        self.errors = 0
+        self.phases = {phase: Histogram(timeBuckets) for phase in PHASES}
+        self.size = Histogram(sizeBuckets)
+
+
+class Instrumentation:
+    """
+    Per-endpoint request histograms. One instance may be shared by several
+    clients, recording is thread safe. Toggle with the enabled attribute,
+    timers started while disabled record nothing.
+    """
+
+    def __init__(self, enabled: bool = True, timeBuckets=TIME_BUCKETS, sizeBuckets=SIZE_BUCKETS,
+                 clock=systime.perf_counter):
+        self.enabled = enabled
+        self.timeBuckets = tuple(timeBuckets)
+        self.sizeBuckets = tuple(sizeBuckets)
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.endpoints = {}     # endpoint -> _EndpointStats
+
+    def start(self, endpoint: str):
+        """
+        Enqueue mark of a request to endpoint, returns its timer
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return RequestTimer(self, endpoint, self.clock)
+
+    def _record(self, timer: RequestTimer, size, error: bool) -> None:
+        spans = timer.spans()
+        with self.lock:
+            stats = self.endpoints.get(timer.endpoint)
+            if stats is None:
+                stats = self.endpoints[timer.endpoint] = _EndpointStats(self.timeBuckets, self.sizeBuckets)
+            stats.requests += 1
+            if error:
+                stats.errors += 1
+            for phase, seconds in spans.items():
+                stats.phases[phase].observe(seconds)
+            if size is not None:
+                stats.size.observe(size)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.endpoints = {}
+
+    def snapshot(self) -> dict:
+        """
+        {endpoint: {"requests", "errors", "queue", "firstByte", "transfer", "total", "size"}},
+        each histogram as count / sum / mean / max / p50 / p90 / p99 (seconds, or size units)
+        """
+        with self.lock:
+            result = {}
+            for endpoint, stats in self.endpoints.items():
+                entry = {"requests": stats.requests, "errors": stats.errors}
+                for phase, histogram in stats.phases.items():
+                    entry[phase] = histogram.snapshot()
+                entry["size"] = stats.size.snapshot()
+                result[endpoint] = entry
+            return result
+
+    def prometheus(self, prefix: str = "api_request") -> str:
+        """
+        All endpoints in the Prometheus text exposition format
+        """
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = [f"# HELP {prefix}s_total Requests completed, by endpoint",
+                     f"# TYPE {prefix}s_total counter"]
+            for endpoint, stats in endpoints:
+                lines.append(f'{prefix}s_total{{endpoint="{_escape(endpoint)}"}} {stats.requests}')
+            lines += [f"# HELP {prefix}_errors_total Requests failed, by endpoint",
+                      f"# TYPE {prefix}_errors_total counter"]
+            for endpoint, stats in endpoints:
+                lines.append(f'{prefix}_errors_total{{endpoint="{_escape(endpoint)}"}} {stats.errors}')
+
+            name = f"{prefix}_duration_seconds"
+            lines += [f"# HELP {name} Request spans (queue, firstByte, transfer, total), by endpoint",
+                      f"# TYPE {name} histogram"]
+            for endpoint, stats in endpoints:
+                for phase, histogram in stats.phases.items():
+                    lines += _histogramLines(name, f'endpoint="{_escape(endpoint)}",phase="{phase}"', histogram)
+
+            name = f"{prefix}_payload_size"
+            lines += [f"# HELP {name} Response size, body bytes for HTTP and bars or rows for IB, by endpoint",
+                      f"# TYPE {name} histogram"]
+            for endpoint, stats in endpoints:
+                lines += _histogramLines(name, f'endpoint="{_escape(endpoint)}"', stats.size)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogramLines(name: str, labels: str, histogram: Histogram) -> list:
+    lines = []
+    for bound, count in histogram.cumulative():
+        le = "+Inf" if bound == float("inf") else repr(float(bound))
+        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
@@ -0,0 +1,171 @@
+"""
+Bulk order submission
+
+Order ids must be unique per client and at least the nextValidId reported by
+TWS. OrderIdAllocator hands out contiguous blocks under a lock, so a bracket
+always owns parent, parent+1 and parent+2, and it is moved forward whenever
+TWS reports a higher nextValidId.
+
+OrderEngine reserves the ids of a whole batch of brackets at once, builds and
+sends every order without waiting in between, and records for each order the
+time from placeOrder to the first openOrder/orderStatus acknowledgement.
+"""
+
+from collections import namedtuple
+import threading
+import time as systime
+
+Bracket = namedtuple("Bracket", ["contract", "action", "quantity", "limitPrice", "takeProfitPrice", "stopLossPrice"])
+
+# Statuses set locally before TWS has seen the order, not an acknowledgement
+UNACKNOWLEDGED_STATUSES = {"PendingSubmit", "ApiPending"}
+BRACKET_SIZE = 3
+
+
+class OrderIdAllocator:
+    """
+    Thread-safe source of contiguous order id blocks.
+    """
+
+    def __init__(self, nextId: int = 1):
+        self.nextId = nextId
+        self.lock = threading.Lock()
+
+    def sync(self, nextValidId: int) -> None:
+        """
+        Never hand out ids below nextValidId (from the nextValidId callback).
+        """
+        with self.lock:
+            self.nextId = max(self.nextId, nextValidId)
+
+    def reserve(self, count: int = 1) -> range:
+        """
+        Reserve count consecutive ids.
+        """
+        with self.lock:
+            start = self.nextId
+            self.nextId += count
+            return range(start, start + count)
+
+
+class OrderTicket:
+    """
+    Submission record of one order.
+    """
+
+    def __init__(self, orderId, contract, order):
+        self.orderId = orderId
+        self.contract = contract
+        self.order = order
+        self.submittedAt = None
+        self.ackedAt = None
+        self.status = None
+
+    @property
+    def latency(self):
+        """Seconds from submission to acknowledgement, None while pending."""
+        if self.submittedAt is None or self.ackedAt is None:
+            return None
+        return self.ackedAt - self.submittedAt
+
+    def __repr__(self):
+        return f"OrderTicket(orderId={self.orderId}, status={self.status}, latency={self.latency})"
+
+
+class OrderEngine:
+    """
+    Args:
+        reserveIds:   callable(count) -> range of consecutive order ids
+        placeOrder:   callable(contract, order), the API placeOrder
+        buildBracket: callable(parentId, action, quantity, limitPrice, takeProfitPrice,
+                      stopLossPrice) -> [parent, takeProfit, stopLoss] using ids parentId..parentId+2
+        clock:        high resolution clock for the latencies
+    """
+
+    def __init__(self, reserveIds, placeOrder, buildBracket, clock=systime.perf_counter):
+        self.reserveIds = reserveIds
+        self.placeOrder = placeOrder
+        self.buildBracket = buildBracket
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.tickets = {}   # orderId -> OrderTicket
+        self.pending = set()
+
+    def placeBrackets(self, brackets) -> list:
+        """
+        Place many brackets in one batch.
+        Args:
+            brackets: iterable of Bracket (or tuples in the same field order)
+        Returns: list of [parent, takeProfit, stopLoss] per bracket
+        """
+        brackets = [Bracket(*bracket) for bracket in brackets]
+        ids = self.reserveIds(BRACKET_SIZE * len(brackets))
+        batch = []
+        for index, bracket in enumerate(brackets):
+            orders = self.buildBracket(ids[BRACKET_SIZE * index], bracket.action, bracket.quantity,
+                                       bracket.limitPrice, bracket.takeProfitPrice, bracket.stopLossPrice)
+            batch.append((bracket.contract, list(orders)))
+
+        # Tickets exist before the first order goes out, acknowledgements may race the loop
+        with self.condition:
+            for contract, orders in batch:
+                for order in orders:
+                    self.tickets[order.orderId] = OrderTicket(order.orderId, contract, order)
+                    self.pending.add(order.orderId)
+
+        for contract, orders in batch:
+            for order in orders:
+                self.tickets[order.orderId].submittedAt = self.clock()
+                self.placeOrder(contract, order)
+        return [orders for _, orders in batch]
+
+    def onAck(self, orderId, status=None) -> None:
+        """
+        openOrder / orderStatus callback of an order.
+        """
+        ticket = self.tickets.get(orderId)
+        if ticket is None:
+            return
+        ticket.status = status or ticket.status
+        if ticket.ackedAt is not None or status in UNACKNOWLEDGED_STATUSES:
+            return
+        with self.condition:
+            ticket.ackedAt = self.clock()
+            self.pending.discard(orderId)
+            self.condition.notify_all()
+
+    def acked(self, orderIds=None) -> bool:
+        """
+        True once all of orderIds (default every placed order) are acknowledged.
+        """
+        with self.condition:
+            if orderIds is None:
+                return not self.pending
+            return self.pending.isdisjoint(orderIds)
+
+    def wait(self, orderIds=None, timeout=None) -> bool:
+        """
+        Block until acked(orderIds) or timeout, returns acked(orderIds).
+        For threaded APIs (IbkrApi), an event loop API must poll acked() instead.
+        """
+        orderIds = None if orderIds is None else set(orderIds)
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not self.pending if orderIds is None else self.pending.isdisjoint(orderIds), timeout)
+
+    def latencies(self) -> dict:
+        """
+        {orderId: seconds} of every acknowledged order.
+        """
+        return {orderId: ticket.latency for orderId, ticket in list(self.tickets.items())
+                if ticket.latency is not None}
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies().values())
+        return {
+            "submitted": len(self.tickets),
+            "acked": len(latencies),
+            "pending": len(self.pending),
+            "medianLatency": latencies[len(latencies) // 2] if latencies else None,
+            "maxLatency": latencies[-1] if latencies else None,
+        }
@@ -1,33 +1,222 @@
 """Polygon API Wrapper."""
 
+import datetime
+import email.utils
 import os
-from typing import Optional, Dict, Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+from zoneinfo import ZoneInfo
 import requests
+from requests.adapters import HTTPAdapter
+
+from bar_buffer import BarBuffer
+from bar_store import BarStore
+from instrumentation import Instrumentation
+
+# Status codes worth retrying: rate limited or a transient server-side failure.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Per-endpoint read timeouts in seconds, matched on the longest path prefix.
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "/v1/marketstatus": 5.0,
+    "/v2/last": 5.0,
+    "/v2/aggs": 30.0,
+}
+
+
+# Upper bound of bars per calendar day for one unit of each timespan. Intraday
+# figures assume extended hours (04:00-20:00 ET) on every day.
+BARS_PER_DAY: Dict[str, float] = {
+    "second": 16 * 3600,
+    "minute": 16 * 60,
+    "hour": 16,
+    "day": 1,
+    "week": 1 / 7,
+    "month": 1 / 28,
+    "quarter": 1 / 90,
+    "year": 1 / 365,
+}
+
+# Largest ``limit`` the aggregates endpoint accepts.
+MAX_AGGS_LIMIT = 50000
+
+# Polygon interprets ``from_date``/``to_date`` as New York calendar days.
+MARKET_TZ = ZoneInfo("America/New_York")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return the delay in seconds of a ``Retry-After`` header value, if any."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def shard_date_range(
+    from_date: str,
+    to_date: str,
+    multiplier: int,
+    timespan: str,
+    limit: int = MAX_AGGS_LIMIT,
+) -> List[Tuple[str, str]]:
+    """Split ``from_date``..``to_date`` into consecutive ``YYYY-MM-DD`` shards.
+
+    Each shard spans as many days as fit under *limit* bars at the worst-case
+    density of ``BARS_PER_DAY``. Ranges given as millisecond timestamps are not
+    split and come back as a single shard.
+    """
+    try:
+        start = datetime.date.fromisoformat(from_date)
+        end = datetime.date.fromisoformat(to_date)
+    except (TypeError, ValueError):
+        return [(from_date, to_date)]
+
+    bars_per_day = BARS_PER_DAY.get(timespan, 1) / max(1, multiplier)
+    days_per_shard = max(1, int(limit // bars_per_day))
+    shards = []
+    while start <= end:
+        shard_end = min(end, start + datetime.timedelta(days=days_per_shard - 1))
+        shards.append((start.isoformat(), shard_end.isoformat()))
+        start = shard_end + datetime.timedelta(days=1)
+    return shards
 
 
 class PolygonApi:
     """Simple wrapper around the Polygon.io REST API."""
 
-    def __init__(self, api_key: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = "https://api.polygon.io",
+        pool_size: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: float = 10.0,
+        timeouts: Optional[Dict[str, float]] = None,
+        bar_store: Optional[BarStore] = None,
+        instrumentation: Optional[Instrumentation] = None,
+    ) -> None:
         """Initialize the client with an API key.
 
         If *api_key* is not supplied it will be read from the ``POLYGON_API_KEY``
         environment variable.
+
+        Requests go through a keep-alive session holding up to *pool_size*
+        connections. Responses with a status in ``RETRY_STATUSES`` and connection
+        errors are retried up to *max_retries* times, waiting ``Retry-After`` when
+        the server sends it and ``backoff_factor * 2 ** attempt`` (capped at
+        *max_backoff*) otherwise. *timeouts* overrides ``DEFAULT_TIMEOUTS`` per
+        path prefix; *timeout* applies to any other path.
+
+        With a *bar_store*, :meth:`get_historical_data` only downloads the days
+        missing from the store and serves the window from disk.
+
+        Requests are timed by *instrumentation* (disabled by default) under the
+        endpoint prefix of ``DEFAULT_TIMEOUTS``/*timeouts* they match; the first
+        byte mark comes from ``Response.elapsed``.
         """
         self.api_key = api_key or os.getenv("POLYGON_API_KEY")
         if not self.api_key:
             raise ValueError("Polygon API key not provided and POLYGON_API_KEY env var not set")
 
-        self.base_url = "https://api.polygon.io"
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.retries = 0
+        self.bar_store = bar_store
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+    def __enter__(self) -> "PolygonApi":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self.session.close()
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Return request, new/reused connection and retry counters."""
+        requests_sent = new_connections = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+                new_connections += pool.num_connections
+        return {
+            "requests": requests_sent,
+            "new_connections": new_connections,
+            "reused_connections": requests_sent - new_connections,
+            "retries": self.retries,
+        }
+
+    def _endpoint_for(self, path: str) -> str:
+        """Return the longest configured prefix of *path*, or *path* itself."""
+        matches = [prefix for prefix in self.timeouts if path.startswith(prefix)]
+        if not matches:
+            return path
+        return max(matches, key=len)
+
+    def _timeout_for(self, path: str) -> float:
+        """Return the timeout of the longest configured prefix of *path*."""
+        return self.timeouts.get(self._endpoint_for(path), self.timeout)
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Seconds to wait before retry *attempt*, honouring ``Retry-After``."""
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        if retry_after is not None:
+            return retry_after
+        return min(self.max_backoff, self.backoff_factor * 2 ** attempt)
 
     def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
         """Internal helper for GET requests."""
-        url = f"{self.base_url}{path}"
-        params = params or {}
+        return self._request(f"{self.base_url}{path}", params, self._timeout_for(path), self._endpoint_for(path))
+
+    def _request(self, url: str, params: Optional[Dict[str, Any]], timeout: float, endpoint: str) -> Any:
+        """GET *url* through the pooled session, retrying transient failures."""
+        params = dict(params or {})
         params["apiKey"] = self.api_key
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        timer = self.instrumentation.start(endpoint)
+        attempt = 0
+        while True:
+            timer.sent()
+            try:
+                response = self.session.get(url, params=params, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    timer.done(error=True)
+                    raise
+                delay = self._retry_delay(attempt)
+            else:
+                timer.firstByte(response.elapsed.total_seconds())
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    timer.done(len(response.content), error=not response.ok)
+                    response.raise_for_status()
+                    return response.json()
+                delay = self._retry_delay(attempt, response)
+                response.close()
+            self.retries += 1
+            attempt += 1
+            time.sleep(delay)
 
     def get_market_status(self) -> Dict[str, Any]:
         """Return the current market status."""
@@ -45,10 +234,169 @@ class PolygonApi:
         """Fetch aggregated historical data for a ticker.
 
         Parameters are passed straight through to Polygon. ``from_date`` and
-        ``to_date`` should be ``YYYY-MM-DD`` strings.
+        ``to_date`` should be ``YYYY-MM-DD`` strings. ``next_url`` is followed
+        until the range is complete; the first page's metadata is returned with
+        ``results`` holding the bars of every page. Use
+        :meth:`iter_historical_data` to stream long ranges instead.
+
+        When a bar store is configured and no extra *params* are given, bars
+        come from the store (``t``/``o``/``h``/``l``/``c``/``v`` only) and only
+        missing days are requested.
+        """
+        if self.bar_store is not None and not params:
+            return self._get_stored_historical_data(ticker, multiplier, timespan, from_date, to_date)
+
+        data: Dict[str, Any] = {}
+        results: List[Dict[str, Any]] = []
+        for page in self.iter_historical_pages(ticker, multiplier, timespan, from_date, to_date, **params):
+            if not data:
+                data = page
+            results.extend(page.get("results", []))
+        data.pop("next_url", None)
+        data["results"] = results
+        data["resultsCount"] = len(results)
+        return data
+
+    def _get_stored_historical_data(
+        self,
+        ticker: str,
+        multiplier: int,
+        timespan: str,
+        from_date: str,
+        to_date: str,
+    ) -> Dict[str, Any]:
+        """Gap-fill the bar store for whole New York days and read the range back."""
+
+        def day_start(day: datetime.date) -> int:
+            return int(datetime.datetime.combine(day, datetime.time(), MARKET_TZ).timestamp())
+
+        def day_of(seconds: int) -> str:
+            return datetime.datetime.fromtimestamp(seconds, MARKET_TZ).date().isoformat()
+
+        def fetch(gap_start: int, gap_end: int) -> BarBuffer:
+            buffer = BarBuffer()
+            for bar in self.iter_historical_data(ticker, multiplier, timespan, day_of(gap_start), day_of(gap_end)):
+                buffer.append(bar["t"] // 1000, bar["o"], bar["h"], bar["l"], bar["c"], bar["v"])
+            return buffer
+
+        first = datetime.date.fromisoformat(from_date)
+        last = datetime.date.fromisoformat(to_date)
+        start = day_start(first)
+        end = day_start(last + datetime.timedelta(days=1)) - 1
+        # Days up to yesterday are final, today's bars are refreshed on every call
+        complete_until = day_start(datetime.datetime.now(MARKET_TZ).date()) - 1
+        bars = self.bar_store.fill(
+            "polygon", ticker, f"{multiplier}{timespan}", start, end, fetch, completeUntil=complete_until
+        )
+        view = bars.view()
+        results = [
+            {"t": t * 1000, "o": o, "h": h, "l": l, "c": c, "v": v}
+            for t, o, h, l, c, v in zip(
+                view["time"].tolist(), view["open"].tolist(), view["high"].tolist(),
+                view["low"].tolist(), view["close"].tolist(), view["volume"].tolist(),
+            )
+        ]
+        return {"ticker": ticker, "status": "OK", "resultsCount": len(results), "results": results}
+
+    def iter_historical_pages(
+        self,
+        ticker: str,
+        multiplier: int,
+        timespan: str,
+        from_date: str,
+        to_date: str,
+        prefetch: bool = False,
+        **params: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield each aggregates response page, following ``next_url``.
+
+        With *prefetch* the next page is requested in a background thread while
+        the caller processes the current one, so at most two pages are held in
+        memory either way.
         """
         path = f"/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{from_date}/{to_date}"
-        return self._get(path, params)
+        timeout = self._timeout_for(path)
+        endpoint = self._endpoint_for(path)
+        url: Optional[str] = f"{self.base_url}{path}"
+        # next_url already carries the query (including the cursor) except the key
+        page_params: Optional[Dict[str, Any]] = params
+
+        if not prefetch:
+            while url:
+                page = self._request(url, page_params, timeout, endpoint)
+                url, page_params = page.get("next_url"), None
+                yield page
+            return
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            pending = executor.submit(self._request, url, page_params, timeout, endpoint)
+            while pending is not None:
+                page = pending.result()
+                url = page.get("next_url")
+                pending = executor.submit(self._request, url, None, timeout, endpoint) if url else None
+                yield page
+        finally:
+            if pending is not None:
+                pending.cancel()
+            executor.shutdown(wait=False)
+
+    def iter_historical_data(
+        self,
+        ticker: str,
+        multiplier: int,
+        timespan: str,
+        from_date: str,
+        to_date: str,
+        prefetch: bool = False,
+        **params: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield aggregate bars one by one across all pages of the range."""
+        for page in self.iter_historical_pages(
+            ticker, multiplier, timespan, from_date, to_date, prefetch=prefetch, **params
+        ):
+            yield from page.get("results", [])
+
+    def get_historical_data_sharded(
+        self,
+        ticker: str,
+        multiplier: int,
+        timespan: str,
+        from_date: str,
+        to_date: str,
+        max_workers: int = 4,
+        limit: int = MAX_AGGS_LIMIT,
+        **params: Any,
+    ) -> Dict[str, Any]:
+        """Fetch a wide date range as concurrent shards and stitch the result.
+
+        The range is split with :func:`shard_date_range`, shards are fetched by
+        up to *max_workers* threads (each following ``next_url``), and the bars
+        are merged in shard order with duplicate timestamps dropped. The result
+        has the shape of :meth:`get_historical_data`, sorted by ``t``.
+        """
+        shards = shard_date_range(from_date, to_date, multiplier, timespan, limit)
+        params.setdefault("limit", limit)
+        descending = params.get("sort") == "desc"
+
+        def fetch(shard: Tuple[str, str]) -> List[Dict[str, Any]]:
+            return list(self.iter_historical_data(ticker, multiplier, timespan, *shard, **params))
+
+        bars: Dict[int, Dict[str, Any]] = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(shards)))) as pool:
+            # map() yields in submission order, so stitching is deterministic
+            for shard_bars in pool.map(fetch, shards):
+                for bar in shard_bars:
+                    bars.setdefault(bar["t"], bar)
+
+        results = [bars[t] for t in sorted(bars, reverse=descending)]
+        return {
+            "ticker": ticker,
+            "adjusted": params.get("adjusted", True) not in (False, "false"),
+            "status": "OK",
+            "resultsCount": len(results),
+            "results": results,
+        }
 
     def get_last_trade(self, ticker: str) -> Dict[str, Any]:
         """Return the last trade for *ticker*."""
@@ -0,0 +1,219 @@
+"""Asyncio Polygon API Wrapper."""
+
+import asyncio
+import os
+import time
+from typing import Optional, Dict, Any, Awaitable, Callable, Iterable, List
+
+import aiohttp
+
+from instrumentation import Instrumentation
+from polygon_api import DEFAULT_TIMEOUTS, RETRY_STATUSES, parse_retry_after
+
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by any number of coroutines.
+
+    Tokens refill continuously at *rate* per second up to *capacity*, so bursts
+    of *capacity* requests are allowed while the long-run rate stays at *rate*.
+    A bucket may be shared between several :class:`AsyncPolygonApi` clients that
+    draw on the same plan quota.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Waiters queue on the lock, so tokens are handed out in FIFO order.
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class AsyncPolygonApi:
+    """Asyncio counterpart of :class:`polygon_api.PolygonApi`.
+
+    Use as an async context manager::
+
+        async with AsyncPolygonApi(max_concurrency=50, rate_limiter=TokenBucket(100)) as api:
+            trades = await api.gather(api.get_last_trade, tickers)
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = "https://api.polygon.io",
+        max_concurrency: int = 50,
+        rate_limiter: Optional[TokenBucket] = None,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: float = 10.0,
+        timeouts: Optional[Dict[str, float]] = None,
+        instrumentation: Optional[Instrumentation] = None,
+    ) -> None:
+        """Initialize the client with an API key.
+
+        If *api_key* is not supplied it will be read from the ``POLYGON_API_KEY``
+        environment variable. At most *max_concurrency* requests are in flight
+        at once and every attempt, retries included, takes a token from
+        *rate_limiter* when one is given. Retry, timeout and *instrumentation*
+        settings behave as in :class:`polygon_api.PolygonApi`; the queue span
+        includes the concurrency and rate limit waits.
+        """
+        self.api_key = api_key or os.getenv("POLYGON_API_KEY")
+        if not self.api_key:
+            raise ValueError("Polygon API key not provided and POLYGON_API_KEY env var not set")
+
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.retries = 0
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "AsyncPolygonApi":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the underlying HTTP session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so the session binds to the running event loop.
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def _endpoint_for(self, path: str) -> str:
+        """Return the longest configured prefix of *path*, or *path* itself."""
+        matches = [prefix for prefix in self.timeouts if path.startswith(prefix)]
+        if not matches:
+            return path
+        return max(matches, key=len)
+
+    def _timeout_for(self, path: str) -> float:
+        """Return the timeout of the longest configured prefix of *path*."""
+        return self.timeouts.get(self._endpoint_for(path), self.timeout)
+
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """Internal helper for GET requests."""
+        return await self._request(f"{self.base_url}{path}", params, self._timeout_for(path), self._endpoint_for(path))
+
+    async def _request(self, url: str, params: Optional[Dict[str, Any]], timeout: float, endpoint: str) -> Any:
+        """GET *url* within the concurrency and rate limits, retrying transient failures."""
+        session = self._get_session()
+        params = {key: str(value) for key, value in (params or {}).items()}
+        params["apiKey"] = self.api_key
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        timer = self.instrumentation.start(endpoint)
+        attempt = 0
+        while True:
+            delay = None
+            async with self._semaphore:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire()
+                timer.sent()
+                try:
+                    async with session.get(url, params=params, timeout=client_timeout) as response:
+                        timer.firstByte()
+                        if response.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                            body = await response.read()
+                            timer.done(len(body), error=not response.ok)
+                            response.raise_for_status()
+                            return await response.json()
+                        delay = parse_retry_after(response.headers.get("Retry-After"))
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt >= self.max_retries:
+                        timer.done(error=True)
+                        raise
+            if delay is None:
+                delay = min(self.max_backoff, self.backoff_factor * 2 ** attempt)
+            self.retries += 1
+            attempt += 1
+            # Back off outside the semaphore so other requests keep flowing.
+            await asyncio.sleep(delay)
+
+    async def get_market_status(self) -> Dict[str, Any]:
+        """Return the current market status."""
+        return await self._get("/v1/marketstatus/now")
+
+    async def get_historical_data(
+        self,
+        ticker: str,
+        multiplier: int,
+        timespan: str,
+        from_date: str,
+        to_date: str,
+        **params: Any,
+    ) -> Dict[str, Any]:
+        """Fetch aggregated historical data for a ticker, following ``next_url``.
+
+        Returns the same shape as :meth:`polygon_api.PolygonApi.get_historical_data`.
+        """
+        path = f"/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{from_date}/{to_date}"
+        timeout = self._timeout_for(path)
+        endpoint = self._endpoint_for(path)
+        data = await self._request(f"{self.base_url}{path}", params, timeout, endpoint)
+        results: List[Dict[str, Any]] = list(data.get("results", []))
+        next_url = data.pop("next_url", None)
+        while next_url:
+            page = await self._request(next_url, None, timeout, endpoint)
+            results.extend(page.get("results", []))
+            next_url = page.get("next_url")
+        data["results"] = results
+        data["resultsCount"] = len(results)
+        return data
+
+    async def get_last_trade(self, ticker: str) -> Dict[str, Any]:
+        """Return the last trade for *ticker*."""
+        return await self._get(f"/v2/last/trade/{ticker}")
+
+    async def gather(
+        self,
+        method: Callable[..., Awaitable[Any]],
+        tickers: Iterable[str],
+        *args: Any,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        """Run ``method(ticker, *args, **kwargs)`` for every ticker concurrently.
+
+        Returns a dict keyed by ticker. A ticker whose request failed maps to
+        the raised exception instead of aborting the whole batch.
+        """
+        tickers = list(tickers)
+        results = await asyncio.gather(
+            *(method(ticker, *args, **kwargs) for ticker in tickers), return_exceptions=True
+        )
+        return dict(zip(tickers, results))
@@ -0,0 +1,43 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from types import SimpleNamespace
+from account_store import AccountStore
+
+
+def test_value_prefers_base_currency_and_tracks_age():
+    now = [100.0]
+    store = AccountStore(clock=lambda: now[0])
+    assert store.value("TotalCashValue") is None and store.age() is None
+    store.updateValue("DU1", "TotalCashValue", "500.5", "USD")
+    store.updateValue("DU1", "TotalCashValue", "1000.25", "BASE")
+    store.updateValue("DU1", "AccountType", "INDIVIDUAL", "")
+    now[0] = 103.0
+    assert store.value("TotalCashValue") == 1000.25
+    assert store.value("TotalCashValue", currency="USD") == 500.5
+    assert store.value("AccountType") == "INDIVIDUAL"
+    assert store.age() == 3.0
+
+
+def test_zero_position_is_removed():
+    store = AccountStore()
+    contract = SimpleNamespace(conId=265598)
+    store.updatePosition("DU1", contract, 10, 1.0, 10.0, 0.9, 1.0, 0.0)
+    assert store.positions[("DU1", 265598)].position == 10
+    store.updatePosition("DU1", contract, 0, 1.0, 0.0, 0.0, 0.0, 1.0)
+    assert store.positions == {}
+
+
+def test_snapshot_diff_and_log_callback():
+    events = []
+    store = AccountStore(log=lambda event, payload: events.append(event))
+    store.updateValue("DU1", "NetLiquidation", "100", "USD")
+    store.updatePosition("DU2", SimpleNamespace(conId=1), 5, 1.0, 5.0, 1.0, 0.0, 0.0)
+    before = store.snapshot()
+    store.updateValue("DU1", "NetLiquidation", "120", "USD")
+    store.updatePosition("DU2", SimpleNamespace(conId=1), 5, 1.0, 5.0, 1.0, 0.0, 0.0)
+    store.updatePosition("DU2", SimpleNamespace(conId=2), 3, 2.0, 6.0, 2.0, 0.0, 0.0)
+    changes = store.diff(before)
+    assert changes["values"][("DU1", "NetLiquidation", "USD")][1].value == "120"
+    assert list(changes["positions"]) == [("DU2", 2)] and changes["positions"][("DU2", 2)][0] is None
+    assert sorted(store.positionsOf("DU2")) == [1, 2] and store.accounts() == ["DU1", "DU2"]
+    assert events == ["value", "position", "value", "position", "position"]
@@ -0,0 +1,43 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import calendar
+import datetime
+import numpy as np
+import pytest
+from bar_buffer import BarBuffer, parseBarDate
+
+
+def test_parse_bar_date_formats():
+    expected = calendar.timegm((2024, 1, 2, 9, 30, 0))
+    assert parseBarDate("20240102 09:30:00") == expected
+    assert parseBarDate("20240102  09:30:00") == expected
+    assert parseBarDate("20240102 09:30:00 US/Eastern") == expected
+    assert parseBarDate(datetime.datetime(2024, 1, 2, 9, 30, tzinfo=datetime.timezone.utc)) == expected
+    assert parseBarDate("20240102") == parseBarDate(datetime.date(2024, 1, 2))
+
+
+def test_buffer_grows_and_exposes_zero_copy_views():
+    buffer = BarBuffer(capacity=2)
+    for i in range(5):
+        buffer.append(i * 60, 1.0 + i, 2.0 + i, 0.5 + i, 1.5 + i, 100 * i)
+    assert len(buffer) == 5 and buffer.capacity == 8
+    close = buffer.column("close")
+    assert np.shares_memory(close, buffer.view()["close"])
+    assert close.tolist() == [1.5, 2.5, 3.5, 4.5, 5.5]
+
+    frame = buffer.to_pandas()
+    assert list(frame.columns) == ["date", "open", "high", "low", "close", "volume"]
+    assert frame["volume"].iloc[-1] == 400
+    assert buffer.to_records()[1]["date"] == "19700101 00:01:00"
+
+
+def test_extend_keeps_string_dates_like_append():
+    appended = BarBuffer(keepDates=True)
+    appended.append(parseBarDate("20240102 09:30:00"), 1.0, 2.0, 0.5, 1.5, 100, "20240102 09:30:00")
+    extended = BarBuffer(keepDates=True)
+    extended.extend(appended.time, *(appended.column(name) for name in ("open", "high", "low", "close", "volume")))
+    assert extended.to_records() == appended.to_records()
+    assert [parseBarDate(record["date"]) for record in extended.to_records()] == appended.time.tolist()
+    raw = BarBuffer(keepDates=True)
+    raw.extend([0], [1.0], [1.0], [1.0], [1.0], [1.0], dates=["19700101"])
+    assert raw.dates == ["19700101"]
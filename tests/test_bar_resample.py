@@ -0,0 +1,62 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import threading
+import numpy as np
+from bar_buffer import BarBuffer, parseBarDate
+from bar_resample import BarResampler, resampleBars
+from benchmarks.fake_tws import FakeTws, REQ_HISTORICAL_DATA
+from ibkr_api import IbkrApi
+
+
+def rth_bars(days=("20240104", "20240105")) -> BarBuffer:
+    times = np.concatenate([parseBarDate(f"{day} 09:30:00") + np.arange(78) * 300 for day in days])
+    price = np.arange(times.size, dtype=np.float64)
+    buffer = BarBuffer()
+    buffer.extend(times, price, price + 1, price - 1, price + 0.5, np.ones(times.size))
+    return buffer
+
+
+def test_buckets_follow_session_open_and_day_breaks():
+    hourly = resampleBars(rth_bars(), 3600)
+    labels = [parseBarDate(f"20240104 {clock}") for clock in
+              ("09:30:00", "10:00:00", "11:00:00", "12:00:00", "13:00:00", "14:00:00", "15:00:00")]
+    assert hourly.time[:7].tolist() == labels
+    assert len(hourly) == 14
+    first = {name: column[0] for name, column in hourly.view().items()}
+    assert (first["open"], first["high"], first["low"], first["close"], first["volume"]) == (0, 6, -1, 5.5, 6)
+
+    daily = resampleBars(rth_bars(), 86400)
+    assert daily.time.tolist() == [parseBarDate("20240104"), parseBarDate("20240105")]
+    assert daily.column("volume").tolist() == [78, 78]
+
+
+def test_incremental_updates_match_one_shot_resample():
+    bars = rth_bars()
+    periods = {"10m": 600, "1h": 3600, "4h": 14400, "1d": 86400}
+    resampler = BarResampler(periods, 300)
+    view = bars.view()
+    for start in range(0, len(bars), 25):
+        chunk = BarBuffer()
+        # Each chunk repeats the previous last bar, as a revised forming bar
+        begin = max(0, start - 1)
+        chunk.extend(*(column[begin:start + 25] for column in view.values()))
+        resampler.update(chunk)
+    for name, seconds in periods.items():
+        expected = resampleBars(bars, seconds).view()
+        for column, values in resampler[name].view().items():
+            assert values.tolist() == expected[column].tolist()
+
+
+def test_ibkr_multi_period_fetch_sends_one_request():
+    with FakeTws(bars=24) as tws:
+        api = IbkrApi("127.0.0.1", tws.port, clientId=1, timeout=5)
+        api.connect()
+        threading.Thread(target=api.run, daemon=True).start()
+        try:
+            contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+            bars = api.get_historical_data_multi(contract, ["5m", "30m", "1h"], "1 D")
+            assert len(bars["5m"]) == 24 and 2 <= len(bars["1h"]) <= 3
+            assert bars["30m"].column("volume").sum() == bars["5m"].column("volume").sum()
+            assert tws.requestCounts[REQ_HISTORICAL_DATA] == 1
+        finally:
+            api.disconnect()
@@ -0,0 +1,44 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import pytest
+from bar_buffer import BarBuffer
+from bar_store import BarStore, durationString
+
+
+def _bars(times, price=1.0):
+    buffer = BarBuffer()
+    for t in times:
+        buffer.append(t, price, price, price, price, 10)
+    return buffer
+
+
+def test_write_merges_and_tracks_coverage(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.write("ibkr", "AAPL", "5m", _bars([0, 300, 600]), covered=(0, 899))
+    store.write("ibkr", "AAPL", "5m", _bars([600, 900], price=2.0), covered=(900, 1199))
+
+    bars = store.read("ibkr", "AAPL", "5m", 300, 900)
+    assert bars.time.tolist() == [300, 600, 900]
+    assert bars.column("close").tolist() == [1.0, 2.0, 2.0]
+    assert store.coverage("ibkr", "AAPL", "5m") == [(0, 1199)]
+    assert store.missing("ibkr", "AAPL", "5m", -100, 1500) == [(-100, -1), (1200, 1500)]
+
+
+def test_fill_fetches_only_missing_ranges(tmp_path):
+    store = BarStore(str(tmp_path))
+    fetched = []
+
+    def fetch(start, end):
+        fetched.append((start, end))
+        return _bars(range(start - start % 300, end + 1, 300))
+
+    store.fill("ibkr", "AAPL", "5m", 0, 3000, fetch, completeUntil=2700)
+    bars = store.fill("ibkr", "AAPL", "5m", 0, 3600, fetch, completeUntil=3300, mergeGaps=True)
+    assert fetched == [(0, 3000), (2701, 3600)]
+    assert bars.time.tolist() == list(range(0, 3601, 300))
+
+
+def test_duration_string():
+    assert durationString(3600) == "3600 S"
+    assert durationString(86401) == "2 D"
+    assert durationString(400 * 86400) == "2 Y"
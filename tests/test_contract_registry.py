@@ -0,0 +1,74 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import threading
+from benchmarks.fake_tws import FakeTws, REQ_CONTRACT_DATA
+from ibkr_api import IbkrApi
+
+
+def connected_api(port, cache) -> IbkrApi:
+    api = IbkrApi("127.0.0.1", port, clientId=1, timeout=5, contractCache=cache)
+    api.connect()
+    threading.Thread(target=api.run, daemon=True).start()
+    return api
+
+
+def test_create_contract_interns_instead_of_growing():
+    api = IbkrApi(host='dummy', port=0, clientId=0)
+    contracts = [api.create_contract("AAPL", "STK", "SMART", "USD") for _ in range(10000)]
+    assert all(contract is contracts[0] for contract in contracts)
+    assert api.create_contract("MSFT", "STK", "SMART", "USD") is not contracts[0]
+    assert len(api.contract_list) == 2
+
+
+def test_bulk_qualification_is_cached_across_runs(tmp_path):
+    cache = str(tmp_path / "contracts.json")
+    symbols = [f"S{index}" for index in range(20)]
+    with FakeTws() as tws:
+        api = connected_api(tws.port, cache)
+        try:
+            contracts = [api.create_contract(symbol, "STK", "SMART", "USD") for symbol in symbols]
+            assert len(api.qualify_contracts(contracts)) == 20 and all(contract.conId for contract in contracts)
+            assert tws.requestCounts[REQ_CONTRACT_DATA] == 20
+        finally:
+            api.disconnect()
+
+        # A restart resolves the same symbols from the cache file
+        api = connected_api(tws.port, cache)
+        try:
+            contract = api.create_contract("S3", "STK", "SMART", "USD")
+            assert contract.conId == contracts[3].conId
+            assert api.qualify_contracts([api.create_contract(symbol, "STK", "SMART", "USD") for symbol in symbols])
+            assert api.get_contract_details(contract).longName == "S3 INC"
+            assert tws.requestCounts[REQ_CONTRACT_DATA] == 20
+        finally:
+            api.disconnect()
+
+
+def test_expiries_and_strikes_resolve_separately():
+    from ibapi.contract import Contract
+
+    def derivative(secType, expiry, strike=0.0, right=""):
+        contract = Contract()
+        contract.symbol, contract.secType, contract.exchange, contract.currency = "ES", secType, "CME", "USD"
+        contract.lastTradeDateOrContractMonth, contract.strike, contract.right = expiry, strike, right
+        return contract
+
+    with FakeTws() as tws:
+        api = connected_api(tws.port, None)
+        try:
+            december = derivative("FUT", "202412")
+            assert api.qualify_contracts([december]) == [december]
+            march = derivative("FUT", "202503")
+            assert not api.contracts.resolve(march)
+            assert api.contracts.lookup(derivative("FUT", "202506")) is None
+            assert api.qualify_contracts([march]) == [march]
+            assert march.conId != december.conId
+            assert (december.lastTradeDateOrContractMonth, march.lastTradeDateOrContractMonth) == ("202412", "202503")
+
+            call, put = derivative("OPT", "20241220", 5000.0, "C"), derivative("OPT", "20241220", 5000.0, "P")
+            assert api.qualify_contracts([call, put]) == [call, put]
+            assert len({call.conId, put.conId, december.conId}) == 3
+            assert api.get_contract_details(march).contract.conId == march.conId
+            assert tws.requestCounts[REQ_CONTRACT_DATA] == 4
+        finally:
+            api.disconnect()
@@ -0,0 +1,31 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import threading
+from benchmarks.fake_tws import FakeTws
+from ib_insync_if import IbInsyncApi
+from ibkr_api import IbkrApi
+
+
+def test_ibkr_api_round_trips_against_fake_tws():
+    with FakeTws(bars=3, latency=0.01) as tws:
+        api = IbkrApi("127.0.0.1", tws.port, clientId=1, timeout=5)
+        api.connect()
+        threading.Thread(target=api.run, daemon=True).start()
+        try:
+            contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+            assert api.get_historical_data(contract, "5m", "1 D").column("close").tolist() == [100.5, 101.5, 102.5]
+            assert [row.value for row in api.getCashVal("AvailableFunds")] == ["100000.00"]
+        finally:
+            api.disconnect()
+
+
+def test_ib_insync_connects_and_fetches_from_fake_tws():
+    with FakeTws(bars=2) as tws:
+        api = IbInsyncApi("127.0.0.1", tws.port, clientId=2)
+        api.connect()
+        try:
+            contract = api.createContract("MSFT", "STK", "SMART", "USD")
+            assert api.getHistoricalData("1d", "1 W", contract)["close"].tolist() == [100.5, 101.5]
+            assert api.getTotalCashVal() == 150000.0
+        finally:
+            api.disconnect()
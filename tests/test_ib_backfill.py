@@ -0,0 +1,51 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import threading
+import numpy as np
+from bar_buffer import BarBuffer, parseBarDate
+from bar_store import BarStore
+from benchmarks.fake_tws import FakeTws, REQ_HISTORICAL_DATA
+from ib_backfill import DAY_SECONDS, planChunks, stitchBars
+from ib_pacing import PacingGovernor
+from ibkr_api import IbkrApi
+
+
+def test_chunks_are_legal_and_cover_the_span():
+    end = parseBarDate("20240105 16:00:00")
+    start = end - 730 * DAY_SECONDS
+    chunks = planChunks(start, end, "5 mins")
+    assert len(chunks) == 105
+    assert chunks[0].end == end and chunks[-1].start == start
+    assert all(newer.start == older.end for newer, older in zip(chunks, chunks[1:]))
+    assert chunks[0].duration == "7 D" and chunks[-1].duration == "2 D"
+    assert planChunks(end - 3600, end, "1 min") == [(end - 3600, end, "3600 S")]
+
+
+def test_stitch_orders_and_drops_overlapping_bars():
+    first, second = BarBuffer(), BarBuffer()
+    first.extend([300, 600, 900], [1, 2, 3], [1, 2, 3], [1, 2, 3], [1, 2, 3], [1, 1, 1])
+    second.extend([0, 300], [0, 9], [0, 9], [0, 9], [0, 9], [1, 1])
+    stitched = stitchBars([first, BarBuffer(), second])
+    assert stitched.time.tolist() == [0, 300, 600, 900]
+    assert np.all(np.diff(stitched.time) > 0)
+
+
+def test_ibkr_backfill_resumes_from_checkpoint(tmp_path):
+    with FakeTws(bars=10) as tws:
+        api = IbkrApi("127.0.0.1", tws.port, clientId=1, timeout=5,
+                      pacing=PacingGovernor(maxRequests=10 ** 9, identicalInterval=0, contractMaxRequests=10 ** 9))
+        api.connect()
+        threading.Thread(target=api.run, daemon=True).start()
+        try:
+            contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+            store = BarStore(str(tmp_path))
+            bars = api.backfill_historical_data(contract, "5m", "30 D", max_in_flight=3, checkpoint=store)
+            sent = tws.requestCounts[REQ_HISTORICAL_DATA]
+            assert sent >= 5 and len(bars) == 10
+
+            again = api.backfill_historical_data(contract, "5m", "30 D", checkpoint=store)
+            # Only the forming tail past the last complete bar is requested again
+            assert tws.requestCounts[REQ_HISTORICAL_DATA] - sent <= 1
+            assert again.time.tolist() == bars.time.tolist()
+        finally:
+            api.disconnect()
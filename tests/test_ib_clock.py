@@ -0,0 +1,33 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import pytest
+from ib_clock import ServerClock, formatIbTime
+
+
+def test_offset_from_shortest_round_trip_and_periodic_resync():
+    now = [100.0]
+    calls = []
+
+    def fetch():
+        # round trips of 0.4 s then 0.1 s, the server clock runs 900.2 s ahead and truncates
+        roundTrip = 0.4 if len(calls) % 2 == 0 else 0.1
+        calls.append(roundTrip)
+        now[0] += roundTrip / 2
+        reading = int(now[0] + 900.2)
+        now[0] += roundTrip / 2
+        return reading
+
+    clock = ServerClock(fetch, samples=2, resyncInterval=60, monotonic=lambda: now[0])
+    assert clock.now() == pytest.approx(now[0] + 900.2, abs=0.5)
+    assert clock.roundTrip == pytest.approx(0.1)
+    now[0] += 30
+    clock.now()
+    assert len(calls) == 2
+    now[0] += 30
+    clock.now()
+    assert len(calls) == 4
+
+
+def test_format_uses_daylight_saving_rules():
+    assert formatIbTime(1704214800) == "20240102 12:00:00 US/Eastern"   # 17:00 UTC in winter
+    assert formatIbTime(1719853200) == "20240701 13:00:00 US/Eastern"   # 17:00 UTC in summer
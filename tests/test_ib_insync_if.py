@@ -0,0 +1,126 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import asyncio
+import datetime
+import threading
+import time
+import pytest
+from types import SimpleNamespace
+from ib_insync import AccountValue, BarData, Contract, ContractDetails
+from ib_insync_if import IbInsyncApi
+
+
+def _fake_api(delay=0.05):
+    api = IbInsyncApi(host='dummy', port=0, clientId=0)
+    calls = []
+
+    async def reqCurrentTimeAsync():
+        return datetime.datetime.fromtimestamp(1700000000, datetime.timezone.utc)
+
+    async def reqContractDetailsAsync(contract):
+        return [SimpleNamespace(tradingHours="")]
+
+    async def reqHistoricalDataAsync(contract, *args):
+        calls.append(contract.symbol)
+        await asyncio.sleep(delay)
+        if contract.symbol == "BAD":
+            raise ValueError("no data")
+        return [BarData(date=datetime.date(2024, 1, 2), open=1.0, high=2.0, low=0.5, close=1.5, volume=10)]
+
+    api.reqCurrentTimeAsync = reqCurrentTimeAsync
+    api.reqContractDetailsAsync = reqContractDetailsAsync
+    api.reqHistoricalDataAsync = reqHistoricalDataAsync
+    return api, calls
+
+
+def test_get_historical_data_many_runs_concurrently():
+    api, calls = _fake_api()
+    contracts = [api.createContract(f"S{i}", "STK", "SMART", "USD") for i in range(20)]
+    start = time.monotonic()
+    frames = asyncio.run(api.getHistoricalDataManyAsync(contracts, "1d", "1 W", maxConcurrency=10))
+    assert time.monotonic() - start < 0.5
+    assert sorted(frames) == list(range(20))
+    assert frames[3]["close"].tolist() == [1.5]
+
+
+def test_get_historical_data_many_concat_skips_failures():
+    api, calls = _fake_api(delay=0)
+    contracts = [api.createContract(symbol, "STK", "SMART", "USD") for symbol in ("AAPL", "BAD", "MSFT")]
+    dataframe = asyncio.run(api.getHistoricalDataManyAsync(contracts, "1d", "1 W", concat=True))
+    assert dataframe["symbol"].tolist() == ["AAPL", "MSFT"]
+    assert dataframe["job"].tolist() == [0, 2]
+    assert dataframe["close"].tolist() == [1.5, 1.5]
+
+
+def test_get_historical_data_many_keeps_contracts_sharing_a_symbol():
+    api, calls = _fake_api(delay=0)
+    stock = api.createContract("AAPL", "STK", "SMART", "USD")
+    option = Contract(symbol="AAPL", secType="OPT", exchange="SMART", currency="USD",
+                      lastTradeDateOrContractMonth="20241220", strike=200.0, right="C")
+    frames = asyncio.run(api.getHistoricalDataManyAsync([stock, option], "1d", "1 W"))
+    assert sorted(frames) == [0, 1] and calls == ["AAPL", "AAPL"]
+
+
+def test_identical_requests_share_one_response():
+    api, calls = _fake_api()
+    contract = api.createContract("AAPL", "STK", "SMART", "USD")
+
+    async def both():
+        return await asyncio.gather(api.getHistoricalDataAsync("1d", "1 W", contract),
+                                    api.getHistoricalDataAsync("1d", "1 W", contract))
+    first, second = asyncio.run(both())
+    assert calls == ["AAPL"]
+    assert first.equals(second)
+
+
+def test_sync_request_shares_an_identical_request_in_flight():
+    # Sync calls run the ib_insync event loop of this thread
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    api = IbInsyncApi(host='dummy', port=0, clientId=0)
+    calls = []
+    api.reqHistoricalData = lambda contract, *args: calls.append(contract.symbol) or []
+    contract = api.createContract("AAPL", "STK", "SMART", "USD")
+    requestKey, _ = api._historicalRequestKeys(contract, "", "1 W", "1 day", 1)
+    future, isNew = api.pacing.claim(requestKey)
+    assert isNew
+    bars = [BarData(date=datetime.date(2024, 1, 2), close=1.5)]
+    threading.Timer(0.05, future.set_result, [bars]).start()
+    assert api._reqHistoricalDataPaced(contract, "", "1 W", "1 day", 1) is bars
+    assert calls == [] and api.pacing.deduplicated == 1
+
+    assert api._reqHistoricalDataPaced(contract, "", "1 W", "1 day", 1) == []
+    assert calls == ["AAPL"]
+
+
+def test_cash_values_are_served_from_account_events():
+    api = IbInsyncApi(host='dummy', port=0, clientId=0)
+    api.getAccountSummary = lambda: (_ for _ in ()).throw(AssertionError("no request expected"))
+    api.accountValueEvent.emit(AccountValue("DU1", "AvailableFunds", "250.0", "USD", ""))
+    api.accountSummaryEvent.emit(AccountValue("DU1", "TotalCashValue", "900.0", "USD", ""))
+    assert api.getCashVal() == 250.0
+    assert api.getTotalCashVal() == 900.0
+    assert set(api.getAccountSummaryDf()["tag"]) == {"AvailableFunds", "TotalCashValue"}
+
+
+def test_account_priming_raises_the_underlying_error():
+    api = IbInsyncApi(host='dummy', port=0, clientId=0)
+    api.managedAccounts = lambda: []
+    with pytest.raises(IndexError):
+        api.getAccountSummaryDf()
+
+
+def test_contract_details_record_only_a_single_match():
+    api = IbInsyncApi(host='dummy', port=0, clientId=0)
+    matches = {"ES": [1, 2], "AAPL": [3], "NONE": []}
+
+    async def reqContractDetailsAsync(contract):
+        return [ContractDetails(contract=Contract(symbol=contract.symbol, conId=conId))
+                for conId in matches[contract.symbol]]
+    api.reqContractDetailsAsync = reqContractDetailsAsync
+
+    ambiguous, unique, unknown = (api.createContract(symbol, "STK", "SMART", "USD") for symbol in matches)
+    assert asyncio.run(api.getContractDetailsAsync(ambiguous)).contract.conId == 1
+    assert ambiguous.conId == 0 and ambiguous not in api.contracts
+    assert asyncio.run(api.getContractDetailsAsync(unknown)) is None
+    assert asyncio.run(api.getContractDetailsAsync(unique)).contract.conId == 3
+    assert unique.conId == 3
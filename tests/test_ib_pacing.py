@@ -0,0 +1,50 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import pytest
+from ib_pacing import PacingGovernor
+
+
+def test_acquire_waits_for_oldest_request_to_leave_window():
+    now = [0.0]
+    slept = []
+    def sleep(sec):
+        slept.append(sec)
+        now[0] += sec
+    governor = PacingGovernor(maxRequests=2, window=10.0, clock=lambda: now[0], sleep=sleep)
+    governor.acquire()
+    now[0] = 4.0
+    governor.acquire()
+    assert governor.delay() == pytest.approx(6.0)
+    governor.acquire()
+    assert slept == [pytest.approx(6.0)]
+
+
+def _fake_clock():
+    now = [0.0]
+    def sleep(sec):
+        now[0] += sec
+    return now, sleep
+
+
+def test_identical_and_same_contract_rules():
+    now, sleep = _fake_clock()
+    governor = PacingGovernor(clock=lambda: now[0], sleep=sleep)
+    governor.acquire(("AAPL", "1 D"), ("AAPL", "BID"))
+    assert governor.delay(("AAPL", "1 D"), ("AAPL", "BID")) == pytest.approx(15.0)
+    # four more distinct AAPL requests are fine, the sixth within 2 s has to wait
+    for duration in ("2 D", "3 D", "4 D", "5 D"):
+        assert governor.acquire(("AAPL", duration), ("AAPL", "BID")) == 0
+    assert governor.delay(("AAPL", "6 D"), ("AAPL", "BID")) == pytest.approx(2.0)
+    assert governor.delay(("MSFT", "1 D"), ("MSFT", "BID")) == 0
+    assert governor.acquire(("AAPL", "6 D"), ("AAPL", "BID")) == pytest.approx(2.0)
+    assert governor.stats()["maxWait"] == pytest.approx(2.0)
+
+
+def test_claim_shares_identical_in_flight_request():
+    governor = PacingGovernor()
+    future, isNew = governor.claim("key")
+    same, sameIsNew = governor.claim("key")
+    assert isNew and not sameIsNew and same is future
+    future.set_result([])
+    assert governor.claim("key")[1]
+    assert governor.stats()["deduplicated"] == 1
@@ -0,0 +1,51 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import pytest
+from ib_realtime import BarRing, Bar, RealTimeHub, TICK_BID, TICK_ASK_SIZE
+
+
+def test_ring_overwrites_oldest():
+    ring = BarRing(capacity=3)
+    for t in range(5):
+        ring.append(Bar(t, t, t, t, t, 1))
+    assert ring.snapshot().time.tolist() == [2, 3, 4]
+    assert ring.snapshot(2).column("close").tolist() == [3.0, 4.0]
+
+
+def test_snapshot_falls_back_to_the_write_lock_while_a_write_overlaps():
+    ring = BarRing(capacity=3)
+    ring.append(Bar(1, 1, 1, 1, 1, 1))
+    # A sequence left odd looks like a write in progress to the lock-free reader
+    ring._seq += 1
+    assert ring.snapshot().time.tolist() == [1]
+
+
+def test_real_time_bars_aggregate_into_periods():
+    hub = RealTimeHub({"5m": 300, "1h": 3600}, ringSize=16)
+    for i in range(61):    # five minutes and one bar of 5 second bars
+        hub.onBar("AAPL", 5 * i, 100 + i, 101 + i, 99 + i, 100.5 + i, 10)
+    bars = hub.bars("AAPL", "5m")
+    assert bars.time.tolist() == [0]
+    assert (bars.column("open")[0], bars.column("high")[0], bars.column("low")[0]) == (100, 160, 99)
+    assert bars.column("volume")[0] == 600
+    assert hub.partialBar("AAPL", "5m") == Bar(300, 160.0, 161.0, 159.0, 160.5, 10.0)
+    assert hub.partialBar("AAPL", "1h").volume == 610
+
+
+def test_keep_up_to_date_revisions_replace_the_forming_bar():
+    hub = RealTimeHub({"5m": 300, "10m": 600})
+    hub.stream("AAPL", sourcePeriod=300)
+    hub.onBar("AAPL", 0, 10, 11, 9, 10, 5, revision=True)
+    hub.onBar("AAPL", 300, 10, 12, 10, 11, 5, revision=True)
+    hub.onBar("AAPL", 300, 10, 13, 8, 12, 7, revision=True)
+    assert len(hub.bars("AAPL")) == 2
+    assert hub.partialBar("AAPL", "10m") == Bar(0, 10.0, 13.0, 8.0, 12.0, 12.0)
+
+
+def test_quote_snapshot():
+    hub = RealTimeHub({})
+    hub.onTick("AAPL", 1, TICK_BID, 100.5)
+    hub.onTick("AAPL", 2, TICK_ASK_SIZE, 300)
+    hub.onTick("AAPL", 3, 66, 100.25)    # delayed bid
+    quote = hub.latestQuote("AAPL")
+    assert (quote.bid, quote.askSize, quote.time) == (100.25, 300.0, 3)
@@ -0,0 +1,71 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import asyncio
+import datetime
+import numpy as np
+import ib_insync
+from bar_buffer import BarBuffer, parseBarDate
+from bar_store import BarStore
+from ib_replay import IbInsyncReplayApi, IbkrReplayApi, ReplayClock
+
+
+def stored_bars(root) -> BarStore:
+    store = BarStore(str(root))
+    days = ("20240102", "20240103", "20240104")
+    times = np.concatenate([parseBarDate(f"{day} 09:30:00") + np.arange(78) * 300 for day in days])
+    price = np.arange(times.size, dtype=np.float64)
+    bars = BarBuffer()
+    bars.extend(times, price, price + 1, price - 1, price + 0.5, np.ones(times.size))
+    for symbol in ("AAPL-STK-SMART-USD", "MSFT-STK-SMART-USD"):
+        store.write("ibkr", symbol, "5m-BID-all", bars)
+        store.write("ibkr", symbol, "5m-BID-rth", bars)
+    return store
+
+
+def test_ibkr_replay_serves_only_closed_bars_through_callbacks(tmp_path):
+    api = IbkrReplayApi(stored_bars(tmp_path), "20240103 10:00:00")
+    contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+    assert api.getCurrTime() == "20240103 10:00:00 US/Eastern"
+    assert api.isRegTradingHour(contract) == 1
+
+    bars = api.get_historical_data(contract, "5m", "1 D")
+    assert bars.time[-1] == parseBarDate("20240103 09:55:00")
+    records = api.get_historical_data(contract, "5m", "1 D", as_records=True)
+    assert [record["close"] for record in records] == bars.column("close").tolist()
+
+    msft = api.create_contract("MSFT", "STK", "SMART", "USD")
+    seen = 0
+    for batch in api.replay([contract, msft], "5m", batchSize=20):
+        latest = api.get_historical_data(contract, "5m", "1 D")
+        assert latest.time[-1] == batch.bars["AAPL-STK-SMART-USD"].time[-1]
+        seen += sum(len(bars) for bars in batch.bars.values())
+    assert seen == 2 * (78 + 72)
+    assert api.getCurrTime() == "20240104 16:00:00 US/Eastern"
+
+
+def test_ib_insync_replay_returns_bar_data_lists(tmp_path):
+    # Earlier asyncio.run() calls leave the main thread without a loop for ib_insync
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    api = IbInsyncReplayApi(stored_bars(tmp_path), "20240104 09:30:00")
+    contract = api.createContract("AAPL", "STK", "SMART", "USD")
+    bars = api.reqHistoricalData(contract, "", "1 D", "5 mins", "BID", True)
+    assert isinstance(bars, ib_insync.BarDataList) and bars.durationStr == "1 D"
+    assert len(bars) == 78 and bars[-1].date == datetime.datetime(2024, 1, 3, 15, 55)
+
+    async def firstBatch():
+        batches = api.replayAsync([contract], "5m", batchSize=10, asBarDataList=True)
+        batch = await batches.__anext__()
+        await batches.aclose()
+        return batch
+    batch = api.run(firstBatch())
+    assert len(batch.bars["AAPL-STK-SMART-USD"]) == 10
+    assert api.getCurrTime() == "20240104 10:20:00 US/Eastern"
+
+
+def test_paced_clock_sleeps_scaled_simulated_time():
+    now, sleeps = [100.0], []
+    clock = ReplayClock(0, speed=60, sleep=lambda seconds: sleeps.append(seconds) or now.__setitem__(0, now[0] + seconds),
+                        monotonic=lambda: now[0])
+    clock.advance(600)
+    clock.advance(1200)
+    assert sleeps == [10.0, 10.0] and clock.now() == 1200
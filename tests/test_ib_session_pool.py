@@ -0,0 +1,40 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import time
+from benchmarks.fake_tws import FakeTws
+from ib_pacing import PacingGovernor
+from ib_session_pool import IbSessionPool
+
+
+def unpaced():
+    return PacingGovernor(maxRequests=10 ** 9, identicalInterval=0, contractMaxRequests=10 ** 9)
+
+
+def test_requests_are_spread_across_client_ids():
+    with FakeTws(bars=3, latency=0.05) as tws:
+        with IbSessionPool("127.0.0.1", tws.port, size=3, baseClientId=10, slots=2, timeout=5,
+                           pacing=unpaced()) as pool:
+            contracts = [pool.members[0].api.create_contract(f"S{index}", "STK", "SMART", "USD") for index in range(12)]
+            futures = [pool.getHistoricalData(contract, "5m", f"{index + 1} D") for index, contract in enumerate(contracts)]
+            assert all(len(future.result(10)) == 3 for future in futures)
+            assert pool.getContractDetails(contracts[0]).result(10).contract.symbol == "S0"
+            members = pool.stats()["members"]
+            assert sorted(members) == [10, 11, 12]
+            assert all(member["completed"] >= 2 and member["healthy"] for member in members.values())
+
+
+def test_dropped_connection_is_reconnected_without_losing_jobs():
+    with FakeTws(bars=2, latency=0.2) as tws:
+        with IbSessionPool("127.0.0.1", tws.port, size=2, slots=2, timeout=5, reconnectDelay=0.05,
+                           pacing=unpaced()) as pool:
+            contract = pool.members[0].api.create_contract("AAPL", "STK", "SMART", "USD")
+            futures = [pool.getHistoricalData(contract, "5m", f"{index + 1} D") for index in range(8)]
+            time.sleep(0.1)
+            pool.members[0].api.disconnect()
+            assert all(len(future.result(10)) == 2 for future in futures)
+
+            deadline = time.monotonic() + 5
+            while not pool.stats()["members"][1]["healthy"] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            member = pool.stats()["members"][1]
+            assert member["healthy"] and member["failures"] == 1 and member["reconnects"] == 1
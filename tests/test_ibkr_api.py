@@ -1,11 +1,253 @@
 import os, sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import threading
+import time
 import pytest
+from ibapi.contract import ContractDetails
+from bar_buffer import BarBuffer
+from ib_pacing import PacingGovernor
 from ibkr_api import IbkrApi
 
 
-def test_get_order_id_wraps_to_one():
+def test_order_ids_share_one_sequence_without_wrapping():
     api = IbkrApi(host='dummy', port=0, clientId=0)
-    for _ in range(10000):
-        api.get_order_id()
-    assert api.get_order_id() == 1
+    bracket = api.BracketOrder(api.get_order_id(), "BUY", 1, 10.0, 11.0, 9.0)
+    assert [order.orderId for order in bracket] == [1, 2, 3]
+    assert list(api.reserve_order_ids(3)) == [4, 5, 6]
+    assert [order.orderId for order in api.BracketOrder(None, "BUY", 1, 10.0, 11.0, 9.0)] == [7, 8, 9]
+
+    api.nextValidId(9998)
+    assert list(api.reserve_order_ids(6)) == list(range(9998, 10004))
+    assert api.get_order_id() == 10004
+
+
+class _Bar:
+    def __init__(self, date, price):
+        self.date = date
+        self.open = self.high = self.low = self.close = price
+        self.volume = 100
+
+
+def _fake_contract_details(api, tradingHours):
+    class _Details:
+        pass
+    details = _Details()
+    details.tradingHours = tradingHours
+
+    def reqContractDetails(reqId, contract):
+        api.contractDetails(reqId, details)
+        api.contractDetailsEnd(reqId)
+    api.reqContractDetails = reqContractDetails
+
+
+def test_get_historical_data_returns_on_historical_data_end():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1)
+    api.reqCurrentTime = lambda: api.currentTime(1700000000)
+    _fake_contract_details(api, "")
+
+    def reqHistoricalData(reqId, *args):
+        api.historicalData(reqId, _Bar("20240102", 1.0))
+        api.historicalData(reqId, _Bar("20240103", 2.0))
+        api.historicalDataEnd(reqId, "", "")
+    api.reqHistoricalData = reqHistoricalData
+
+    contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+    bars = api.get_historical_data(contract=contract, period="1d", duration="1 W")
+    assert bars.column("close").tolist() == [1.0, 2.0]
+    records = api.get_historical_data(contract=contract, period="1d", duration="1 W", as_records=True)
+    assert records[0] == {"date": "20240102", "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 100}
+    assert api.pendingRequests == {}
+
+
+def test_empty_historical_response_keeps_its_buffer():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1)
+    api.histBuffers[7] = BarBuffer(keepDates=True)
+    future = api._register_request(7)
+    api.historicalDataEnd(7, "", "")
+    bars = future.result(timeout=1)
+    assert len(bars) == 0 and bars.dates == []
+
+
+def test_request_timeout_raises():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=0.05)
+    api.reqCurrentTime = lambda: None
+    with pytest.raises(TimeoutError):
+        api.getCurrTime()
+    assert api.pendingRequests == {}
+
+
+def test_system_notices_do_not_fail_a_pending_time_request():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1)
+
+    def reqCurrentTime():
+        api.error(-1, 1100, "Connectivity between IB and Trader Workstation has been lost.")
+        api.currentTime(1700000000)
+    api.reqCurrentTime = reqCurrentTime
+    assert api.getCurrTime().startswith("20231114 ")
+
+
+def test_get_historical_data_many_keeps_buffers_per_req_id():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1)
+    api.reqCurrentTime = lambda: api.currentTime(1700000000)
+    _fake_contract_details(api, "")
+    sent = []
+    api.reqHistoricalData = lambda reqId, contract, *args: sent.append((reqId, contract))
+
+    aapl = api.create_contract("AAPL", "STK", "SMART", "USD")
+    msft = api.create_contract("MSFT", "STK", "SMART", "USD")
+    results = api.get_historical_data_many([(aapl, "1d", "1 W"), (msft, "1d", "1 W")], max_in_flight=2)
+    # Both requests go out before any response; answer them out of order and interleaved.
+    def respond():
+        while len(sent) < 2:
+            time.sleep(0.001)
+        (aaplId, _), (msftId, _) = sent
+        api.historicalData(msftId, _Bar("20240102", 20.0))
+        api.historicalData(aaplId, _Bar("20240102", 10.0))
+        api.historicalDataEnd(msftId, "", "")
+        api.historicalDataEnd(aaplId, "", "")
+    threading.Thread(target=respond, daemon=True).start()
+
+    closes = {job[0].symbol: bars.column("close").tolist() for job, bars, error in results}
+    assert closes == {"AAPL": [10.0], "MSFT": [20.0]}
+
+
+def test_get_historical_data_many_yields_while_pacing_holds_the_next_job():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1,
+                  pacing=PacingGovernor(contractMaxRequests=1, contractWindow=0.5))
+    api.reqCurrentTime = lambda: api.currentTime(1700000000)
+    _fake_contract_details(api, "")
+
+    def reqHistoricalData(reqId, *args):
+        api.historicalData(reqId, _Bar("20240102", 1.0))
+        api.historicalDataEnd(reqId, "", "")
+    api.reqHistoricalData = reqHistoricalData
+
+    aapl = api.create_contract("AAPL", "STK", "SMART", "USD")
+    start = time.monotonic()
+    results = api.get_historical_data_many([(aapl, "1d", "1 W"), (aapl, "1d", "2 W")], max_in_flight=2)
+    job, bars, error = next(results)
+    assert error is None and time.monotonic() - start < 0.3
+    assert [job[2] for job, _, _ in results] == ["2 W"]
+
+
+def test_shared_job_timeout_names_the_owning_request():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1)
+    api.reqCurrentTime = lambda: api.currentTime(1700000000)
+    _fake_contract_details(api, "")
+    api.reqHistoricalData = lambda *args: None
+    api.cancelHistoricalData = lambda reqId: None
+
+    aapl = api.create_contract("AAPL", "STK", "SMART", "USD")
+    endDateTime = api.getCurrTime()
+    ownerId, _ = api._send_historical_request(aapl, "1d", "1 W", endDateTime, 0)
+    [(job, bars, error)] = api.get_historical_data_many([(aapl, "1d", "1 W", endDateTime)], timeout=0.05)
+    assert isinstance(error, TimeoutError) and str(error).startswith(f"reqId {ownerId} ")
+
+
+def test_is_reg_trading_hour_caches_contract_details_per_week():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1)
+    api.getCurrTime = lambda: "20240102 13:30:00 US/Eastern"
+    _fake_contract_details(api, "20240102:0930-20240102:1600;20240103:0930-20240103:1600")
+    calls = []
+    reqContractDetails = api.reqContractDetails
+    api.reqContractDetails = lambda reqId, contract: calls.append(reqId) or reqContractDetails(reqId, contract)
+
+    contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+    assert api.isRegTradingHour(contract) == 1
+    assert api.isRegTradingHour(contract) == 1
+    assert len(calls) == 1
+
+
+def test_qualify_contracts_rejects_ambiguous_matches():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1)
+
+    def reqContractDetails(reqId, contract):
+        for conId in ([1, 2] if contract.symbol == "ES" else [3]):
+            details = ContractDetails()
+            details.contract.symbol, details.contract.conId = contract.symbol, conId
+            api.contractDetails(reqId, details)
+        api.contractDetailsEnd(reqId)
+    api.reqContractDetails = reqContractDetails
+
+    ambiguous = api.create_contract("ES", "FUT", "CME", "USD")
+    unique = api.create_contract("AAPL", "STK", "SMART", "USD")
+    assert api.qualify_contracts([ambiguous, unique]) == [unique]
+    assert (ambiguous.conId, unique.conId) == (0, 3)
+    assert api.get_contract_details(ambiguous).contract.conId == 1
+    # Looking up an ambiguous contract neither resolves nor records it
+    assert ambiguous.conId == 0 and ambiguous not in api.contracts
+    assert not api.contracts.resolve(ambiguous)
+
+
+def test_qualify_contracts_goes_on_after_a_timeout():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1)
+    slow = []
+
+    def reqContractDetails(reqId, contract):
+        if contract.symbol == "SLOW":
+            slow.append(reqId)
+            return
+        details = ContractDetails()
+        details.contract.symbol, details.contract.conId = contract.symbol, len(contract.symbol)
+        api.contractDetails(reqId, details)
+        api.contractDetailsEnd(reqId)
+    api.reqContractDetails = reqContractDetails
+
+    contracts = [api.create_contract(symbol, "STK", "SMART", "USD") for symbol in ("AAPL", "SLOW", "MSFTX")]
+    assert api.qualify_contracts(contracts, max_in_flight=1, timeout=0.05) == [contracts[0], contracts[2]]
+    # The response to the timed out request arrives late and is dropped
+    api.contractDetails(slow[0], ContractDetails())
+    assert api.conDetBuffers == {} and contracts[1].conId == 0
+
+
+def test_realtime_bar_subscription_feeds_ring_buffers():
+    api = IbkrApi(host='dummy', port=0, clientId=0)
+    api.reqRealTimeBars = lambda *args: None
+    contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+    reqId = api.subscribe_realtime_bars(contract)
+    # 2024-01-02 14:30:00 UTC is 09:30 US/Eastern
+    api.realtimeBar(reqId, 1704205800, 1.0, 2.0, 0.5, 1.5, 100, 1.2, 10)
+    bar = api.realtime.latestBar("AAPL-STK-SMART-USD")
+    assert bar.time % 86400 == 9 * 3600 + 30 * 60
+    assert api.realtime.partialBar("AAPL-STK-SMART-USD", "1d").close == 1.5
+
+
+def test_account_callbacks_update_store_without_printing(capsys):
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1)
+    contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+    contract.conId = 265598
+    api.updateAccountValue("TotalCashValue", "1000", "BASE", "DU1")
+    api.updatePortfolio(contract, 10, 190.0, 1900.0, 180.0, 100.0, 0.0, "DU1")
+    api.updateAccountTime("10:30")
+    api.accountDownloadEnd("DU1")
+
+    def reqAccountSummary(reqId, group, tags):
+        api.accountSummary(reqId, "DU1", "AvailableFunds", "750", "USD")
+        api.accountSummaryEnd(reqId)
+    api.reqAccountSummary = reqAccountSummary
+    api.cancelAccountSummary = lambda reqId: None
+
+    rows = api.getCashVal("AvailableFunds")
+    assert [(row.tag, row.value) for row in rows] == [("AvailableFunds", "750")]
+    assert api.accountStore.value("TotalCashValue") == 1000.0
+    assert api.accountStore.position(265598, "DU1").position == 10
+    assert api.accountStore.downloaded == {"DU1"}
+    assert capsys.readouterr().out == ""
+
+
+def test_place_brackets_uses_blocks_above_next_valid_id():
+    api = IbkrApi(host='dummy', port=0, clientId=0, timeout=1)
+    api.nextValidId(500)
+    assert api.get_order_id() == 500
+
+    def placeOrder(orderId, contract, order):
+        threading.Thread(target=api.orderStatus, args=(orderId, "Submitted", 0, 1, 0, 0, 0, 0, 0, "", 0)).start()
+    api.placeOrder = placeOrder
+
+    contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+    batches = api.place_brackets([(contract, "BUY", 1, 10.0, 11.0, 9.0)] * 2)
+    assert [order.orderId for orders in batches for order in orders] == list(range(501, 507))
+    assert batches[1][1].parentId == 504 and batches[1][2].transmit
+    assert api.wait_order_acks()
+    assert len(api.orderEngine.latencies()) == 6
+    assert api.get_order_id() == 507
@@ -0,0 +1,64 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import threading
+from benchmarks.fake_tws import FakeTws
+from benchmarks.polygon_stub import PolygonStub
+from ibkr_api import IbkrApi
+from instrumentation import Instrumentation, NULL_TIMER
+from polygon_api import PolygonApi
+
+
+def test_spans_histograms_and_prometheus_export():
+    now = [0.0]
+    instrumentation = Instrumentation(clock=lambda: now[0])
+    timer = instrumentation.start("reqHistoricalData")
+    now[0] = 0.2
+    timer.sent()
+    now[0] = 0.203
+    timer.firstByte()
+    now[0] = 0.21
+    timer.done(500)
+    timer.done(1)
+    instrumentation.start("reqHistoricalData").done(error=True)
+
+    stats = instrumentation.snapshot()["reqHistoricalData"]
+    assert stats["requests"] == 2 and stats["errors"] == 1
+    assert stats["queue"]["count"] == 1 and stats["queue"]["p50"] == 0.25
+    assert stats["firstByte"]["p99"] == 0.005
+    assert stats["total"]["count"] == 2
+    assert stats["size"]["count"] == 1 and stats["size"]["max"] == 500
+
+    text = instrumentation.prometheus()
+    assert 'api_request_errors_total{endpoint="reqHistoricalData"} 1' in text
+    assert 'api_request_duration_seconds_bucket{endpoint="reqHistoricalData",phase="queue",le="0.25"} 1' in text
+    assert 'api_request_payload_size_count{endpoint="reqHistoricalData"} 1' in text
+
+    assert Instrumentation(enabled=False).start("x") is NULL_TIMER
+
+
+def test_polygon_and_ibkr_requests_are_timed_per_endpoint():
+    instrumentation = Instrumentation()
+    with PolygonStub(page_size=1000, throttle_every=3) as stub:
+        with PolygonApi("key", base_url=stub.url, backoff_factor=0, instrumentation=instrumentation) as api:
+            api.get_historical_data("AAPL", 1, "minute", "2024-01-02", "2024-01-03")
+            api.get_last_trade("MSFT")
+    aggs = instrumentation.snapshot()["/v2/aggs"]
+    assert aggs["requests"] == 3 and aggs["errors"] == 0
+    assert aggs["firstByte"]["count"] == 3
+    assert instrumentation.snapshot()["/v2/last"]["requests"] == 1
+
+    with FakeTws(bars=3) as tws:
+        api = IbkrApi("127.0.0.1", tws.port, clientId=1, timeout=5, instrumentation=instrumentation)
+        api.connect()
+        threading.Thread(target=api.run, daemon=True).start()
+        try:
+            contract = api.create_contract("AAPL", "STK", "SMART", "USD")
+            api.get_historical_data(contract, "5m", "1 D")
+        finally:
+            api.disconnect()
+    snapshot = instrumentation.snapshot()
+    assert snapshot["reqHistoricalData"]["size"]["max"] == 3
+    assert snapshot["reqHistoricalData"]["transfer"]["count"] == 1
+    assert snapshot["reqContractDetails"]["requests"] == 1
+    assert snapshot["reqCurrentTime"]["requests"] == api.clock.samples
+    assert api.requestTimers == {}
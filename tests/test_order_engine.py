@@ -0,0 +1,38 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from types import SimpleNamespace
+from order_engine import Bracket, OrderEngine, OrderIdAllocator
+
+
+def test_allocator_blocks_stay_above_next_valid_id():
+    allocator = OrderIdAllocator()
+    assert allocator.reserve(3) == range(1, 4)
+    allocator.sync(100)
+    assert allocator.reserve(6) == range(100, 106)
+    allocator.sync(50)
+    assert allocator.reserve(1) == range(106, 107)
+
+
+def test_engine_places_batch_and_records_ack_latency():
+    now = [0.0]
+    sent = []
+
+    def build(parentId, *args):
+        return [SimpleNamespace(orderId=parentId + offset) for offset in range(3)]
+
+    def placeOrder(contract, order):
+        sent.append((contract, order.orderId))
+        now[0] += 1.0
+
+    engine = OrderEngine(OrderIdAllocator(10).reserve, placeOrder, build, clock=lambda: now[0])
+    batches = engine.placeBrackets([Bracket("AAPL", "BUY", 1, 10, 11, 9), ("MSFT", "SELL", 1, 20, 19, 21)])
+    assert [[order.orderId for order in orders] for orders in batches] == [[10, 11, 12], [13, 14, 15]]
+    assert [orderId for _, orderId in sent] == list(range(10, 16))
+
+    engine.onAck(10, "PendingSubmit")
+    assert not engine.acked([10])
+    for orderId in range(10, 16):
+        engine.onAck(orderId, "PreSubmitted")
+    assert engine.wait(timeout=0)
+    assert engine.latencies()[10] == 6.0 and engine.latencies()[15] == 1.0
+    assert engine.stats()["pending"] == 0
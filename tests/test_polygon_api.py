@@ -2,10 +2,98 @@ import os
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 import pytest
-from polygon_api import PolygonApi
+import polygon_api
+from polygon_api import PolygonApi, shard_date_range
 
 
 def test_init_raises_without_key(monkeypatch):
     monkeypatch.delenv("POLYGON_API_KEY", raising=False)
     with pytest.raises(ValueError):
         PolygonApi()
+
+
+def test_session_reuses_connection(server):
+    with PolygonApi(api_key="key", base_url=server.url) as api:
+        for _ in range(3):
+            assert api.get_market_status() == {"status": "OK"}
+        stats = api.connection_stats()
+    assert stats["requests"] == 3
+    assert stats["new_connections"] == 1
+    assert stats["reused_connections"] == 2
+
+
+def test_retries_honour_retry_after(server, monkeypatch):
+    slept = []
+    monkeypatch.setattr(polygon_api.time, "sleep", slept.append)
+    server.replies.extend([(429, {"Retry-After": "2"}, {}), (503, {}, {})])
+    with PolygonApi(api_key="key", base_url=server.url, backoff_factor=0.25) as api:
+        assert api.get_last_trade("AAPL") == {"status": "OK"}
+        assert api.connection_stats()["retries"] == 2
+    assert slept == [2.0, 0.5]
+
+
+def test_gives_up_after_max_retries(server, monkeypatch):
+    monkeypatch.setattr(polygon_api.time, "sleep", lambda sec: None)
+    server.replies.extend([(500, {}, {})] * 3)
+    with PolygonApi(api_key="key", base_url=server.url, max_retries=2) as api:
+        with pytest.raises(polygon_api.requests.HTTPError):
+            api.get_market_status()
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_historical_data_follows_next_url(server, prefetch):
+    server.replies.extend([
+        (200, {}, {"ticker": "AAPL", "results": [{"t": 1}, {"t": 2}],
+                   "next_url": f"{server.url}/v2/aggs/ticker/AAPL/range/1/minute/2024-01-01/2024-01-31?cursor=abc"}),
+        (200, {}, {"ticker": "AAPL", "results": [{"t": 3}]}),
+    ])
+    with PolygonApi(api_key="key", base_url=server.url) as api:
+        bars = list(api.iter_historical_data("AAPL", 1, "minute", "2024-01-01", "2024-01-31", prefetch=prefetch))
+    assert [bar["t"] for bar in bars] == [1, 2, 3]
+    assert "cursor=abc" in server.paths[1] and "apiKey=key" in server.paths[1]
+
+
+def test_get_historical_data_merges_pages(server):
+    server.replies.extend([
+        (200, {}, {"ticker": "AAPL", "results": [{"t": 1}], "next_url": f"{server.url}/v2/aggs/next?cursor=abc"}),
+        (200, {}, {"ticker": "AAPL", "results": [{"t": 2}]}),
+    ])
+    with PolygonApi(api_key="key", base_url=server.url) as api:
+        data = api.get_historical_data("AAPL", 1, "minute", "2024-01-01", "2024-01-31")
+    assert data["resultsCount"] == 2 and "next_url" not in data
+
+
+def test_shard_date_range_stays_under_limit():
+    shards = shard_date_range("2024-01-01", "2024-01-10", 1, "minute", limit=960 * 4)
+    assert shards == [("2024-01-01", "2024-01-04"), ("2024-01-05", "2024-01-08"), ("2024-01-09", "2024-01-10")]
+    assert shard_date_range("2024-01-01", "2024-12-31", 1, "day") == [("2024-01-01", "2024-12-31")]
+
+
+def test_sharded_fetch_stitches_and_deduplicates(server):
+    def route(path):
+        # every shard also returns the first bar of the next shard
+        day = int(path.split("/")[8].split("-")[2])
+        return 200, {}, {"results": [{"t": day}, {"t": day + 1}]}
+    server.route = route
+    with PolygonApi(api_key="key", base_url=server.url) as api:
+        data = api.get_historical_data_sharded("AAPL", 1, "day", "2024-01-01", "2024-01-06",
+                                               max_workers=3, limit=2)
+    assert [bar["t"] for bar in data["results"]] == [1, 2, 3, 4, 5, 6]
+    assert data["resultsCount"] == 6
+
+
+def test_bar_store_downloads_only_missing_days(server, tmp_path):
+    from bar_store import BarStore
+
+    def route(path):
+        # one daily bar per requested day, at midnight New York time (05:00 UTC in January)
+        first, last = (int(part[-2:]) for part in path.split("?")[0].split("/")[-2:])
+        return 200, {}, {"results": [{"t": (1704085200 + (day - 1) * 86400) * 1000,
+                                      "o": day, "h": day, "l": day, "c": day, "v": 1}
+                                     for day in range(first, last + 1)]}
+    server.route = route
+    with PolygonApi(api_key="key", base_url=server.url, bar_store=BarStore(str(tmp_path))) as api:
+        api.get_historical_data("AAPL", 1, "day", "2024-01-01", "2024-01-03")
+        data = api.get_historical_data("AAPL", 1, "day", "2024-01-02", "2024-01-05")
+    assert [bar["c"] for bar in data["results"]] == [2, 3, 4, 5]
+    assert server.paths[-1].split("?")[0].endswith("/2024-01-04/2024-01-05")
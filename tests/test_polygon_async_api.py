@@ -0,0 +1,45 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import asyncio
+import threading
+import time
+import pytest
+from polygon_async_api import AsyncPolygonApi, TokenBucket
+
+
+def test_gather_bounds_concurrency_and_returns_per_ticker(server):
+    active = [0, 0]   # current, peak
+    lock = threading.Lock()
+
+    def route(path):
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        ticker = path.split("?")[0].rsplit("/", 1)[1]
+        if ticker == "BAD":
+            return 404, {}, {"status": "NOT_FOUND"}
+        return 200, {}, {"results": {"T": ticker}}
+    server.route = route
+
+    async def main():
+        async with AsyncPolygonApi(api_key="key", base_url=server.url, max_concurrency=3) as api:
+            return await api.gather(api.get_last_trade, ["A", "B", "C", "D", "E", "F", "BAD"])
+
+    results = asyncio.run(main())
+    assert results["F"] == {"results": {"T": "F"}}
+    assert isinstance(results["BAD"], Exception)
+    assert active[1] <= 3
+
+
+def test_token_bucket_limits_rate():
+    async def main():
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(6)))
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) >= 5 / 50 * 0.9
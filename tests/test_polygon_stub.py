@@ -0,0 +1,25 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from benchmarks.polygon_stub import PolygonStub
+from polygon_api import PolygonApi
+
+
+def test_paginates_and_retries_injected_429_on_one_connection():
+    with PolygonStub(page_size=1000, throttle_every=3) as stub:
+        with PolygonApi("key", base_url=stub.url, backoff_factor=0) as api:
+            data = api.get_historical_data("AAPL", 1, "minute", "2024-01-02", "2024-01-03")
+            assert data["resultsCount"] == 2 * 1440
+            assert len({bar["t"] for bar in data["results"]}) == 2 * 1440
+            stats = stub.stats()
+            assert stats["throttled"] == 1 and stats["requests"] == 4
+            assert stats["connections"] == 1
+            assert api.connection_stats()["retries"] == 1
+
+
+def test_last_trade_and_market_status():
+    with PolygonStub(bar_padding=16) as stub:
+        with PolygonApi("key", base_url=stub.url) as api:
+            assert api.get_last_trade("MSFT")["results"]["T"] == "MSFT"
+            assert api.get_market_status()["market"] == "open"
+            bar = api.get_historical_data("AAPL", 1, "day", "2024-01-02", "2024-01-02")["results"][0]
+            assert bar["pad"] == "x" * 16
@@ -0,0 +1,81 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from bar_buffer import parseBarDate
+from trading_hours import CLOSED, EMPTY_CALENDAR_TTL, PRE_MARKET, RTH, SESSION_LABELS, SessionTagger, TradingHoursCalendar
+
+TRADING_HOURS = ("20240105:0930-20240105:1600;20240106:CLOSED;20240107:CLOSED;"
+                 "20240108:0930-20240108:1600;20240109:0930-20240109:1600")
+
+
+def test_is_open_and_bulk_query():
+    calendar = TradingHoursCalendar(TRADING_HOURS)
+    times = [datetime.datetime(2024, 1, 5, 9, 29), datetime.datetime(2024, 1, 5, 9, 30),
+             datetime.datetime(2024, 1, 5, 15, 59), datetime.datetime(2024, 1, 6, 12, 0),
+             datetime.datetime(2024, 1, 8, 12, 0)]
+    assert calendar.isOpenMany(times) == [False, True, True, False, True]
+    assert calendar.isOpen(times[1])
+
+
+def test_closing_bar_is_closed_for_calendar_and_tagger():
+    closing = datetime.datetime(2024, 1, 5, 16, 0)
+    calendar = TradingHoursCalendar(TRADING_HOURS)
+    assert not calendar.isOpen(closing) and calendar.isOpenMany([closing]) == [False]
+    tagger = SessionTagger(TRADING_HOURS)
+    assert tagger.tag(np.array([closing], dtype="datetime64[m]")).tolist() == [CLOSED]
+
+
+def test_stale_after_week_rolls_over():
+    calendar = TradingHoursCalendar(TRADING_HOURS)
+    assert not calendar.isStale(datetime.datetime(2024, 1, 7, 23, 59))
+    assert calendar.isStale(datetime.datetime(2024, 1, 8, 0, 0))
+
+
+def test_empty_calendar_cached_until_ttl():
+    now = [100.0]
+    calendar = TradingHoursCalendar("", monotonic=lambda: now[0])
+    assert not calendar.isOpen(datetime.datetime(2024, 1, 8, 12, 0))
+    assert not calendar.isStale(datetime.datetime(2024, 1, 8, 12, 0))
+    now[0] += EMPTY_CALENDAR_TTL
+    assert calendar.isStale(datetime.datetime(2024, 1, 8, 12, 0))
+
+
+def test_legacy_same_day_ranges():
+    calendar = TradingHoursCalendar("20090507:0700-1830,1830-2330;20090508:CLOSED")
+    assert calendar.isOpen(datetime.datetime(2009, 5, 7, 20, 0))
+    assert not calendar.isOpen(datetime.datetime(2009, 5, 7, 23, 45))
+
+
+EXTENDED_HOURS = "20240105:0400-20240105:2000;20240106:CLOSED;20240107:CLOSED;20240108:0400-20240108:2000"
+
+
+def test_session_tagger_tags_extended_hours_bars():
+    tagger = SessionTagger(EXTENDED_HOURS, TRADING_HOURS)
+    times = np.array(["2024-01-05T03:59", "2024-01-05T04:00", "2024-01-05T09:30", "2024-01-05T16:00",
+                      "2024-01-05T20:00", "2024-01-06T12:00",
+                      "2023-06-09T08:00", "2023-06-09T15:59"], dtype="datetime64[m]")
+    assert SESSION_LABELS[tagger.tag(times)].tolist() == ["closed", "pre", "rth", "post", "closed", "closed",
+                                                          "pre", "rth"]
+    assert tagger.rthMask([parseBarDate("20240108 09:29:00"), parseBarDate("20240108 09:30:00")]).tolist() == [False, True]
+
+
+def test_session_tagger_holiday_week_only_applies_to_its_dates():
+    # Thanksgiving week: Thursday closed, Friday a half-day
+    days = ["20241125", "20241126", "20241127"]
+    extended = ";".join(f"{day}:0400-{day}:2000" for day in days) + ";20241128:CLOSED;20241129:0400-20241129:1700"
+    regular = ";".join(f"{day}:0930-{day}:1600" for day in days) + ";20241128:CLOSED;20241129:0930-20241129:1300"
+    tagger = SessionTagger(extended, regular)
+    times = np.array(["2024-11-14T10:00", "2024-11-15T14:00", "2024-11-15T17:30",
+                      "2024-11-28T10:00", "2024-11-29T14:00", "2024-11-29T17:30"], dtype="datetime64[m]")
+    assert SESSION_LABELS[tagger.tag(times)].tolist() == ["rth", "rth", "post", "closed", "post", "closed"]
+
+
+def test_session_tagger_epoch_and_aware_inputs():
+    tagger = SessionTagger(EXTENDED_HOURS, TRADING_HOURS)
+    # 2024-01-05 14:30 UTC is 09:30 US/Eastern
+    assert tagger.tagEpoch([1704465000000, 1704464940000], unit="ms").tolist() == [RTH, PRE_MARKET]
+    aware = pd.Series(pd.to_datetime(["2024-01-05 14:30", "2024-01-05 21:00"]).tz_localize("UTC"))
+    assert SESSION_LABELS[tagger.tag(aware)].tolist() == ["rth", "post"]
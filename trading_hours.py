@@ -0,0 +1,319 @@
+"""
+Trading hours calendar
+
+Pre-parsed, per-contract session calendar built from the ``tradingHours`` /
+``liquidHours`` string of IB contract details, e.g.
+"20240102:0930-20240102:1600;20240103:0930-20240103:1600;20240106:CLOSED"
+
+The legacy format with same-day ranges is also understood:
+"20090507:0700-1830,1830-2330;20090508:CLOSED"
+
+SessionTagger turns both strings into int64 interval arrays and classifies
+whole bar arrays as pre-market / RTH / post-market / closed with searchsorted.
+"""
+
+from bisect import bisect_right
+from collections import Counter
+from zoneinfo import ZoneInfo
+import datetime
+import time as systime
+
+import numpy as np
+import pandas as pd
+
+from bar_buffer import BarBuffer, parseBarDate
+
+# Session tags of SessionTagger, SESSION_LABELS[tags] gives their names
+CLOSED, PRE_MARKET, RTH, POST_MARKET = 0, 1, 2, 3
+SESSION_LABELS = np.array(["closed", "pre", "rth", "post"])
+
+DEFAULT_TIME_ZONE = "US/Eastern"
+
+# Seconds an empty tradingHours string is trusted before contract details are requested again
+EMPTY_CALENDAR_TTL = 3600.0
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_DAY = 86400
+# Session that never contains a timestamp, keeps the index arithmetic free of bounds checks
+_SENTINEL = np.iinfo(np.int64).max
+
+
+def _parseDate(text: str) -> datetime.datetime:
+    return datetime.datetime(int(text[0:4]), int(text[4:6]), int(text[6:8]))
+
+
+def _parseDateTime(text: str) -> datetime.datetime:
+    # "%Y%m%d:%H%M" without the cost of strptime
+    return datetime.datetime(int(text[0:4]), int(text[4:6]), int(text[6:8]),
+                             int(text[9:11]), int(text[11:13]))
+
+
+def parseTradingHours(tradingHours: str):
+    """
+    Parse a tradingHours string into sorted (start, end) datetime pairs and the
+    list of calendar days the string describes.
+    """
+    sessions = []
+    days = []
+    for entry in tradingHours.split(';'):
+        entry = entry.strip()
+        if not entry:
+            continue
+        days.append(_parseDate(entry))
+        if "CLOSED" in entry:
+            continue
+        endPart = entry.split('-', 1)[1]
+        if len(endPart) >= 13 and endPart[8] == ':':
+            # "%Y%m%d:%H%M-%Y%m%d:%H%M"
+            for tradingRange in entry.split(','):
+                startTime, endTime = tradingRange.split('-')
+                sessions.append((_parseDateTime(startTime), _parseDateTime(endTime)))
+        else:
+            # "%Y%m%d:%H%M-%H%M,%H%M-%H%M"
+            day = days[-1]
+            for tradingRange in entry[9:].split(','):
+                startTime, endTime = tradingRange.split('-')
+                start = day.replace(hour=int(startTime[:2]), minute=int(startTime[2:]))
+                end = day.replace(hour=int(endTime[:2]), minute=int(endTime[2:]))
+                if end < start:
+                    end += datetime.timedelta(days=1)
+                sessions.append((start, end))
+    sessions.sort()
+    days.sort()
+    return sessions, days
+
+
+def contractKey(contract):
+    """
+    Cache key of a contract: its conId once resolved, otherwise its description.
+    """
+    conId = getattr(contract, "conId", 0)
+    if conId:
+        return conId
+    return (contract.symbol, contract.secType, contract.exchange, contract.currency)
+
+
+def weekdayHours(firstDay: datetime.date, lastDay: datetime.date, hours=("0930", "1600")) -> str:
+    """
+    tradingHours string with one hours=(open, close) session per weekday from
+    firstDay to lastDay, weekends CLOSED
+    """
+    entries = []
+    day = firstDay
+    while day <= lastDay:
+        stamp = day.strftime("%Y%m%d")
+        entries.append(f"{stamp}:{hours[0]}-{stamp}:{hours[1]}" if day.weekday() < 5 else f"{stamp}:CLOSED")
+        day += datetime.timedelta(days=1)
+    return ";".join(entries)
+
+
+class TradingHoursCalendar:
+    """
+    Session calendar for one contract, parsed once into sorted start/end arrays.
+    Timestamps are naive datetimes in the contract's exchange time zone, the same
+    convention as the tradingHours string itself. A session is open from its start
+    up to but excluding its end, as in SessionTagger, so the 16:00 bar is closed.
+
+    An empty tradingHours string (never open) stays fresh for EMPTY_CALENDAR_TTL
+    seconds of the local monotonic clock.
+    """
+
+    def __init__(self, tradingHours: str, monotonic=systime.monotonic):
+        self.monotonic = monotonic
+        self.fetchedAt = monotonic()
+        sessions, days = parseTradingHours(tradingHours)
+        self.starts = [start for start, _ in sessions]
+        self.ends = [end for _, end in sessions]
+
+        if days:
+            # The string covers roughly one week ahead; refresh when either its last
+            # day has passed or the week it was fetched in rolls over.
+            firstDay = days[0]
+            nextWeek = firstDay + datetime.timedelta(days=7 - firstDay.weekday())
+            self.validFrom = firstDay
+            self.validUntil = min(days[-1] + datetime.timedelta(days=1), nextWeek)
+        else:
+            self.validFrom = self.validUntil = None
+
+    def isStale(self, when: datetime.datetime) -> bool:
+        """
+        True if when falls outside the period this calendar was fetched for.
+        """
+        if self.validUntil is None:
+            return self.monotonic() - self.fetchedAt >= EMPTY_CALENDAR_TTL
+        return not self.validFrom <= when < self.validUntil
+
+    def isOpen(self, when: datetime.datetime) -> bool:
+        """
+        Binary search for the last session starting at or before when.
+        """
+        index = bisect_right(self.starts, when) - 1
+        return index >= 0 and when < self.ends[index]
+
+    def isOpenMany(self, timestamps) -> list:
+        """
+        Bulk variant of isOpen() for an iterable of datetimes.
+        """
+        starts, ends = self.starts, self.ends
+        result = []
+        for when in timestamps:
+            index = bisect_right(starts, when) - 1
+            result.append(index >= 0 and when < ends[index])
+        return result
+
+
+def _seconds(when: datetime.datetime) -> int:
+    return int((when - _EPOCH).total_seconds())
+
+
+def _weekdayTemplate(sessions) -> dict:
+    """
+    weekday -> [(start, end) seconds from midnight] of a full-length day of that
+    weekday. Monday to Friday without one (a holiday or half-day in the strings)
+    get the most common day instead, weekend days only their own sessions.
+    """
+    byDay = {}
+    for start, end in sessions:
+        day = start.replace(hour=0, minute=0, second=0)
+        byDay.setdefault(day, []).append((_seconds(start) - _seconds(day), _seconds(end) - _seconds(day)))
+    if not byDay:
+        return {}
+
+    def length(offsets):
+        return sum(end - start for start, end in offsets)
+
+    patterns = Counter(tuple(offsets) for offsets in byDay.values())
+    usual = max(patterns, key=lambda pattern: (patterns[pattern], length(pattern)))
+    template = {}
+    for day, offsets in sorted(byDay.items()):
+        if day.weekday() >= 5 or length(offsets) >= length(usual):
+            template[day.weekday()] = offsets
+    for weekday in range(5):
+        template.setdefault(weekday, list(usual))
+    return template
+
+
+class SessionTagger:
+    """
+    Vectorized session classification of bar timestamps.
+
+    tradingHours holds the full (extended) sessions and liquidHours the regular
+    ones, both as in IB contract details, in the timeZoneId time zone. A bar is
+    RTH inside a liquid session, PRE_MARKET / POST_MARKET in the trading session
+    before / after it, CLOSED otherwise. Without liquidHours every trading
+    session counts as RTH.
+
+    The strings cover about one week. Other days, history in particular, get
+    the full-length sessions of the same weekday in the strings, a holiday or
+    half-day there only applies to its own date. Holidays outside the strings
+    are not known, but carry no bars either. The interval arrays are built once
+    per covered day range and widened when later timestamps fall outside it.
+    """
+
+    def __init__(self, tradingHours: str, liquidHours: str = None, timeZoneId: str = DEFAULT_TIME_ZONE):
+        self.tz = ZoneInfo(timeZoneId)
+        trading, days = parseTradingHours(tradingHours)
+        liquid = parseTradingHours(liquidHours)[0] if liquidHours else trading
+        self.days = np.array(sorted({_seconds(day) for day in days}), dtype=np.int64)
+        self.trading = np.array([(_seconds(start), _seconds(end)) for start, end in trading], dtype=np.int64).reshape(-1, 2)
+        self.liquid = np.array([(_seconds(start), _seconds(end)) for start, end in liquid], dtype=np.int64).reshape(-1, 2)
+        self.tradingTemplate = _weekdayTemplate(trading)
+        self.liquidTemplate = _weekdayTemplate(liquid)
+        self.bounds = None      # (first day, last day, trading starts, ends, liquid starts, ends)
+
+    @classmethod
+    def fromContractDetails(cls, contractDetails) -> "SessionTagger":
+        """
+        Tagger of an ibapi or ib_insync ContractDetails
+        """
+        return cls(contractDetails.tradingHours, contractDetails.liquidHours or None,
+                   contractDetails.timeZoneId or DEFAULT_TIME_ZONE)
+
+    @classmethod
+    def weekdays(cls, firstDay: datetime.date, lastDay: datetime.date, regular=("0930", "1600"),
+                 extended=("0400", "2000"), timeZoneId: str = DEFAULT_TIME_ZONE) -> "SessionTagger":
+        """
+        Monday to Friday sessions (US equity hours by default) from firstDay to
+        lastDay, for data without contract details such as Polygon aggregates
+        """
+        return cls(weekdayHours(firstDay, lastDay, extended), weekdayHours(firstDay, lastDay, regular), timeZoneId)
+
+    def _intervals(self, explicit, template, days) -> tuple:
+        parts = [explicit]
+        weekdays = (days // _DAY + 3) % 7     # 1970-01-01 was a Thursday
+        for weekday, offsets in template.items():
+            selected = days[weekdays == weekday]
+            if selected.size:
+                parts.append((selected[:, None, None] + np.array(offsets, dtype=np.int64)[None]).reshape(-1, 2))
+        parts.append(np.array([[_SENTINEL, _SENTINEL]], dtype=np.int64))
+        sessions = np.concatenate(parts)
+        sessions = sessions[np.argsort(sessions[:, 0], kind="stable")]
+        return sessions[:, 0], sessions[:, 1]
+
+    def _boundsFor(self, first: int, last: int) -> tuple:
+        # One day of margin for sessions starting the evening before
+        first, last = (first // _DAY - 1) * _DAY, (last // _DAY) * _DAY
+        bounds = self.bounds
+        if bounds is not None and bounds[0] <= first and last <= bounds[1]:
+            return bounds
+        if bounds is not None:
+            first, last = min(first, bounds[0]), max(last, bounds[1])
+        days = np.arange(first, last + _DAY, _DAY, dtype=np.int64)
+        days = days[~np.isin(days, self.days)]
+        bounds = (first, last) + self._intervals(self.trading, self.tradingTemplate, days) \
+            + self._intervals(self.liquid, self.liquidTemplate, days)
+        self.bounds = bounds
+        return bounds
+
+    def _wallSeconds(self, times) -> np.ndarray:
+        if isinstance(times, BarBuffer):
+            return times.time
+        if isinstance(times, (pd.Series, pd.Index)) and isinstance(times.dtype, pd.DatetimeTZDtype):
+            times = pd.DatetimeIndex(times).tz_convert(self.tz).tz_localize(None)
+        array = np.asarray(times)
+        if array.dtype.kind == "M":
+            return array.astype("datetime64[s]").astype(np.int64)
+        if array.dtype == object:
+            return np.fromiter((parseBarDate(when) for when in array.ravel()), dtype=np.int64, count=array.size)
+        return array.astype(np.int64, copy=False)
+
+    def tag(self, times) -> np.ndarray:
+        """
+        int8 session tag per timestamp. times are wall-clock seconds in the
+        calendar time zone (BarBuffer.time, bar_buffer.parseBarDate), naive
+        datetime64 / datetime values in that zone, or tz-aware pandas datetimes.
+        """
+        wall = self._wallSeconds(times)
+        if wall.size == 0:
+            return np.zeros(wall.shape, dtype=np.int8)
+        _, _, tradingStarts, tradingEnds, liquidStarts, liquidEnds = self._boundsFor(int(wall.min()), int(wall.max()))
+
+        tradingIndex = np.searchsorted(tradingStarts, wall, side="right") - 1
+        liquidIndex = np.searchsorted(liquidStarts, wall, side="right") - 1
+        sessionEnd = tradingEnds[np.maximum(tradingIndex, 0)]
+        inTrading = (tradingIndex >= 0) & (wall < sessionEnd)
+        inLiquid = (liquidIndex >= 0) & (wall < liquidEnds[np.maximum(liquidIndex, 0)])
+        # Before a liquid session that starts within the same trading session
+        beforeLiquid = liquidStarts[liquidIndex + 1] < sessionEnd
+
+        tags = np.full(wall.shape, CLOSED, dtype=np.int8)
+        tags[inTrading] = POST_MARKET
+        tags[inTrading & beforeLiquid] = PRE_MARKET
+        tags[inLiquid] = RTH
+        return tags
+
+    def tagEpoch(self, times, unit: str = "s") -> np.ndarray:
+        """
+        tag() of UTC epoch timestamps in unit ("s" or "ms"), e.g. Polygon "t"
+        values or a Polygon bar store BarBuffer
+        """
+        if isinstance(times, BarBuffer):
+            times = times.time
+        wall = pd.to_datetime(np.asarray(times, dtype=np.int64), unit=unit, utc=True).tz_convert(self.tz).tz_localize(None)
+        return self.tag(wall)
+
+    def rthMask(self, times) -> np.ndarray:
+        """
+        Boolean mask of the RTH bars among times (as for tag())
+        """
+        return self.tag(times) == RTH